@@ -0,0 +1,105 @@
+# checks the compiled response tables against the formula the mouse used before them, non-linear curves and deadzones
+# against a direct per-event calculation, and that invalid curve settings are rejected
+# usage: python benchmarks/curves.py [samples] (exits non-zero on failure)
+from pathlib import Path
+import math
+import random
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import ConfigError
+from modules.curves import ResponseTables, curve_function
+from modules.module_mouse import DEFAULT_OPTIONS
+
+# the tables are sampled, so a lookup may differ from the exact formula by a fraction of a pixel per tick
+TOLERANCE = 0.01
+
+
+def direct_gain(options: dict, x: float, y: float, multiplier: float) -> float:
+    # the per-tick calculation the linear default has to reproduce
+    speed = math.hypot(x, y)
+    return 1.0 + (speed * (options["acceleration"] - 1.0)) * options["sensitivity"] * multiplier
+
+
+def stick(options: dict) -> float:
+    if random.random() < 0.1:
+        return 0.0
+    return random.choice((-1, 1)) * random.uniform(options["deadzone"], 1.0)
+
+
+def check_tables(samples: int) -> bool:
+    ok = True
+    random.seed(4)
+    for acceleration, sensitivity, scroll in ((5.0, 1.0, 1.0), (1.0, 1.0, 0.5), (8.0, 2.5, 2.0)):
+        options = {**DEFAULT_OPTIONS, "acceleration": acceleration, "sensitivity": sensitivity, "scroll-sensitivity": scroll}
+        tables = ResponseTables(options)
+        worst_move = worst_scroll = 0.0
+        for _ in range(samples):
+            # each axis is either zero or outside the deadzone, as Mouse._handle_axis leaves it
+            x, y, multiplier = stick(options), stick(options), random.uniform(0, 2)
+            gain = tables.movement_gain(x, y, multiplier)
+            expected = direct_gain(options, x, y, multiplier)
+            worst_move = max(worst_move, abs(x * gain - x * expected), abs(y * gain - y * expected))
+            worst_scroll = max(worst_scroll, abs(tables.scroll_speed(x) - x * scroll))
+        passed = worst_move < TOLERANCE and worst_scroll < TOLERANCE
+        ok &= passed
+        print(f"acceleration {acceleration} sensitivity {sensitivity}: max error {worst_move:.5f}px move, "
+              f"{worst_scroll:.5f} scroll {'ok' if passed else 'FAILED'}")
+    return ok
+
+
+def shaped_distance(options: dict, x: float, y: float, multiplier: float) -> float:
+    # how far the pointer moves per tick, worked out per event the way the tables precompute it
+    radius = math.hypot(x, y)
+    inner, outer = options["radial-deadzone"], options["outer-deadzone"]
+    n = max(min(radius, outer) if outer else radius, inner) - inner
+    n /= (outer or 1.0) - inner
+    value = curve_function(options["response-curve"])(min(n, 1.0)) * max(n, 1.0)
+    return value * (1.0 + value * (options["acceleration"] - 1.0) * options["sensitivity"] * multiplier)
+
+
+def check_shapes(samples: int) -> bool:
+    ok = True
+    random.seed(15)
+    for curve, inner, outer in (({"type": "exponent", "exponent": 2.0}, 0.0, None),
+                                ({"type": "exponent", "exponent": 1.5}, 0.2, 0.9),
+                                ({"type": "bezier", "points": (0.4, 0.0, 0.6, 1.0)}, 0.1, None)):
+        options = {**DEFAULT_OPTIONS, "response-curve": curve, "radial-deadzone": inner, "outer-deadzone": outer}
+        tables = ResponseTables(options)
+        worst = 0.0
+        for _ in range(samples):
+            x, y, multiplier = random.uniform(-1, 1), random.uniform(-1, 1), random.uniform(0, 2)
+            moved = math.hypot(x, y) * tables.movement_gain(x, y, multiplier)
+            worst = max(worst, abs(moved - shaped_distance(options, x, y, multiplier)))
+        passed = worst < TOLERANCE
+        ok &= passed
+        print(f"{curve['type']} {curve.get('exponent', curve.get('points'))} deadzone {inner}-{outer or 1.0}: "
+              f"max error {worst:.5f}px move {'ok' if passed else 'FAILED'}")
+    return ok
+
+
+def check_rejected() -> bool:
+    ok = True
+    for invalid in ({"curve-resolution": 1}, {"curve-resolution": 0}, {"radial-deadzone": 0.5, "outer-deadzone": 0.5},
+                    {"radial-deadzone": 0.6, "outer-deadzone": 0.4}, {"radial-deadzone": 1.0}):
+        try:
+            ResponseTables({**DEFAULT_OPTIONS, **invalid})
+            print(f"{invalid}: accepted FAILED")
+            ok = False
+        except ConfigError as e:
+            print(f"{invalid}: rejected ({e})")
+    return ok
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    ok = check_tables(samples)
+    ok &= check_shapes(samples)
+    ok &= check_rejected()
+    print("ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# per-event cost of Core.callback routing: set-based baseline vs compiled Dispatcher
+# usage: python benchmarks/dispatch.py [events]
+from pathlib import Path
+from timeit import timeit
+import random
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dispatch import Dispatcher
+from pyjoystick.sdl2 import Key
+
+
+CONFIG = {"ignore-multiple-buttons": True, "switch-shortcut": [4, 5, 8, 9]}
+
+
+class LegacyCallback:
+    def __init__(self, handler):
+        self.config = CONFIG
+        self.pressed_buttons = set()
+        self.handler = handler
+
+    def __call__(self, key: Key):
+        if key.keytype == Key.KeyTypes.BUTTON:
+            self.pressed_buttons.add(key.number) if key.value else self.pressed_buttons.discard(key.number)
+
+        if set(self.config["switch-shortcut"]).issubset(self.pressed_buttons):
+            self.pressed_buttons.clear()
+            return
+
+        if key.keytype == Key.KeyTypes.BUTTON and len(self.pressed_buttons) > 1 and self.config["ignore-multiple-buttons"]:
+            return
+
+        self.handler(key)
+
+
+def make_events(count: int) -> list:
+    rng = random.Random(0)
+    events = []
+    while len(events) < count:
+        if rng.random() < 0.7:
+            events.append(Key(Key.KeyTypes.AXIS, rng.randrange(6), rng.uniform(-1, 1)))
+        else:
+            button = rng.randrange(10)
+            events += [Key(Key.KeyTypes.BUTTON, button, 1), Key(Key.KeyTypes.BUTTON, button, 0)]
+    return events[:count]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    events = make_events(count)
+    handler = lambda _: None
+
+    legacy = LegacyCallback(handler)
+    dispatcher = Dispatcher(CONFIG["switch-shortcut"], CONFIG["ignore-multiple-buttons"], lambda: None, lambda *_, **__: None)
+    dispatcher.bind(handler)
+
+    for name, callback in (("before (set)", legacy), ("after (bitmask)", dispatcher.dispatch)):
+        elapsed = min(timeit(lambda: [callback(key) for key in events], number=1) for _ in range(5))
+        print(f"{name:>16}: {elapsed / count * 1e9:7.1f} ns/event")
+
+
+if __name__ == "__main__":
+    main()
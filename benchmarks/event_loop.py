@@ -0,0 +1,109 @@
+# idle wakeups and event-to-dispatch latency: pyjoystick's run_event_loop (before) vs Core's EventLoop (after)
+# usage: python benchmarks/event_loop.py [events] [idle-seconds]
+#   drives an SDL virtual joystick (SDL 2.0.14+, runs headless) from the main thread while the loop runs on another
+from pathlib import Path
+from threading import Thread, Event
+from time import perf_counter_ns, process_time, sleep
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core import Core
+from events import EventLoop
+from pyjoystick.sdl2 import run_event_loop
+import sdl2
+
+
+class Probe:
+    # stamps the moment each axis value is set and the moment Core.callback receives it
+    def __init__(self, core: Core):
+        self.core = core
+        self.sent = {}
+        self.latencies = []
+        self.registered = Event()
+        self.running = True
+        self.checks = 0
+
+    def register(self, device_index: int):
+        self.core.register(device_index)
+        self.registered.set()
+
+    def callback(self, key):
+        received = perf_counter_ns()
+        if (sent := self.sent.pop(round(key.value * 1000), None)) is not None:
+            self.latencies.append(received - sent)
+        self.core.callback(key)
+
+    def alive(self) -> bool:
+        # pyjoystick checks this once per return from its wait
+        self.checks += 1
+        return self.running
+
+    def report(self, name: str, wakeups: int, idle: float, cpu: float, events: int):
+        latencies = sorted(self.latencies)
+        percentile = lambda fraction: latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] / 1000
+        print(f"{name}: {wakeups / idle:.2f} wakeups/s and {cpu / idle * 100:.2f}% cpu while idle, "
+              f"latency p50 {percentile(0.5):.0f}us p99 {percentile(0.99):.0f}us ({len(latencies)}/{events} events)")
+
+
+def drive(probe: Probe, events: int, idle: float, wakeups):
+    index = sdl2.SDL_JoystickAttachVirtual(sdl2.SDL_JOYSTICK_TYPE_GAMECONTROLLER, 6, 11, 1)
+    probe.registered.wait(5)
+    device = sdl2.SDL_JoystickFromInstanceID(sdl2.SDL_JoystickGetDeviceInstanceID(index))
+    # opening the device queues its initial axis state, let that drain before measuring idle
+    sleep(0.5)
+
+    started, cpu = wakeups(), process_time()
+    sleep(idle)
+    idle_wakeups, idle_cpu = wakeups() - started, process_time() - cpu
+
+    for step in range(events):
+        # each value is distinct so the receiver can match it to its send time
+        value = (step % 900 + 50) * (1 if step % 2 else -1)
+        probe.sent[value] = perf_counter_ns()
+        sdl2.SDL_JoystickSetVirtualAxis(device, 0, int(value / 1000 * 32767.5))
+        sleep(0.002)
+    sleep(0.1)
+    sdl2.SDL_JoystickDetachVirtual(index)
+    return idle_wakeups, idle_cpu
+
+
+def run_before(events: int, idle: float):
+    probe = Probe(make_core())
+    thread = Thread(target=run_event_loop, args=(lambda joystick: probe.register(joystick.identifier), lambda joystick: probe.core.unregister(joystick.identifier), probe.callback, probe.alive), daemon=True)
+    thread.start()
+    wakeups, cpu = drive(probe, events, idle, lambda: probe.checks)
+    probe.running = False
+    run_event_loop.stop_event_wait()
+    thread.join(3)
+    probe.report("before", wakeups, idle, cpu, events)
+
+
+def run_after(events: int, idle: float):
+    probe = Probe(make_core())
+    loop = EventLoop(probe.register, probe.core.unregister, probe.callback)
+    thread = Thread(target=loop.run, daemon=True)
+    thread.start()
+    wakeups, cpu = drive(probe, events, idle, lambda: loop.wakeups)
+    loop.stop()
+    thread.join(3)
+    probe.report(" after", wakeups, idle, cpu, events)
+
+
+def make_core() -> Core:
+    core = Core()
+    core.logs.configure({"level": "warning"})
+    return core
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    idle = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    sdl2.SDL_SetHint(sdl2.SDL_HINT_JOYSTICK_ALLOW_BACKGROUND_EVENTS, b"1")
+    run_before(events, idle)
+    sdl2.SDL_QuitSubSystem(sdl2.SDL_INIT_JOYSTICK | sdl2.SDL_INIT_GAMECONTROLLER | sdl2.SDL_INIT_HAPTIC)
+    run_after(events, idle)
+
+
+if __name__ == "__main__":
+    main()
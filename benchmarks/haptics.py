@@ -0,0 +1,80 @@
+# thread count and pre-emption under rapid module cycling: thread-per-vibrate (before) vs one HapticWorker per device (after)
+# usage: python benchmarks/haptics.py [switches] [devices]
+from pathlib import Path
+from threading import Thread, active_count, Lock
+from time import perf_counter, sleep
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from haptics import HapticWorker, module_pattern
+
+
+class RecordingHaptic:
+    # stands in for SDL_HapticRumblePlay/Stop and counts how many callers overlap on one handle
+    def __init__(self):
+        self.pulses = 0
+        self.stops = 0
+        self.overlaps = 0
+        self._busy = False
+        self._lock = Lock()
+
+    def play(self, _, strength: float, duration: int):
+        with self._lock:
+            if self._busy:
+                self.overlaps += 1
+            self._busy = True
+        sleep(0.0001)
+        self.pulses += 1
+        self._busy = False
+
+    def stop(self, _):
+        self.stops += 1
+
+
+def legacy_vibrate(haptic: RecordingHaptic, strength: float, duration: int, count: int, delay: float):
+    def _vibrate():
+        for _ in range(count):
+            sleep(delay)
+            haptic.play(None, strength, duration)
+    Thread(target=_vibrate, daemon=True).start()
+
+
+def main():
+    switches = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    devices = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    baseline = active_count()
+
+    haptics = [RecordingHaptic() for _ in range(devices)]
+    peak = 0
+    for switch in range(switches):
+        for haptic in haptics:
+            legacy_vibrate(haptic, 0.9, 100, switch % 4 + 1, 0.25)
+        peak = max(peak, active_count() - baseline)
+        sleep(0.002)
+    sleep(1.5)
+    print(f"before: peak {peak} extra threads, {sum(h.pulses for h in haptics)} pulses, {sum(h.overlaps for h in haptics)} overlapping calls")
+
+    haptics = [RecordingHaptic() for _ in range(devices)]
+    workers = [HapticWorker(None, f"device-{index}", haptic.play, haptic.stop) for index, haptic in enumerate(haptics)]
+    started_threads = active_count() - baseline
+    peak = 0
+    for switch in range(switches):
+        for worker in workers:
+            worker.play(module_pattern(switch % 4))
+        peak = max(peak, active_count() - baseline)
+        sleep(0.002)
+
+    # the last pattern plays out in full, everything before it was pre-empted
+    started = perf_counter()
+    while any(worker.pending or worker._playing for worker in workers) and perf_counter() - started < 3:
+        sleep(0.01)
+    for worker in workers:
+        worker.stop()
+    print(f" after: {started_threads} worker threads, peak {peak} extra threads, {sum(h.pulses for h in haptics)} pulses, "
+          f"{sum(h.overlaps for h in haptics)} overlapping calls, {sum(w.preempted for w in workers)} patterns pre-empted")
+    print(f"threads after unregister: {active_count() - baseline} extra")
+
+
+if __name__ == "__main__":
+    main()
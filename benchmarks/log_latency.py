@@ -0,0 +1,84 @@
+# input callback latency with logging off, printed synchronously (before) and queued to the writer thread (after)
+# usage: python benchmarks/log_latency.py [events] [write-delay-us]
+from pathlib import Path
+from time import perf_counter, sleep
+import logging
+import random
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dispatch import Dispatcher
+from logger import LogWriter, get_logger
+from pyjoystick.sdl2 import Key
+
+
+class SlowStream:
+    # stands in for a slow terminal or a pipe into journald
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str):
+        self.lines += text.count("\n")
+        sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+def make_events(count: int) -> list:
+    rng = random.Random(0)
+    events = []
+    while len(events) < count:
+        button = rng.randrange(4)
+        events += [Key(Key.KeyTypes.BUTTON, button, 1), Key(Key.KeyTypes.BUTTON, button, 0)]
+    return events[:count]
+
+
+def measure(events: list, log) -> list:
+    dispatcher = Dispatcher([4, 5, 8, 9], True, lambda: None, log)
+    # the same work a mapped press does in the media module: log, then press
+    dispatcher.bind(lambda key: key.value and log("pressing %s", key.number, kind="key"))
+    samples = []
+    for key in events:
+        started = perf_counter()
+        dispatcher.dispatch(key)
+        samples.append(perf_counter() - started)
+    return sorted(samples)
+
+
+def report(name: str, samples: list):
+    percentile = lambda p: samples[min(int(len(samples) * p), len(samples) - 1)] * 1e6
+    print(f"{name:>24}: p50={percentile(0.5):7.1f}us p99={percentile(0.99):7.1f}us max={samples[-1] * 1e6:8.1f}us")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    stream = SlowStream((float(sys.argv[2]) if len(sys.argv) > 2 else 200) / 1e6)
+    events = make_events(count)
+
+    def printed(message: str, *args, **_):
+        print(message % args, file=stream, flush=True)
+
+    writer = LogWriter(stream)
+    logger = get_logger("benchmark")
+
+    def queued(message: str, *args, level: int = logging.INFO, kind: str = None):
+        logger.log(level, message, *args, extra={"kind": kind})
+
+    report("off", measure(events, lambda *_, **__: None))
+    report("print (before)", measure(events, printed))
+
+    writer.start()
+    for name, options in (("queued (after)", {"rate-limits": {}}), ("queued, rate-limited", {"rate-limits": {"key": 20}})):
+        writer.configure(options)
+        report(name, measure(events, queued))
+    writer.configure({"level": "warning"})
+    report("queued, level=warning", measure(events, queued))
+    writer.stop()
+    print(f"{stream.lines} lines written, {writer.rate_limit.suppressed} suppressed by rate limits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# per-event cost of macro matching as the number of patterns grows: scanning every pattern (before) vs the compiled automaton (after)
+# usage: python benchmarks/macros.py [events]
+from collections import deque
+from pathlib import Path
+from timeit import timeit
+import random
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from modules.macros import MacroMatcher, compile_macros
+from modules.mappings import HAT_VALUES
+from pyjoystick.sdl2 import Key
+
+
+BUTTONS = list(range(12))
+DIRECTIONS = ["up", "down", "left", "right"]
+
+
+class ScanMatcher:
+    # the straightforward approach: keep recent inputs and compare every pattern against them
+    def __init__(self, patterns: list):
+        self.patterns = patterns
+        self.history = deque(maxlen=max(len(pattern) for pattern in patterns))
+        self.fired = 0
+
+    def feed(self, key: Key, _) -> bool:
+        if not key.value:
+            return False
+        self.history.append(key.number if key.keytype == Key.KeyTypes.BUTTON else HAT_NAMES[key.value])
+        history = list(self.history)
+        best = None
+        for pattern in self.patterns:
+            if history[-len(pattern):] == pattern and (best is None or len(pattern) > len(best)):
+                best = pattern
+        if best is not None:
+            self.history.clear()
+            self.fired += 1
+            return True
+        return False
+
+
+HAT_NAMES = {value: name for name, value in HAT_VALUES.items()}
+
+
+def make_patterns(rng: random.Random, count: int) -> list:
+    patterns = set()
+    while len(patterns) < count:
+        patterns.add(tuple(rng.choice(BUTTONS + DIRECTIONS) for _ in range(rng.randint(3, 6))))
+    return [list(pattern) for pattern in sorted(patterns, key=str)]
+
+
+def make_events(rng: random.Random, count: int) -> list:
+    events = []
+    while len(events) < count:
+        if rng.random() < 0.7:
+            button = rng.choice(BUTTONS)
+            events += [Key(Key.KeyTypes.BUTTON, button, 1), Key(Key.KeyTypes.BUTTON, button, 0)]
+        else:
+            events += [Key(Key.KeyTypes.HAT, 0, HAT_VALUES[rng.choice(DIRECTIONS)]), Key(Key.KeyTypes.HAT, 0, 0)]
+    return events[:count]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rng = random.Random(0)
+    events = make_events(rng, count)
+    # matching cost is measured without sleeping between events, so the timing windows are made generous
+    for patterns in (10, 100, 500, 1000):
+        sequences = make_patterns(rng, patterns)
+        macros = compile_macros([{"sequence": sequence, "window": 60, "action": "webos:OK"} for sequence in sequences])
+        for name, matcher in (("scan", ScanMatcher(sequences)), ("automaton", MacroMatcher(macros, lambda _: None, lambda _: None, lambda callback: callback()))):
+            elapsed = timeit(lambda: [matcher.feed(key, 0) for key in events], number=1)
+            print(f"{patterns:>5} patterns {name:>10}: {elapsed / count * 1e9:8.1f} ns/event, {matcher.fired} matches")
+
+
+if __name__ == "__main__":
+    main()
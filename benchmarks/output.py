@@ -0,0 +1,57 @@
+# cost of injecting mouse ticks one call at a time (before) vs one batched write per tick (after)
+# usage: python benchmarks/output.py [ticks]
+#   writes uinput events to /dev/null so it runs without permissions, the recorder shows what each tick sends
+from pathlib import Path
+from time import perf_counter
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from modules.output import RecorderBackend, UinputBackend
+from pynput.mouse import Button
+
+
+class NullUinput(UinputBackend):
+    def __init__(self):
+        super().__init__("/dev/null")
+
+    def _create_device(self, device_name: str):
+        pass
+
+
+def tick(output, index: int):
+    output.move(3, -2)
+    output.scroll(0, 1)
+    if index % 10 == 0:
+        output.press(Button.left)
+    elif index % 10 == 5:
+        output.release(Button.left)
+
+
+def run(output, ticks: int, batched: bool) -> float:
+    started = perf_counter()
+    for index in range(ticks):
+        if batched:
+            with output.batch():
+                tick(output, index)
+        else:
+            tick(output, index)
+    return perf_counter() - started
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    for batched in (False, True):
+        output = NullUinput()
+        elapsed = run(output, ticks, batched)
+        output.close()
+        print(f"{'after' if batched else 'before'}: {output.written / ticks:.1f} events and {output.batches / ticks:.1f} writes "
+              f"(SYN_REPORTs) per tick, {elapsed / ticks * 1e6:.2f}us per tick")
+
+    recorder = RecorderBackend()
+    run(recorder, 1, True)
+    print(f"one tick: {recorder.recorded}")
+
+
+if __name__ == "__main__":
+    main()
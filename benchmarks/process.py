@@ -0,0 +1,66 @@
+# cost of handing input to an isolated module: pushing onto the shared-memory ring and the delay until the worker sees it
+# usage: python benchmarks/process.py [events] [interval-us]
+from pathlib import Path
+from multiprocessing import get_context
+from time import perf_counter_ns, sleep
+from types import SimpleNamespace
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from events import AXIS, InputEvent
+from modules.process import EventRing, WAIT_TIMEOUT
+
+
+def consume(ring_name: str, doorbell, results, events: int):
+    # stands in for run_worker's consumer: the value of each record is the time it was pushed
+    ring = EventRing(name=ring_name)
+    latencies = []
+    while len(latencies) < events:
+        if records := ring.pop_all():
+            now = perf_counter_ns()
+            latencies += [now - int(value) for _, _, _, value in records]
+            continue
+        ring.waiting = True
+        if not ring.pending() and doorbell.poll(WAIT_TIMEOUT):
+            while doorbell.poll(0):
+                doorbell.recv_bytes()
+        ring.waiting = False
+    results.send(sorted(latencies))
+    ring.close()
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    interval = (int(sys.argv[2]) if len(sys.argv) > 2 else 200) * 1000
+    context = get_context("spawn")
+    ring = EventRing()
+    doorbell_reader, doorbell = context.Pipe(duplex=False)
+    results, child_results = context.Pipe(duplex=False)
+    worker = context.Process(target=consume, args=(ring.name, doorbell_reader, child_results, events), daemon=True)
+    worker.start()
+    sleep(1)
+
+    pad = SimpleNamespace(identifier=0)
+    push_time = doorbells = 0
+    for _ in range(events):
+        started = perf_counter_ns()
+        ring.push(InputEvent(AXIS, 0, float(started), pad))
+        if ring.waiting:
+            ring.waiting = False
+            doorbell.send_bytes(b"\0")
+            doorbells += 1
+        push_time += perf_counter_ns() - started
+        while perf_counter_ns() - started < interval:
+            pass
+
+    latencies = results.recv()
+    worker.join(5)
+    ring.close(unlink=True)
+    percentile = lambda fraction: latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] / 1000
+    print(f"push: {push_time / events / 1000:.2f}us per event, doorbell rung for {doorbells / events * 100:.1f}% of events, {ring.dropped} dropped")
+    print(f"delivery: p50 {percentile(0.5):.1f}us p99 {percentile(0.99):.1f}us max {latencies[-1] / 1000:.1f}us ({len(latencies)} events)")
+
+
+if __name__ == "__main__":
+    main()
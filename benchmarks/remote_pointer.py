@@ -0,0 +1,155 @@
+# analog pointer streaming in the remote module against a local fake of the TV's pointer input socket:
+# how many messages the stick produces, over how many sockets, whether the distance sent matches the deflection, and
+# that a released or resting stick sends nothing
+# usage: python benchmarks/remote_pointer.py [seconds] [axis-events-per-second] (exits non-zero on failure)
+from pathlib import Path
+from threading import Thread, Event
+from time import perf_counter, sleep
+import asyncio
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from events import AXIS, InputEvent, Device
+from modules.module_remote import Remote
+from modules.output import RecorderBackend
+from modules.webos import WebOsConnection
+
+
+class PointerSocketServer:
+    # accepts connections on localhost and timestamps every message in the TV's "type:...\n\n" framing
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.port = None
+        self.loop = asyncio.new_event_loop()
+        self._ready = Event()
+        Thread(target=self._run, daemon=True).start()
+        self._ready.wait(5)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, _):
+        self.connections += 1
+        buffer = b""
+        while data := await reader.read(65536):
+            buffer += data
+            *frames, buffer = buffer.split(b"\n\n")
+            now = perf_counter()
+            for frame in frames:
+                fields = dict(line.split(":", 1) for line in frame.decode().split("\n"))
+                self.messages.append((now, fields["type"], int(fields.get("dx", 0)), int(fields.get("dy", 0))))
+
+
+class PointerSocketClient:
+    # stands in for WebOsClient, writing the same messages aiowebostv sends over its persistent input socket
+    port = None
+
+    def __init__(self, host: str, client_key: str = None):
+        self.host = host
+        self.client_key = client_key or "benchmark"
+        self.writer = None
+
+    async def connect(self):
+        _, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+
+    async def disconnect(self):
+        if self.writer:
+            self.writer.close()
+
+    def is_connected(self) -> bool:
+        return bool(self.writer and not self.writer.is_closing())
+
+    async def get_system_info(self) -> dict:
+        return {"modelName": "fake pointer socket"}
+
+    async def input_command(self, message: str):
+        self.writer.write(message.encode())
+        await self.writer.drain()
+
+    async def button(self, name: str):
+        await self.input_command(f"type:button\nname:{name}\n\n")
+
+    async def move(self, dx: int, dy: int, down: int = 0):
+        await self.input_command(f"type:move\ndx:{dx}\ndy:{dy}\ndown:{down}\n\n")
+
+    async def scroll(self, dx: int, dy: int):
+        await self.input_command(f"type:scroll\ndx:{dx}\ndy:{dy}\n\n")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    event_rate = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    server = PointerSocketServer()
+    PointerSocketClient.port = server.port
+    WebOsConnection.client_class = PointerSocketClient
+
+    remote = Remote(RecorderBackend())
+    remote.logger.disabled = True
+    remote._save_secrets = lambda: None
+    remote.load()
+    remote.connection.wait_connected(5)
+    options = remote.options["pointer"]
+    pad = Device(0)
+
+    # the stick is held at a fixed deflection while SDL streams small changes around it, as a real stick does
+    x, y, wheel = 0.75, -0.5, 0.6
+    events = 0
+    started = perf_counter()
+    while perf_counter() - started < seconds:
+        jitter = 0.001 * (events % 3)
+        for number, value in ((0, x + jitter), (1, y - jitter), (4, wheel + jitter)):
+            remote.on_key(InputEvent(AXIS, number, value, pad))
+            events += 1
+        sleep(max(started + events / 3 / event_rate - perf_counter(), 0))
+    for number in (0, 1, 4):
+        remote.on_key(InputEvent(AXIS, number, 0.0, pad))
+    held = perf_counter() - started
+    sleep(0.3)
+
+    moves = [message for message in server.messages if message[1] == "move"]
+    scrolls = [message for message in server.messages if message[1] == "scroll"]
+    span = moves[-1][0] - moves[0][0] if len(moves) > 1 else 0.0
+    dx, dy = sum(message[2] for message in moves), sum(message[3] for message in moves)
+    scrolled = sum(message[3] for message in scrolls)
+    expected = (options["speed"] * (x + 0.001) * held, options["speed"] * (y - 0.001) * held, options["scroll-speed"] * (wheel + 0.001) * held)
+    # timing can shift the distance by one tick, and a fraction of a pixel or notch is left over at release
+    tick = options["speed"] / options["rate"]
+    scroll_tick = options["scroll-speed"] / options["rate"]
+
+    passed = server.connections == 1
+    ok = passed
+    print(f"{events} axis events over {held:.2f}s -> {len(moves)} move and {len(scrolls)} scroll messages on "
+          f"{server.connections} socket(s) {'ok' if passed else 'FAILED'}")
+    passed = len(moves) <= held * options["rate"] + 1
+    ok &= passed
+    print(f"move rate: {(len(moves) - 1) / max(span, 1e-9):.1f}/s (configured {options['rate']}/s) {'ok' if passed else 'FAILED'}")
+    passed = (abs(dx - expected[0]) <= tick + 1 and abs(dy - expected[1]) <= tick + 1
+              and abs(scrolled - expected[2]) <= scroll_tick + 1)
+    ok &= passed
+    print(f"distance: dx {dx} (expected ~{expected[0]:.0f}), dy {dy} (expected ~{expected[1]:.0f}), "
+          f"scroll {scrolled} (expected ~{expected[2]:.0f}), one tick is {tick:.0f}px {'ok' if passed else 'FAILED'}")
+
+    # a stick resting inside the deadzone after the release must not keep the stream sending
+    sent = len(server.messages)
+    for step in range(200):
+        remote.on_key(InputEvent(AXIS, step % 2, options["deadzone"] / 2 * (-1) ** step, pad))
+        sleep(0.001)
+    sleep(0.2)
+    passed = len(server.messages) == sent
+    ok &= passed
+    print(f"after release: {len(server.messages) - sent} messages from 200 events inside the deadzone {'ok' if passed else 'FAILED'}")
+    print("ok" if ok else "FAILED")
+    remote.commands.stop()
+    remote.pointer.stop()
+    remote.connection.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
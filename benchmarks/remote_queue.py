@@ -0,0 +1,177 @@
+# the remote module's command queue against a local fake webOS TV: the real aiowebostv client pairs with it over
+# websockets, and every button that reaches the fake's input socket is checked for order, volume bursts and stale
+# navigation drops, along with how long on_key holds the input thread while the connection's loop is stalled
+# usage: python benchmarks/remote_queue.py [stall-ms] (needs port 3000 free, exits non-zero on failure)
+from pathlib import Path
+from threading import Thread, Event
+from time import perf_counter, sleep
+import asyncio
+import json
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiohttp import web
+from aiowebostv.webos_client import WS_PORT
+from events import BUTTON, HAT, InputEvent, Device
+from modules.module_remote import DEFAULT_OPTIONS, Remote
+from modules.output import RecorderBackend
+from pyjoystick.sdl2 import Key
+
+HAT_COMMANDS = {"UP": Key.HAT_UP, "DOWN": Key.HAT_DOWN, "LEFT": Key.HAT_LEFT, "RIGHT": Key.HAT_RIGHT}
+TV_STATE = {"modelName": "fake webOS TV", "state": "Active", "launchPoints": [], "devices": []}
+BUTTON_COMMANDS = {"ENTER": 0, "BACK": 1, "PLAY": 2, "PAUSE": 3, "VOLUMEDOWN": 4, "VOLUMEUP": 5, "HOME": 6, "MENU": 7}
+
+
+class FakeTv:
+    # answers the handshake, requests and subscriptions aiowebostv makes while connecting, and keeps the name of every
+    # button that arrives on the input socket
+    def __init__(self):
+        self.buttons = []
+        self.input_sockets = 0
+        self.loop = asyncio.new_event_loop()
+        self._ready = Event()
+        Thread(target=self._run, daemon=True).start()
+        if not self._ready.wait(5):
+            raise RuntimeError(f"fake TV did not start on port {WS_PORT}")
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.add_routes([web.get("/", self._main), web.get("/input", self._input)])
+        runner = web.AppRunner(app)
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", WS_PORT).start())
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def _main(self, request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        async for message in socket:
+            message = json.loads(message.data)
+            kind, uid, uri = message["type"], message.get("id"), message.get("uri", "")
+            if kind == "hello":
+                await socket.send_json({"type": "hello", "id": uid, "payload": {}})
+            elif kind == "register":
+                # a pairing prompt the user accepts straight away
+                await socket.send_json({"type": "response", "id": uid, "payload": {"pairingType": "PROMPT"}})
+                await socket.send_json({"type": "registered", "id": uid, "payload": {"client-key": "fake"}})
+            elif uri.endswith("getPointerInputSocket"):
+                await socket.send_json({"type": "response", "id": uid, "payload": {"returnValue": True, "socketPath": f"ws://127.0.0.1:{WS_PORT}/input"}})
+            else:
+                # one payload serves every request and subscription the client makes: a TV with no apps or inputs
+                await socket.send_json({"type": "response", "id": uid, "payload": {"returnValue": True, **TV_STATE}})
+        return socket
+
+    async def _input(self, request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self.input_sockets += 1
+        async for message in socket:
+            fields = dict(line.split(":", 1) for line in message.data.strip().split("\n"))
+            if fields["type"] == "button":
+                self.buttons.append(fields["name"])
+        return socket
+
+
+class LocalRemote(Remote):
+    default_options = {**DEFAULT_OPTIONS, "host": "127.0.0.1"}
+
+
+class Presser:
+    # presses and releases mapped controls the way the input thread would, timing every on_key call
+    def __init__(self, remote: Remote):
+        self.remote = remote
+        self.pad = Device(0)
+        self.slowest = 0.0
+
+    def press(self, *commands: str):
+        for command in commands:
+            if command in HAT_COMMANDS:
+                events = (InputEvent(HAT, 0, HAT_COMMANDS[command], self.pad), InputEvent(HAT, 0, Key.HAT_CENTERED, self.pad))
+            else:
+                events = (InputEvent(BUTTON, BUTTON_COMMANDS[command], 1, self.pad), InputEvent(BUTTON, BUTTON_COMMANDS[command], 0, self.pad))
+            for event in events:
+                started = perf_counter()
+                self.remote.on_key(event)
+                self.slowest = max(self.slowest, perf_counter() - started)
+
+
+def received(tv: FakeTv, start: int, last: str, timeout: float = 5.0) -> list:
+    # waits for the final command of a scenario, everything queued before it has been sent by then
+    deadline = perf_counter() + timeout
+    while last not in tv.buttons[start:] and perf_counter() < deadline:
+        sleep(0.005)
+    sleep(0.05)
+    return tv.buttons[start:]
+
+
+def stall(remote: Remote, seconds: float):
+    # keeps the connection's loop busy, as a slow TV or a burst of pointer messages would, so presses pile up
+    remote.connection.loop.call_soon_threadsafe(sleep, seconds)
+    sleep(0.01)
+
+
+def main():
+    stall_time = (float(sys.argv[1]) if len(sys.argv) > 1 else 200) / 1000
+    tv = FakeTv()
+    remote = LocalRemote(RecorderBackend())
+    remote.logger.disabled = True
+    remote._save_secrets = lambda: None
+    remote.load()
+    if not remote.connection.wait_connected(10):
+        print("could not connect to the fake TV FAILED")
+        sys.exit(1)
+    presser = Presser(remote)
+    queue = remote.commands
+    ok = True
+
+    # taps spaced out like a user's arrive exactly as pressed
+    start = len(tv.buttons)
+    order = ["HOME", "UP", "RIGHT", "ENTER", "PLAY", "PAUSE", "BACK", "MENU"]
+    for command in order:
+        presser.press(command)
+        sleep(0.02)
+    got = received(tv, start, order[-1])
+    passed = got == order
+    ok &= passed
+    print(f"order: {got} {'ok' if passed else 'FAILED'}")
+
+    # volume presses that pile up behind a stalled loop go out as one burst each, none lost
+    start, coalesced = len(tv.buttons), queue.coalesced
+    stall(remote, stall_time)
+    presser.press(*["VOLUMEUP"] * 10, *["VOLUMEDOWN"] * 3)
+    got = received(tv, start, "VOLUMEDOWN")
+    passed = got == ["VOLUMEUP"] * 10 + ["VOLUMEDOWN"] * 3 and queue.coalesced - coalesced == 11
+    ok &= passed
+    print(f"volume: 10 up and 3 down pressed, {got.count('VOLUMEUP')} up and {got.count('VOLUMEDOWN')} down sent, "
+          f"{queue.coalesced - coalesced} coalesced {'ok' if passed else 'FAILED'}")
+
+    # directions that pile up are dropped instead of replayed late, except the newest, and ENTER/BACK always arrive
+    start, dropped = len(tv.buttons), queue.dropped
+    stall(remote, stall_time)
+    presser.press("ENTER", *["RIGHT"] * 12, "BACK")
+    got = received(tv, start, "BACK")
+    passed = got == ["ENTER", "RIGHT", "BACK"] and queue.dropped - dropped == 11
+    ok &= passed
+    print(f"stale navigation: ENTER, 12 RIGHT and BACK pressed, {got} sent, {queue.dropped - dropped} dropped "
+          f"{'ok' if passed else 'FAILED'}")
+
+    # on_key only hands the command over, so it never waits for the stalled loop
+    passed = presser.slowest < stall_time / 10
+    ok &= passed
+    print(f"slowest on_key: {presser.slowest * 1000:.3f}ms with the loop stalled for {stall_time * 1000:.0f}ms {'ok' if passed else 'FAILED'}")
+
+    passed = tv.input_sockets == 1 and set(queue.latency) == set(tv.buttons)
+    ok &= passed
+    print(f"{queue.summary()} over {tv.input_sockets} input socket(s) {'ok' if passed else 'FAILED'}")
+    print("ok" if ok else "FAILED")
+    remote.commands.stop()
+    remote.pointer.stop()
+    remote.connection.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
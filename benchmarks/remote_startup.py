@@ -0,0 +1,93 @@
+# remote module time-to-first-command against a fake TV with network delays: a cold start (no secrets file, so
+# no key, MAC address or system info) followed by a warm start that reuses the secrets the cold start saved
+# usage: python benchmarks/remote_startup.py [handshake-ms] [round-trip-ms] [arp-ms]
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from events import BUTTON, InputEvent, Device
+from modules import module_remote
+from modules.module_remote import Remote
+from modules.output import RecorderBackend
+from modules.webos import WebOsConnection
+
+
+class DelayedWebOsClient:
+    # pays the handshake once per connection and a round trip per request, like a TV on the local network
+    handshake = 0.0
+    round_trip = 0.0
+
+    def __init__(self, host: str, client_key: str = None):
+        self.host = host
+        self.client_key = client_key
+        self.sent = []
+        self._connected = False
+
+    async def connect(self):
+        await asyncio.sleep(self.handshake)
+        self.client_key = self.client_key or "paired"
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def get_system_info(self) -> dict:
+        await asyncio.sleep(self.round_trip)
+        return {"modelName": "delayed"}
+
+    async def button(self, name: str):
+        await asyncio.sleep(self.round_trip / 2)
+        self.sent.append((perf_counter(), name))
+
+
+def first_command() -> tuple:
+    remote = Remote(RecorderBackend())
+    remote.logger.disabled = True
+    started = perf_counter()
+    remote.load()
+    # the first press lands as soon as the module reports a connection, as an impatient user's would
+    while not remote.connected:
+        sleep(0.0005)
+    connected = perf_counter() - started
+    remote.on_key(InputEvent(BUTTON, 0, 1, Device(0)))
+    while not remote.connection.client.sent:
+        sleep(0.0005)
+    elapsed = remote.connection.client.sent[0][0] - started
+    # let the background lookups finish and save before the next start reads the secrets
+    sleep(0.5)
+    remote.commands.stop()
+    remote.pointer.stop()
+    remote.connection.stop()
+    return connected, elapsed
+
+
+def main():
+    DelayedWebOsClient.handshake = (float(sys.argv[1]) if len(sys.argv) > 1 else 80) / 1000
+    DelayedWebOsClient.round_trip = (float(sys.argv[2]) if len(sys.argv) > 2 else 30) / 1000
+    arp = (float(sys.argv[3]) if len(sys.argv) > 3 else 150) / 1000
+    WebOsConnection.client_class = DelayedWebOsClient
+
+    def get_mac_address(ip: str) -> str:
+        sleep(arp)
+        return "aa:bb:cc:dd:ee:ff"
+    module_remote.get_mac_address = get_mac_address
+
+    with TemporaryDirectory() as directory:
+        # the default secrets-file path is relative to the working directory
+        os.chdir(directory)
+        os.mkdir("data")
+        for start in ("cold", "warm"):
+            connected, elapsed = first_command()
+            print(f"{start}: connected after {connected * 1000:.1f}ms, first command at the TV after {elapsed * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
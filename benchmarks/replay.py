@@ -0,0 +1,76 @@
+# regression benchmark for Media, Remote and Mouse without a controller: synthetic traces replayed through Core
+# usage: python benchmarks/replay.py [presses]
+#   media and remote replay as fast as possible, mouse in real time since its movement runs on its own clock
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core import Core
+from events import AXIS, BUTTON, HAT, InputEvent
+from recording import TraceRecorder
+from replay import remote_commands, replay, use_fake_backends
+from pyjoystick.sdl2 import Key
+
+
+PAD = SimpleNamespace(identifier=0)
+MILLISECOND = 1_000_000
+
+
+def write_trace(path: str, events: list):
+    recorder = TraceRecorder(path)
+    for timestamp, (keytype, number, value) in enumerate(events):
+        recorder.record(InputEvent(keytype, number, value, PAD), timestamp * 5 * MILLISECOND)
+    recorder.close()
+
+
+def buttons_and_hats(presses: int) -> list:
+    events = []
+    for press in range(presses):
+        # skips the switch shortcut buttons so the whole trace stays in one module
+        button = (0, 1, 2, 3, 6, 7)[press % 6]
+        hat = (Key.HAT_UP, Key.HAT_RIGHT, Key.HAT_DOWN, Key.HAT_LEFT)[press % 4]
+        events += [(BUTTON, button, 1), (BUTTON, button, 0), (HAT, 0, hat), (HAT, 0, Key.HAT_CENTERED)]
+    return events
+
+
+def stick_sweeps(seconds: float) -> list:
+    # 200 axis events a second sweeping the movement stick, with a click every 0.4s
+    events = []
+    for step in range(int(seconds * 100)):
+        events += [(AXIS, 0, ((step % 50) - 25) / 25), (AXIS, 1, ((step * 3 % 50) - 25) / 25)]
+        if step % 40 == 0:
+            events += [(BUTTON, 0, 1), (BUTTON, 0, 0)]
+    return events + [(AXIS, 0, 0.0), (AXIS, 1, 0.0)]
+
+
+def run(module: str, path: str, realtime: bool):
+    core = Core()
+    core.configure()
+    core.logs.configure({"level": "warning"})
+    use_fake_backends(core)
+    core.add_modules_from_list()
+    core.initial_spec = core.modules[core.positions[module]]
+    delivered, elapsed = replay(core, path, realtime)
+    print(f"{module:>6}: {delivered} events in {elapsed:.3f}s ({delivered / elapsed:,.0f} events/s), "
+          f"output {core.output.written} events in {core.output.batches} batches, remote {len(remote_commands(core))} commands")
+    if commands := getattr(core.initial_spec.instance, "commands", None):
+        # navigation the TV could not keep up with is dropped by design, so this varies a little between fast runs
+        print(f"        command queue: {commands.summary()}")
+
+
+def main():
+    presses = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with TemporaryDirectory() as directory:
+        keys, sticks = f"{directory}/keys.trace", f"{directory}/sticks.trace"
+        write_trace(keys, buttons_and_hats(presses))
+        write_trace(sticks, stick_sweeps(2.0))
+        run("media", keys, realtime=False)
+        run("remote", keys, realtime=False)
+        run("mouse", sticks, realtime=True)
+
+
+if __name__ == "__main__":
+    main()
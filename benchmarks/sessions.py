@@ -0,0 +1,114 @@
+# throughput of Core.callback with several controllers, each keeping its own chord state, and a check that every pad
+# gets its own session and that a switch shortcut only switches the pad that pressed it
+# usage: python benchmarks/sessions.py [pads] [events-per-pad] [--virtual] (exits non-zero on failure)
+#   --virtual drives SDL virtual joysticks (SDL 2.0.14+, runs headless) instead of synthesised events
+from pathlib import Path
+from time import perf_counter
+from types import SimpleNamespace
+import ctypes
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core import Core
+from pyjoystick.sdl2 import Key
+
+
+SHORTCUT = [4, 5, 8, 9]
+
+
+def make_core() -> Core:
+    core = Core()
+    core.logs.configure({"level": "warning"})
+    core.switched = []
+    # only records which session asked, there are no modules to switch between here
+    core.switch_module = lambda session, spec=None: core.switched.append(session)
+    return core
+
+
+def pad_script(pad: int, count: int) -> list:
+    # every pad holds half of the switch shortcut, which only switches if chord state leaks between pads
+    half = SHORTCUT[:2] if pad % 2 == 0 else SHORTCUT[2:]
+    script = []
+    while len(script) < count:
+        script += [(Key.KeyTypes.BUTTON, half[0], 1), (Key.KeyTypes.BUTTON, half[1], 1)]
+        script += [(Key.KeyTypes.AXIS, axis, (len(script) % 200) / 100 - 1) for axis in range(4)]
+        script += [(Key.KeyTypes.BUTTON, half[1], 0), (Key.KeyTypes.BUTTON, half[0], 0)]
+    return script[:count]
+
+
+def run_synthetic(pads: int, count: int):
+    core = make_core()
+    joysticks = [SimpleNamespace(identifier=100 + pad) for pad in range(pads)]
+    scripts = [pad_script(pad, count) for pad in range(pads)]
+    # interleave the pads the way SDL would deliver events from several devices
+    events = [Key(keytype, number, value, joysticks[pad]) for step in zip(*scripts) for pad, (keytype, number, value) in enumerate(step)]
+
+    started = perf_counter()
+    for key in events:
+        core.callback(key)
+    return core, len(events), perf_counter() - started
+
+
+def run_virtual(pads: int, count: int):
+    import sdl2
+    from events import EventLoop
+
+    core = make_core()
+    loop = EventLoop(core.register, core.unregister, core.callback)
+    loop.init()
+    event = sdl2.SDL_Event()
+    devices = []
+    for _ in range(pads):
+        index = sdl2.SDL_JoystickAttachVirtual(sdl2.SDL_JOYSTICK_TYPE_GAMECONTROLLER, 6, 11, 1)
+        devices.append(sdl2.SDL_JoystickOpen(index))
+    while sdl2.SDL_PollEvent(ctypes.byref(event)):
+        loop.handle(event)
+
+    scripts = [pad_script(pad, count) for pad in range(pads)]
+    started = perf_counter()
+    for step in zip(*scripts):
+        for device, (keytype, number, value) in zip(devices, step):
+            if keytype == Key.KeyTypes.BUTTON:
+                sdl2.SDL_JoystickSetVirtualButton(device, number, value)
+            else:
+                sdl2.SDL_JoystickSetVirtualAxis(device, number, int(value * 32767))
+        sdl2.SDL_JoystickUpdate()
+        while sdl2.SDL_PollEvent(ctypes.byref(event)):
+            loop.handle(event)
+    elapsed = perf_counter() - started
+
+    for device in devices:
+        sdl2.SDL_JoystickClose(device)
+    for index in reversed(range(pads)):
+        sdl2.SDL_JoystickDetachVirtual(index)
+    return core, loop.events, elapsed
+
+
+def main():
+    arguments = [argument for argument in sys.argv[1:] if not argument.startswith("--")]
+    pads = int(arguments[0]) if arguments else 4
+    count = int(arguments[1]) if len(arguments) > 1 else 20_000
+    core, events, elapsed = (run_virtual if "--virtual" in sys.argv else run_synthetic)(pads, count)
+
+    sessions = list(core.sessions.values())
+    print(f"{pads} pads: {events} events in {elapsed:.3f}s ({events / elapsed:,.0f} events/s, {elapsed / events * 1e6:.2f}us/event)")
+    passed = len(sessions) == pads and not core.switched
+    print(f"sessions: {len(sessions)}, switches: {len(core.switched)}, ignored per pad: "
+          f"{[session.dispatcher.ignored for session in sessions]} {'ok' if passed else 'FAILED (chord state leaked between pads)'}")
+    ok = passed
+
+    # the whole shortcut on the last pad switches that pad's session and no other
+    joystick = SimpleNamespace(identifier=sessions[-1].instance_id)
+    for value in (1, 0):
+        for button in SHORTCUT:
+            core.callback(Key(Key.KeyTypes.BUTTON, button, value, joystick))
+    passed = core.switched == [sessions[-1]]
+    ok &= passed
+    print(f"shortcut on {sessions[-1].name}: switched {[session.name for session in core.switched]} {'ok' if passed else 'FAILED'}")
+    print("ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# startup import cost of core.py: eager module imports vs lazy discovery, using -X importtime
+# top-level imports hide what they pull in (sdl2, pynput, pyjoystick under core), so every package's own import time
+# is listed as well, wherever in the tree it was imported from
+# usage: python benchmarks/startup.py [top] (exits non-zero if a scenario fails to run)
+from pathlib import Path
+import subprocess
+import sys
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "eager (all modules imported)": "import core, modules.module_media, modules.module_remote, modules.module_mouse",
+    "lazy (discovery only)": "import core; core.Core().add_modules_from_list()",
+}
+
+
+def import_times(code: str) -> tuple:
+    # (cumulative time of each top-level package, own time of each package at any depth), None if the code failed
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        print("\n".join(f"    {line}" for line in errors[-5:]))
+        return None
+    totals, packages = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if not own.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own)
+        # cumulative times only for top-level imports, so nested packages are not counted twice
+        if not name.startswith("  "):
+            totals[package] = totals.get(package, 0) + int(cumulative)
+    return totals, packages
+
+
+def main():
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    ok = True
+    for scenario, code in SCENARIOS.items():
+        if not (times := import_times(code)):
+            print(f"{scenario}: FAILED")
+            ok = False
+            continue
+        totals, packages = times
+        print(f"{scenario}: {sum(totals.values()) / 1000:.1f} ms")
+        for package, elapsed in sorted(totals.items(), key=lambda item: -item[1])[:top]:
+            print(f"    {package:<24} {elapsed / 1000:8.1f} ms")
+        print("  by package, including nested imports:")
+        for package, elapsed in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            print(f"    {package:<24} {elapsed / 1000:8.1f} ms")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# cost of publishing controller state on the input thread, and how fast another process can take consistent snapshots
+# of it while a writer process hammers the export (every snapshot is checked for torn writes)
+# usage: python benchmarks/state.py [updates] [seconds] (exits non-zero if a snapshot is wrong or torn)
+from pathlib import Path
+from multiprocessing import get_context
+from tempfile import TemporaryDirectory
+from time import perf_counter, perf_counter_ns
+from types import SimpleNamespace
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from events import AXIS, BUTTON, InputEvent
+from state import StateExport, StateReader
+
+
+def hammer(path: str, seconds: float, ready):
+    # every write sets all four speeds to the same value, so a snapshot mixing two writes would show different values
+    export = StateExport(path)
+    export.attach(0)
+    export.set_module(0, "mouse", speeds=True)
+    ready.set()
+    value, deadline = 0.0, perf_counter() + seconds
+    while perf_counter() < deadline:
+        value += 1.0
+        export.set_speeds(0, (value, value), (value, value))
+    export.close()
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    with TemporaryDirectory() as directory:
+        path = f"{directory}/state"
+        export = StateExport(path)
+        export.attach(0)
+        pad = SimpleNamespace(identifier=0)
+        keys = [InputEvent(AXIS, number % 6, number / updates, pad) for number in range(64)] + [InputEvent(BUTTON, 0, 1, pad), InputEvent(BUTTON, 0, 0, pad)]
+        started = perf_counter_ns()
+        for index in range(updates):
+            export.update(keys[index % len(keys)])
+        print(f"writer: {(perf_counter_ns() - started) / updates:.0f}ns per event on the input thread")
+
+        # a reader in this process sees exactly the last values written
+        axes = tuple(number / 10 - 0.25 for number in range(6))
+        for number, value in enumerate(axes):
+            export.update(InputEvent(AXIS, number, value, pad))
+        export.update(InputEvent(BUTTON, 0, 0, pad))
+        export.update(InputEvent(BUTTON, 3, 1, pad))
+        reader = StateReader(path)
+        controller = reader.snapshot()[0]
+        passed = controller.axes[:6] == axes and controller.buttons[3] == 1 and controller.buttons[0] == 0
+        ok = passed
+        print(f"snapshot after the writes: axes {controller.axes[:6]}, buttons {controller.buttons[:4]} {'ok' if passed else 'FAILED'}")
+        reader.close()
+        export.close()
+
+        context = get_context("spawn")
+        ready = context.Event()
+        writer = context.Process(target=hammer, args=(path, seconds, ready), daemon=True)
+        writer.start()
+        ready.wait(10)
+        reader = StateReader(path)
+        snapshots = torn = 0
+        last_value = 0.0
+        started = perf_counter()
+        while writer.is_alive() and perf_counter() - started < seconds:
+            for controller in reader.snapshot():
+                if len(set(controller.mouse_speed + controller.scroll_speed)) != 1 or controller.mouse_speed[0] < last_value:
+                    torn += 1
+                last_value = controller.mouse_speed[0]
+            snapshots += 1
+        elapsed = perf_counter() - started
+        writer.join(seconds + 5)
+        passed = snapshots > 0 and not torn
+        ok &= passed
+        print(f"reader: {snapshots / elapsed:,.0f} snapshots/s while the writer ran flat out, "
+              f"{reader.retries / max(snapshots, 1) * 100:.1f}% retried, {torn} inconsistent {'ok' if passed else 'FAILED'}")
+        reader.close()
+    print("ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
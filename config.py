@@ -0,0 +1,168 @@
+from types import MappingProxyType
+from threading import Thread
+import json
+import os
+import time
+
+
+CORE_SECTION = None
+EMPTY_MODULE = MappingProxyType({"options": MappingProxyType({}), "mappings": MappingProxyType({})})
+
+
+class ConfigError(Exception):
+    pass
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def merge(defaults, overrides, path: str = "") -> dict:
+    # deep merge that also checks overrides have the same shape as the defaults they replace
+    merged = thaw(defaults)
+    for key, value in overrides.items():
+        default = merged.get(key)
+        name = f"{path}.{key}" if path else key
+        if isinstance(default, dict):
+            if not isinstance(value, (dict, MappingProxyType)):
+                raise ConfigError(f"'{name}' should be an object")
+            merged[key] = merge(default, value, name)
+            continue
+        if default is not None and value is not None and not _same_type(default, value):
+            raise ConfigError(f"'{name}' should be {type(default).__name__}, not {type(value).__name__}")
+        merged[key] = thaw(value)
+    return merged
+
+
+def _same_type(default, value) -> bool:
+    if isinstance(default, bool) or isinstance(value, bool):
+        return isinstance(default, bool) and isinstance(value, bool)
+    if isinstance(default, (int, float)):
+        return isinstance(value, (int, float))
+    if isinstance(default, (list, tuple)):
+        return isinstance(value, (list, tuple))
+    return isinstance(value, type(default))
+
+
+class ConfigStore:
+    def __init__(self, config_file: str, defaults: dict, log=print):
+        self.config_file = config_file
+        self.defaults = defaults
+        self.config = freeze(defaults)
+        self.modules = MappingProxyType({})
+        self.listeners = []
+        self.reloads = 0
+        self._raw_modules = {}
+        self._mtimes = {}
+        self._thread = None
+        self._active = False
+        self._log = log
+
+    @property
+    def modules_file(self) -> str:
+        return self.config["modules"]["config"]
+
+    def load(self):
+        self.config = freeze(merge(self.defaults, self._read(self.config_file)))
+        self._raw_modules = self._read(self.modules_file)
+        self.modules = self._build_modules(self._raw_modules)
+
+    def module(self, name: str) -> MappingProxyType:
+        return self.modules.get(name, EMPTY_MODULE)
+
+    def module_options(self, name: str, defaults: dict) -> MappingProxyType:
+        return freeze(merge(defaults, self.module(name)["options"], name))
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def watch(self, interval: float):
+        if self._active:
+            return
+        self._active = True
+        self._thread = Thread(target=self._poll, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._active = False
+
+    def check(self):
+        # re-parse only files whose mtime moved and notify listeners of the sections that actually changed
+        changed = []
+        try:
+            if self._modified(self.config_file):
+                config = freeze(merge(self.defaults, self._read(self.config_file)))
+                if config != self.config:
+                    self.config = config
+                    changed.append(CORE_SECTION)
+
+            if self._modified(self.modules_file):
+                raw_modules = self._read(self.modules_file)
+                modules = self._build_modules(raw_modules)
+                names = set(raw_modules) | set(self._raw_modules)
+                changed += sorted(name for name in names if raw_modules.get(name) != self._raw_modules.get(name))
+                self._raw_modules, self.modules = raw_modules, modules
+        except (ConfigError, ValueError) as e:
+            self._log(f"config: ignoring invalid change: {e}")
+            return
+
+        for section in changed:
+            self.reloads += 1
+            self._log(f"config: reloading {'core' if section is CORE_SECTION else repr(section)}")
+            for callback in self.listeners:
+                callback(section)
+
+    def _poll(self, interval: float):
+        while self._active:
+            time.sleep(interval)
+            self.check()
+
+    def _modified(self, path: str) -> bool:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if path in self._mtimes and self._mtimes[path] == mtime:
+            return False
+        self._mtimes[path] = mtime
+        return True
+
+    def _read(self, path: str) -> dict:
+        self._modified(path)
+        try:
+            with open(path, "r") as config_file:
+                config = json.load(config_file)
+        except FileNotFoundError:
+            self._log(f"config: '{path}' does not exist - using defaults")
+            return {}
+        if not isinstance(config, dict):
+            raise ConfigError(f"'{path}' should contain an object")
+        return config
+
+    @staticmethod
+    def _build_modules(raw_modules: dict) -> MappingProxyType:
+        modules = {}
+        for name, section in raw_modules.items():
+            if not isinstance(section, dict):
+                raise ConfigError(f"module '{name}' should be an object")
+            for key in ("options", "mappings"):
+                if not isinstance(section.setdefault(key, {}), dict):
+                    raise ConfigError(f"'{name}.{key}' should be an object")
+            if not isinstance(section.setdefault("macros", []), list):
+                raise ConfigError(f"'{name}.macros' should be a list")
+            if not isinstance(section.setdefault("process", False), bool):
+                raise ConfigError(f"'{name}.process' should be true or false")
+            modules[name] = freeze(section)
+        return MappingProxyType(modules)
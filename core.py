@@ -1,127 +1,508 @@
-from modules import MODULE_CLASSES
-from modules.module import Module
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import ConfigStore, ConfigError, CORE_SECTION, freeze
+from dispatch import Dispatcher
+from events import AXIS, EventLoop, Key
+from haptics import RumblePattern, REGISTERED, module_pattern
+from logger import LogWriter, DEFAULT_LOGGING, get_logger
+from modules import ModuleSpec, discover_modules
 from modules.module_dummy import Dummy
-from pyjoystick.sdl2 import Key, Joystick, run_event_loop
-from pynput.keyboard import Controller
-from threading import Thread
-from time import sleep
+from session import Session
+from modules.macros import MacroMatcher
+from modules.output import OutputBackend, PynputBackend, create_backend
+from modules.process import ModuleProcess
+from recording import TraceRecorder
+from state import StateExport
+from stats import Stats, StatsServer
+from threading import Thread, Event, Lock, active_count
+from time import sleep, perf_counter_ns
+import argparse
+import atexit
+import logging
 import os
-import json
+import signal
 import sdl2
 
 
 CONFIG_FILE = os.getenv("MAPPER_CONFIG_FILE", "data/config.json")
 DEFAULT_CONFIG = {
     "quiet": False,
+    "logging": DEFAULT_LOGGING,
     "ignore-multiple-buttons": True,
     "haptic-feedback": True,
     "switch-shortcut": [4, 5, 8, 9],
+    "axis-update-rate": 144,
+    "config-reload-interval": 1.0,
+    "output": "pynput",
     "modules": {
         "config": "data/modules.json",
         "directory": "modules/",
         "blacklisted": [],
+        "order": [],
+        "entry-points": False,
         "initial": "dummy",
         "skip-dummy-cycle": False
     }
 }
 
+
+class AxisCoalescer:
+    def __init__(self, update_rate: float):
+        self.interval = 1.0 / update_rate
+        self.pending = {}
+        self.delivered = 0
+        self.dropped = 0
+        self.active = False
+        self.thread = None
+        self._lock = Lock()
+        self._wake = Event()
+
+    def push(self, key: Key, session: Session):
+        if key.keytype == AXIS:
+            slot = (session.instance_id, key.number)
+            with self._lock:
+                if slot in self.pending:
+                    self.dropped += 1
+                self.pending[slot] = (session, key)
+            self._wake.set()
+            return
+
+        # buttons and hats are delivered immediately, after any axis values that arrived before them
+        with self._lock:
+            self._flush()
+            self.delivered += 1
+            session.dispatcher.dispatch(key)
+
+    def start(self):
+        if self.active:
+            return
+        self.active = True
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.active = False
+        self._wake.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=0.1)
+
+    def _run(self):
+        while self.active:
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                self._flush()
+            sleep(self.interval)
+
+    def _flush(self):
+        if not self.pending:
+            return
+        snapshot, self.pending = self.pending, {}
+        self.delivered += len(snapshot)
+        # one flush thread serves every controller, each session gets its own batch
+        batches = {}
+        for session, key in snapshot.values():
+            batches.setdefault(session, []).append(key)
+        for session, keys in batches.items():
+            session.dispatcher.dispatch_axes(keys)
+
+
 class Core:    
-    def __init__(self):
-        self.config = DEFAULT_CONFIG
-        self.modules = [Dummy()]
-        self.current_module = self.modules[0]
-        self.keyboard = Controller()
-        self.haptic = None
-        self.pressed_buttons = set()
+    def __init__(self, stats: Stats = None):
+        self.config = freeze(DEFAULT_CONFIG)
+        self.stats = stats
+        self.logger = get_logger()
+        self.logs = LogWriter()
+        self.logs.start()
+        self.store = ConfigStore(CONFIG_FILE, DEFAULT_CONFIG, self._log)
+        self.store.subscribe(self._on_config_changed)
+        self.modules = [ModuleSpec.from_class(Dummy)]
+        self.modules[0].activate(None)
+        self.positions = {self.modules[0].name: 0}
+        self.initial_spec = None
+        self.sessions = {}
+        self.module_users = {}
+        self.ignored = 0
+        self.switcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="module-switch")
+        self._switch_lock = Lock()
+        self.output = PynputBackend()
+        self.loop = None
+        self.recorder = None
+        self.state = None
+        self.coalescer = self._build_coalescer()
+        if self.stats:
+            self.stats.add_source(self._stats_counters)
 
     def configure(self, config_file=CONFIG_FILE):
+        self.store.config_file = config_file
         try:
-            with open(config_file, "r") as config:
-                self.config.update(json.load(config))
-        except FileNotFoundError:
-            print(f"warning: config file '{config_file}' does not exist - using defaults")
-
-    def register(self, controller: Joystick):
-        sdl2.SDL_Init(sdl2.SDL_INIT_JOYSTICK | sdl2.SDL_INIT_HAPTIC)
-        if joystick := sdl2.SDL_JoystickOpen(0):
-            haptic = sdl2.SDL_HapticOpenFromJoystick(joystick)
-            if sdl2.SDL_HapticRumbleInit(haptic) == 0:
-                self.haptic = haptic
-                self._log("haptics enabled")
-
-        self.vibrate(delay=0)
-        self._log(f"controller: registered {controller}")
-
-    def unregister(self, controller: Joystick):
-        self.haptic = None
-        self._log(f"controller: unregistered {controller}")
+            self.store.load()
+        except (ConfigError, ValueError) as e:
+            self._log(f"invalid config - using defaults: {e}", level=logging.ERROR)
+        self.config = self.store.config
+        self._configure_logging()
+        self.output = self._build_output()
+        self.coalescer = self._build_coalescer()
 
-    def callback(self, key: Key):
-        # self._log(f"key: {key.keytype=} {key.number=} {key.value=}")
-        if key.keytype == Key.KeyTypes.BUTTON:
-            self.pressed_buttons.add(key.number) if key.value else self.pressed_buttons.discard(key.number)
-
-        if set(self.config["switch-shortcut"]).issubset(self.pressed_buttons):
-            self._log("module: switching after triggering shortcut")
-            self.pressed_buttons.clear()
-            self.switch_module()
+        if reload_interval := self.config["config-reload-interval"]:
+            self.store.watch(reload_interval)
+
+    def run(self):
+        self.loop = EventLoop(self.register, self.unregister, self.callback)
+        self.loop.run()
+
+    def register(self, device_index: int):
+        if not (session := Session.open(device_index)):
+            self._log(f"controller: failed to open device {device_index}: {sdl2.SDL_GetError().decode()}", level=logging.WARNING)
             return
+        if existing := self.sessions.get(session.instance_id):
+            # input can arrive before the device is registered, adopt its handles rather than opening it twice
+            if existing.joystick:
+                session.close()
+                return
+            existing.name, existing.joystick, existing.haptic, existing.haptics = session.name, session.joystick, session.haptic, session.haptics
+            session = existing
+        else:
+            self.add_session(session)
 
-        if key.keytype == Key.KeyTypes.BUTTON and len(self.pressed_buttons) > 1 and self.config["ignore-multiple-buttons"]:
-            self._log(f"callback: ignoring button {key.number} because {self.pressed_buttons} are pressed")
+        if session.haptic:
+            self._log(f"controller: haptics enabled for {session.name}")
+        self.vibrate(session, REGISTERED)
+        self._log(f"controller: registered {session.name} (instance {session.instance_id})")
+
+    def unregister(self, instance_id: int):
+        # SDL_JOYDEVICEREMOVED reports the instance id
+        if not (session := self.sessions.pop(instance_id, None)):
             return
+        self.ignored += session.dispatcher.ignored
+        self.switcher.submit(self._close_session, session)
+        if self.state:
+            self.state.detach(instance_id)
+
+        if not self.sessions and self.coalescer:
+            self.coalescer.stop()
+            self._log(f"coalescer: delivered {self.coalescer.delivered} events, dropped {self.coalescer.dropped} stale axis values")
+        self._log(f"controller: unregistered {session.name} (instance {session.instance_id})")
+
+    def add_session(self, session: Session) -> Session:
+        if self.state and not self.state.attach(session.instance_id):
+            self._log(f"state: no free slot to export {session.name}", level=logging.WARNING)
+        session.current_spec = self.modules[0]
+        session.current_module = session.current_spec.instance
+        session.dispatcher = self._build_dispatcher(session)
+        self.sessions[session.instance_id] = session
+        if self.coalescer:
+            self.coalescer.start()
+        if self.initial_spec:
+            self.switch_module(session, self.initial_spec)
+        return session
+
+    def callback(self, key: Key):
+        if self.recorder:
+            self.recorder.record(key)
+        if not self.stats:
+            self._deliver(key)
+        else:
+            started = self.stats.begin_event()
+            self._deliver(key)
+            self.stats.end_event(started)
+        if self.state:
+            self.state.update(key)
+
+    def _deliver(self, key: Key):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self._log("key: %s %s %s", key.keytype, key.number, key.value, level=logging.DEBUG, kind="axis" if key.keytype == AXIS else "key")
 
-        if self.current_module:
-            self.current_module.on_key(key)
+        instance_id = getattr(key.joystick, "identifier", None)
+        if not (session := self.sessions.get(instance_id)):
+            # events from a device that was never registered (e.g. it failed to open) still get their own state
+            session = self.add_session(Session(instance_id, f"joystick {instance_id}"))
+        if self.coalescer:
+            self.coalescer.push(key, session)
+        else:
+            session.dispatcher.dispatch(key)
 
     def add_modules_from_list(self):
-        for module_class in MODULE_CLASSES:
-            module_name = module_class.__name__.lower()
-            if module_name in self.config["modules"]["blacklisted"]:
-                self._log(f"module: skipping blacklisted '{module_name}'")
+        modules_config = self.config["modules"]
+        for spec in discover_modules(modules_config["directory"], modules_config.get("order", []), modules_config.get("entry-points", False), self._log):
+            if spec.name in modules_config["blacklisted"]:
+                self._log(f"module: skipping blacklisted '{spec.name}'")
                 continue
-            self.add_module(module_class)
-
-    def add_module(self, module_class):
-        module = module_class(self.keyboard)
-        self.modules.append(module)
-        self._log(f"module: added '{module.name}'")
-        if module.name == self.config["modules"]["initial"]:
-            self._log(f"module: setting initial '{module.name}'")
-            self.switch_module(module)
-
-    def switch_module(self, module: Module = None):
-        self.current_module.unload()
-        self.current_module = module if module else self._get_next_module()
-        if not self.current_module.load():
-            print(f"error: failed to load module '{self.current_module.name}'")
-
-    def vibrate(self, strength: float = 0.5, duration: int = 500, count: int = 1, delay: float = 0.5):
-        def _vibrate():
-             for _ in range(count):
-                sleep(delay)
-                sdl2.SDL_HapticRumblePlay(self.haptic, strength, duration)
-
-        if self.haptic and self.config["haptic-feedback"]:
-            Thread(target=_vibrate, daemon=True).start()
-
-    def _get_next_module(self):
-        next_index = (self.modules.index(self.current_module) + 1) % len(self.modules)
-        next_module = self.modules[next_index]
-        if self.config["modules"]["skip-dummy-cycle"] and isinstance(next_module, Dummy):
+            if spec.name in self.positions:
+                continue
+            self.add_module(spec)
+
+    def add_module(self, spec: ModuleSpec):
+        self.positions[spec.name] = len(self.modules)
+        self.modules.append(spec)
+        self._log(f"module: added '{spec.name}'")
+        if spec.name == self.config["modules"]["initial"]:
+            self._log(f"module: setting initial '{spec.name}'")
+            self.initial_spec = spec
+            for session in list(self.sessions.values()):
+                self.switch_module(session, spec)
+
+    def switch_module(self, session: Session, spec: ModuleSpec = None) -> Future:
+        # the session's input goes to the dummy module until the worker has loaded the new one
+        with self._switch_lock:
+            spec = spec if spec else self._get_next_module(session)
+            session.target_index = self.positions[spec.name]
+            session.current_spec = self.modules[0]
+            session.current_module = session.current_spec.instance
+            session.dispatcher.reset()
+            self._bind(session)
+        return self.switcher.submit(self._activate, session, spec, perf_counter_ns())
+
+    def _activate(self, session: Session, spec: ModuleSpec, started: int):
+        if self.sessions.get(session.instance_id) is not session or self.modules[session.target_index] is not spec:
+            return  # superseded by a later switch (or the controller was removed) before it started
+
+        self._release(session)
+        if not (loaded := self._acquire(session, spec)):
+            failed, spec = spec, self.modules[0]
+            self._acquire(session, spec)
+        module = spec.instance
+
+        with self._switch_lock:
+            # a module that failed keeps its place in the cycle (with the dummy standing in) so the next switch moves past it
+            if self.modules[session.target_index] is (spec if loaded else failed):
+                session.current_spec = spec
+                session.current_module = module
+                self._bind(session)
+
+        if self.stats:
+            self.stats.record("core.switch", perf_counter_ns() - started)
+            self.stats.count("switches")
+        self.switcher.submit(self._preload, session)
+
+    def _acquire(self, session: Session, spec: ModuleSpec) -> bool:
+        # modules are shared between controllers, loaded by the first and unloaded by the last to use them
+        users = self.module_users.setdefault(spec.name, set())
+        if not users:
+            if not (module := self._prepare(spec)):
+                return False
+            try:
+                loaded = module.load()
+            except Exception as e:
+                self._log(f"error loading module '{spec.name}': {repr(e)}", level=logging.ERROR)
+                loaded = False
+            if not loaded:
+                # a module that failed to load is unloaded again and never becomes current
+                self._log(f"failed to load module '{spec.name}' - falling back to dummy", level=logging.ERROR)
+                self._unload_failed(module)
+                return False
+
+        users.add(session.instance_id)
+        session.loaded_spec = spec
+        return True
+
+    def _release(self, session: Session):
+        if not (spec := session.loaded_spec):
+            return
+        session.loaded_spec = None
+        users = self.module_users[spec.name]
+        users.discard(session.instance_id)
+        if not users:
+            spec.instance.unload()
+
+    def _close_session(self, session: Session):
+        self._release(session)
+        session.close()
+
+    def _prepare(self, spec: ModuleSpec):
+        # the module's code is only imported the first time it is prepared, isolated modules import it in their own process
+        if spec.instance is None and spec.module_class is None and self.store.module(spec.name).get("process"):
+            spec.instance = ModuleProcess(spec, self.store.config_file, DEFAULT_CONFIG, self.output.name)
+        if not (module := spec.activate(self.output)):
+            self._log(f"failed to import module '{spec.name}': {repr(spec.error)}", level=logging.ERROR)
+            return None
+        module.config_store = self.store
+        module.stats = self.stats
+        return module
+
+    def _preload(self, session: Session):
+        # speculatively import and warm up the next module in the cycle so switching to it is instant
+        if self.sessions.get(session.instance_id) is not session:
+            return
+        spec = self.modules[self._next_index(session.target_index)]
+        if spec.error is not None:
+            return  # the import already failed and was reported, activate() does not retry it
+        if not self.module_users.get(spec.name) and (module := self._prepare(spec)):
+            try:
+                module.preload()
+            except Exception as e:
+                self._log(f"failed to preload module '{spec.name}': {repr(e)}", level=logging.ERROR)
+
+    def _unload_failed(self, module):
+        try:
+            module.unload()
+        except Exception as e:
+            self._log(f"error unloading module '{module.name}': {repr(e)}", level=logging.ERROR)
+
+    def stop_processes(self):
+        for spec in self.modules:
+            if isinstance(spec.instance, ModuleProcess):
+                spec.instance.stop()
+
+    def vibrate(self, session: Session, pattern: RumblePattern):
+        if session.haptics and self.config["haptic-feedback"]:
+            session.haptics.play(pattern)
+
+    def _build_dispatcher(self, session: Session) -> Dispatcher:
+        dispatcher = Dispatcher(self.config["switch-shortcut"], self.config["ignore-multiple-buttons"], lambda: self._on_switch_shortcut(session), self._log)
+        if session.dispatcher:
+            dispatcher.ignored = session.dispatcher.ignored
+        session.dispatcher = dispatcher
+        self._bind(session)
+        return dispatcher
+
+    def _build_coalescer(self):
+        if update_rate := self.config.get("axis-update-rate"):
+            coalescer = AxisCoalescer(update_rate)
+            if previous := getattr(self, "coalescer", None):
+                coalescer.delivered, coalescer.dropped = previous.delivered, previous.dropped
+            return coalescer
+        return None
+
+    def _build_output(self) -> OutputBackend:
+        if (name := self.config["output"]) == self.output.name:
+            return self.output
+        try:
+            output = create_backend(name, self._log)
+        except (ValueError, OSError) as e:
+            self._log(f"output: failed to open '{name}', using {self.output.name}: {e}", level=logging.ERROR)
+            return self.output
+        self.output.close()
+        self._log(f"output: using {name}")
+        return output
+
+    def _bind(self, session: Session):
+        module = session.current_module
+        on_key, on_axes = module.on_key, module.on_axes
+        if self.stats:
+            on_key, on_axes = self.stats.timed(f"{module.name}.on-key", on_key), self.stats.timed(f"{module.name}.on-axes", on_axes)
+        if self.state:
+            speeds = hasattr(module, "mouse_speed")
+            self.state.set_module(session.instance_id, module.name, speeds)
+            if speeds:
+                on_key, on_axes = self._exporting_speeds(session, module, on_key, on_axes)
+        # matching state is per controller, the compiled macros are shared by the module
+        macros = MacroMatcher(module.macros, module.run_macro, on_key, self.post) if module.macros else None
+        session.dispatcher.bind(on_key, on_axes, macros)
+
+    def post(self, callback):
+        # hands work from other threads (hold timers) to the input thread, so modules only ever see input from one thread;
+        # without a running event loop (replays) whichever thread delivers input runs it directly
+        if (loop := self.loop) and loop.active:
+            loop.post(callback)
+        else:
+            callback()
+
+    def _exporting_speeds(self, session: Session, module, on_key, on_axes):
+        # the speeds are read back once the module has handled the input, on whichever thread delivered it
+        instance_id, publish = session.instance_id, self.state.set_speeds
+
+        def exporting_on_key(key: Key):
+            on_key(key)
+            publish(instance_id, module.mouse_speed, module.scroll_speed)
+
+        def exporting_on_axes(keys: list):
+            on_axes(keys)
+            publish(instance_id, module.mouse_speed, module.scroll_speed)
+        return exporting_on_key, exporting_on_axes
+
+    def _stats_counters(self) -> dict:
+        sessions = list(self.sessions.values())
+        counters = {"dispatch.ignored": self.ignored + sum(session.dispatcher.ignored for session in sessions), "controllers": len(sessions), "threads": active_count(),
+                    "output.events": self.output.written, "output.batches": self.output.batches}
+        if self.loop:
+            counters["loop.wakeups"] = self.loop.wakeups
+            counters["loop.idle-wakeups"] = self.loop.idle_wakeups
+        if self.state:
+            counters["state.updates"] = self.state.updates
+        if self.coalescer:
+            counters["coalescer.delivered"] = self.coalescer.delivered
+            counters["coalescer.dropped"] = self.coalescer.dropped
+        return counters
+
+    def _on_config_changed(self, section):
+        if section is CORE_SECTION:
+            self.config = self.store.config
+            self._configure_logging()
+            if self.config["output"] != self.output.name:
+                self._log("output: backend changes are applied on restart", level=logging.WARNING)
+            running = self.coalescer and self.coalescer.active
+            if running:
+                self.coalescer.stop()
+            for session in list(self.sessions.values()):
+                self._build_dispatcher(session)
+            self.coalescer = self._build_coalescer()
+            if running and self.coalescer:
+                self.coalescer.start()
+            return
+
+        # only the affected module recompiles, and only if it has been activated already
+        for spec in self.modules:
+            if spec.name == section and spec.instance:
+                spec.instance.reconfigure()
+                with self._switch_lock:
+                    for session in list(self.sessions.values()):
+                        if session.current_spec is spec:
+                            self._bind(session)
+
+    def _configure_logging(self):
+        try:
+            self.logs.configure(self.config["logging"], self.config["quiet"])
+        except ValueError as e:
+            self._log(f"invalid logging config: {e}", level=logging.ERROR)
+
+    def _on_switch_shortcut(self, session: Session):
+        self._log(f"module: switching {session.name} after triggering shortcut")
+        self.switch_module(session)
+
+    def _get_next_module(self, session: Session):
+        next_index = self._next_index(session.target_index)
+        self.vibrate(session, module_pattern(next_index))
+        return self.modules[next_index]
+
+    def _next_index(self, index: int) -> int:
+        next_index = (index + 1) % len(self.modules)
+        if self.config["modules"]["skip-dummy-cycle"] and self.modules[next_index].module_class is Dummy:
             next_index = (next_index + 1) % len(self.modules)
-            next_module = self.modules[next_index]
-        self.vibrate(0.9, 100, next_index + 1, 0.25)
-        return next_module
+        return next_index
 
-    def _log(self, message: str):
-        if not self.config.get("quiet"):
-            print(message)
+    def _log(self, message: str, *args, level: int = logging.INFO, kind: str = None):
+        # records are queued for the writer thread so the input callback never blocks on stdout
+        self.logger.log(level, message, *args, extra={"kind": kind})
 
 
 if __name__ == "__main__":
-    core = Core()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stats", action="store_true", help="collect latency statistics and log them on SIGUSR1 and exit")
+    parser.add_argument("--stats-socket", metavar="PATH", help="also serve statistics as JSON on a unix socket")
+    parser.add_argument("--record", metavar="PATH", help="append every controller event to a trace file (see replay.py)")
+    parser.add_argument("--state", metavar="PATH", help="publish live controller state to a memory-mapped file (see state.py), e.g. under /dev/shm")
+    arguments = parser.parse_args()
+
+    stats = Stats() if arguments.stats or arguments.stats_socket else None
+    core = Core(stats)
     core.configure()
+    atexit.register(lambda: core.output.close())
+    atexit.register(core.stop_processes)
+    if arguments.record:
+        core.recorder = TraceRecorder(arguments.record)
+        atexit.register(core.recorder.close)
+        core._log(f"recording controller events to {arguments.record}")
+    if arguments.state:
+        core.state = StateExport(arguments.state)
+        atexit.register(core.state.close)
+        core._log(f"publishing controller state to {arguments.state}")
+    if stats:
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: core._log(stats.report()))
+        if arguments.stats_socket:
+            server = StatsServer(stats, arguments.stats_socket, core._log)
+            server.start()
+            atexit.register(server.stop)
+        atexit.register(lambda: core._log(stats.report()))
     core.add_modules_from_list()
-    # core.switch_module()
-    run_event_loop(core.register, core.unregister, core.callback)
+    core.run()
@@ -0,0 +1,63 @@
+from events import BUTTON, HAT, Key
+
+
+def button_mask(buttons) -> int:
+    mask = 0
+    for button in buttons:
+        mask |= 1 << button
+    return mask
+
+
+def mask_buttons(mask: int) -> list:
+    return [button for button in range(mask.bit_length()) if mask >> button & 1]
+
+
+class Dispatcher:
+    def __init__(self, switch_shortcut, ignore_multiple_buttons: bool, on_switch, log):
+        self.switch_mask = button_mask(switch_shortcut)
+        self.ignore_multiple_buttons = ignore_multiple_buttons
+        self.on_switch = on_switch
+        self.pressed = 0
+        self.handler = None
+        self.axes_handler = None
+        self.macros = None
+        self.ignored = 0
+        self._log = log
+
+    def bind(self, handler, axes_handler=None, macros=None):
+        if self.macros:
+            self.macros.reset()
+        self.handler = handler
+        self.axes_handler = axes_handler
+        self.macros = macros
+
+    def reset(self):
+        self.pressed = 0
+        if self.macros:
+            self.macros.reset()
+
+    def dispatch(self, key: Key):
+        if key.keytype == BUTTON:
+            bit = 1 << key.number
+            pressed = self.pressed = (self.pressed | bit) if key.value else (self.pressed & ~bit)
+
+            # subset match: extra buttons held alongside the shortcut still switch
+            if self.switch_mask and pressed & self.switch_mask == self.switch_mask:
+                self.pressed = 0
+                self.on_switch()
+                return
+
+            if self.macros and self.macros.feed(key, pressed):
+                return
+
+            if pressed & (pressed - 1) and self.ignore_multiple_buttons:
+                self.ignored += 1
+                self._log("callback: ignoring button %s because %s are pressed", key.number, mask_buttons(pressed), kind="key")
+                return
+        elif key.keytype == HAT and self.macros and self.macros.feed(key, self.pressed):
+            return
+
+        self.handler(key)
+
+    def dispatch_axes(self, keys: list):
+        self.axes_handler(keys)
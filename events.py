@@ -0,0 +1,151 @@
+from collections import deque, namedtuple
+import ctypes
+import sdl2
+
+
+class Key:
+    # the key types and hat values of pyjoystick's Key, so modules can use them without importing pyjoystick (and
+    # the asyncio and resource loaders it pulls in) on startup
+    class KeyTypes:
+        AXIS = "Axis"
+        BUTTON = "Button"
+        HAT = "Hat"
+
+    HAT_CENTERED = 0
+    HAT_UP = 1
+    HAT_RIGHT = 2
+    HAT_DOWN = 4
+    HAT_LEFT = 8
+    HAT_RIGHTUP = 3
+    HAT_RIGHTDOWN = 6
+    HAT_LEFTUP = 9
+    HAT_LEFTDOWN = 12
+
+
+AXIS = Key.KeyTypes.AXIS
+BUTTON = Key.KeyTypes.BUTTON
+HAT = Key.KeyTypes.HAT
+
+# Python only runs signal handlers (Ctrl+C, the SIGUSR1 stats report) between waits, so this bounds how late they run
+WAIT_TIMEOUT = 250
+TRIGGERS = (sdl2.SDL_CONTROLLER_AXIS_TRIGGERLEFT, sdl2.SDL_CONTROLLER_AXIS_TRIGGERRIGHT)
+
+# the same four fields modules read from a pyjoystick Key, as a plain tuple
+InputEvent = namedtuple("InputEvent", ("keytype", "number", "value", "joystick"))
+
+
+class Device:
+    # one per connected controller, every event from it shares this instead of building its own joystick object
+    __slots__ = ("identifier", "triggers")
+
+    def __init__(self, identifier: int, triggers: frozenset = frozenset()):
+        self.identifier = identifier
+        self.triggers = triggers
+
+    def __repr__(self):
+        return f"Device({self.identifier})"
+
+
+class EventLoop:
+    # blocks in SDL_WaitEventTimeout and turns joystick events into InputEvent tuples, opening the devices
+    # (and their haptics) is left to the add callback so there is only ever one handle per controller
+    def __init__(self, add, remove, deliver, timeout: int = WAIT_TIMEOUT):
+        self.add = add
+        self.remove = remove
+        self.deliver = deliver
+        self.timeout = timeout
+        self.devices = {}
+        self.active = False
+        self.wakeups = 0
+        self.idle_wakeups = 0
+        self.events = 0
+        self.posted = deque()
+
+    @staticmethod
+    def init():
+        sdl2.SDL_SetHint(sdl2.SDL_HINT_JOYSTICK_ALLOW_BACKGROUND_EVENTS, b"1")
+        if sdl2.SDL_Init(sdl2.SDL_INIT_JOYSTICK | sdl2.SDL_INIT_GAMECONTROLLER | sdl2.SDL_INIT_HAPTIC) != 0:
+            raise RuntimeError(f"failed to initialise SDL: {sdl2.SDL_GetError().decode()}")
+
+    def run(self):
+        self.init()
+        self.active = True
+        event = sdl2.SDL_Event()
+        reference = ctypes.byref(event)
+        wait = sdl2.SDL_WaitEventTimeout
+        while self.active:
+            self.wakeups += 1
+            if wait(reference, self.timeout):
+                self.handle(event)
+            else:
+                self.idle_wakeups += 1
+
+    def stop(self):
+        # wakes the wait immediately rather than after the timeout
+        self.active = False
+        event = sdl2.SDL_Event()
+        event.type = sdl2.SDL_QUIT
+        sdl2.SDL_PushEvent(ctypes.byref(event))
+
+    def post(self, callback):
+        # runs the callback on the loop's thread, in order with the input queued before it (SDL_PushEvent is thread-safe)
+        self.posted.append(callback)
+        event = sdl2.SDL_Event()
+        event.type = sdl2.SDL_USEREVENT
+        sdl2.SDL_PushEvent(ctypes.byref(event))
+
+    def handle(self, event: sdl2.SDL_Event):
+        kind = event.type
+        if kind == sdl2.SDL_JOYAXISMOTION:
+            motion = event.jaxis
+            device = self.devices.get(motion.which) or self._device(motion.which)
+            # the same scaling as pyjoystick: sticks rest at 0 in -1..1, triggers rest at 0 in 0..1
+            if motion.axis in device.triggers:
+                value = (motion.value + 32768) / 65535
+            else:
+                value = (motion.value + 32768) / 32767.5 - 1
+            self.deliver(InputEvent(AXIS, motion.axis, value, device))
+        elif kind == sdl2.SDL_JOYBUTTONDOWN or kind == sdl2.SDL_JOYBUTTONUP:
+            button = event.jbutton
+            self.deliver(InputEvent(BUTTON, button.button, button.state, self.devices.get(button.which) or self._device(button.which)))
+        elif kind == sdl2.SDL_JOYHATMOTION:
+            hat = event.jhat
+            self.deliver(InputEvent(HAT, hat.hat, hat.value, self.devices.get(hat.which) or self._device(hat.which)))
+        elif kind == sdl2.SDL_JOYDEVICEADDED:
+            # the only event that reports a device index, everything after it uses the instance id
+            index = event.jdevice.which
+            instance_id = sdl2.SDL_JoystickGetDeviceInstanceID(index)
+            self.devices[instance_id] = Device(instance_id, self._trigger_axes(index))
+            self.add(index)
+            return
+        elif kind == sdl2.SDL_JOYDEVICEREMOVED:
+            self.devices.pop(event.jdevice.which, None)
+            self.remove(event.jdevice.which)
+            return
+        elif kind == sdl2.SDL_USEREVENT:
+            while self.posted:
+                self.posted.popleft()()
+            return
+        elif kind == sdl2.SDL_QUIT:
+            self.active = False
+            return
+        else:
+            return
+        self.events += 1
+
+    def _device(self, instance_id: int) -> Device:
+        # input from a device that was attached before its added event was seen
+        device = self.devices[instance_id] = Device(instance_id)
+        return device
+
+    @staticmethod
+    def _trigger_axes(index: int) -> frozenset:
+        if not sdl2.SDL_IsGameController(index) or not (controller := sdl2.SDL_GameControllerOpen(index)):
+            return frozenset()
+        axes = set()
+        for trigger in TRIGGERS:
+            bind = sdl2.SDL_GameControllerGetBindForAxis(controller, trigger)
+            if bind.bindType == sdl2.SDL_CONTROLLER_BINDTYPE_AXIS:
+                axes.add(bind.value.axis)
+        sdl2.SDL_GameControllerClose(controller)
+        return frozenset(axes)
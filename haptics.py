@@ -0,0 +1,89 @@
+from threading import Thread, Condition
+import sdl2
+
+
+class RumblePattern:
+    def __init__(self, strength: float = 0.5, duration: int = 500, count: int = 1, gap: float = 0.0, delay: float = 0.0):
+        self.strength = strength
+        self.duration = duration
+        self.count = count
+        self.gap = gap
+        self.delay = delay
+
+    def steps(self):
+        # (seconds to wait, strength, milliseconds) for each pulse, the gap is measured from the end of the previous pulse
+        for pulse in range(self.count):
+            yield (self.delay if pulse == 0 else self.duration / 1000 + self.gap), self.strength, self.duration
+
+    def __repr__(self):
+        return f"RumblePattern({self.strength}, {self.duration}ms x{self.count}, gap={self.gap}s, delay={self.delay}s)"
+
+
+REGISTERED = RumblePattern(0.5, 500)
+
+
+def module_pattern(index: int) -> RumblePattern:
+    # one short pulse per position in the module cycle
+    return RumblePattern(0.9, 100, index + 1, gap=0.15, delay=0.25)
+
+
+class HapticWorker:
+    # one parked thread per device, a new pattern pre-empts whatever is still playing
+    def __init__(self, haptic, name: str, play=None, stop=None):
+        self.haptic = haptic
+        self.pending = None
+        self.generation = 0
+        self.active = True
+        self.played = 0
+        self.preempted = 0
+        self._play = play or sdl2.SDL_HapticRumblePlay
+        self._stop = stop or sdl2.SDL_HapticRumbleStop
+        self._playing = False
+        self._condition = Condition()
+        self.thread = Thread(target=self._run, name=f"haptics-{name}", daemon=True)
+        self.thread.start()
+
+    def play(self, pattern: RumblePattern):
+        with self._condition:
+            if self._playing or self.pending:
+                self.preempted += 1
+            self.pending = pattern
+            self.generation += 1
+            self._condition.notify()
+
+    def cancel(self):
+        with self._condition:
+            self.pending = None
+            self.generation += 1
+            self._condition.notify()
+
+    def stop(self, timeout: float = 1.0):
+        with self._condition:
+            self.active = False
+            self.pending = None
+            self._condition.notify()
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self.active and not self.pending:
+                    self._condition.wait()
+                if not self.active:
+                    break
+                pattern, self.pending = self.pending, None
+                generation = self.generation
+                self._playing = True
+            self._run_pattern(pattern, generation)
+            self._playing = False
+        self._stop(self.haptic)
+
+    def _run_pattern(self, pattern: RumblePattern, generation: int):
+        for wait, strength, duration in pattern.steps():
+            with self._condition:
+                # waiting on the condition means a newer pattern or shutdown interrupts the gap immediately
+                if self._condition.wait_for(lambda: self.generation != generation or not self.active, wait):
+                    self._stop(self.haptic)
+                    return
+            self._play(self.haptic, strength, duration)
+            self.played += 1
@@ -0,0 +1,107 @@
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+import atexit
+import logging
+import sys
+import time
+
+
+LOGGER_NAME = "mapper"
+DEFAULT_LOGGING = {
+    "level": "info",
+    "rate-limits": {
+        "key": 20,
+        "axis": 5
+    }
+}
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def parse_level(level) -> int:
+    if isinstance(level, int):
+        return level
+    if isinstance(level, str) and isinstance(value := logging.getLevelName(level.upper()), int):
+        return value
+    raise ValueError(f"unknown log level '{level}'")
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, limits: dict = None):
+        super().__init__()
+        self.limits = dict(limits or {})
+        self.buckets = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # token bucket per message kind (e.g. 'key', 'axis'), records without a kind are never limited
+        kind = getattr(record, "kind", None)
+        if kind is None or (rate := self.limits.get(kind)) is None:
+            return True
+
+        now = time.monotonic()
+        tokens, updated, dropped = self.buckets.get(kind, (rate, now, 0))
+        tokens = min(rate, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self.buckets[kind] = (tokens, now, dropped + 1)
+            self.suppressed += 1
+            return False
+
+        if dropped:
+            record.msg = f"{record.msg} (+{dropped} similar suppressed)"
+        self.buckets[kind] = (tokens - 1, now, 0)
+        return True
+
+
+class _Formatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        if prefix := record.name.partition(".")[2]:
+            message = f"{prefix}: {message}"
+        if record.levelno >= logging.WARNING:
+            message = f"{record.levelname.lower()}: {message}"
+        return message
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatting is left to the writer thread, records never leave the process
+        return record
+
+
+class LogWriter:
+    def __init__(self, stream=None):
+        self.queue = SimpleQueue()
+        self.rate_limit = RateLimitFilter()
+        self.handler = _QueueHandler(self.queue)
+        self.handler.addFilter(self.rate_limit)
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(_Formatter("%(message)s"))
+        self.listener = QueueListener(self.queue, output)
+        self.active = False
+
+        self.logger = get_logger()
+        self.logger.handlers[:] = [self.handler]
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def configure(self, options: dict = DEFAULT_LOGGING, quiet: bool = False):
+        level = parse_level(options.get("level", DEFAULT_LOGGING["level"]))
+        self.logger.setLevel(max(level, logging.WARNING) if quiet else level)
+        self.rate_limit.limits = dict(options.get("rate-limits", {}))
+        self.rate_limit.buckets.clear()
+
+    def start(self):
+        if self.active:
+            return
+        self.active = True
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        # drains anything still queued before the writer thread exits
+        if self.active:
+            self.active = False
+            self.listener.stop()
@@ -1,9 +1 @@
-from .module_media import Media
-from .module_remote import Remote
-from .module_mouse import Mouse
-
-MODULE_CLASSES = [
-    Media,
-    Remote,
-    Mouse
-]
\ No newline at end of file
+from .loader import ModuleSpec, discover_modules
@@ -0,0 +1,106 @@
+from array import array
+from config import ConfigError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+LINEAR_CURVE = {"type": "exponent", "exponent": 1.0}
+
+_maximum = numpy.maximum if numpy else max
+_minimum = numpy.minimum if numpy else min
+
+
+def curve_function(spec: dict):
+    kind = spec.get("type", "exponent")
+    if kind == "exponent":
+        exponent = float(spec.get("exponent", 1.0))
+        return lambda n: n ** exponent
+    if kind == "bezier":
+        x1, y1, x2, y2 = (float(point) for point in spec.get("points", (0.25, 0.25, 0.75, 0.75)))
+        return lambda n: _bezier(n, x1, y1, x2, y2)
+    raise ValueError(f"unknown curve type '{kind}'")
+
+
+def _cubic(t, p1, p2):
+    # one axis of a cubic bezier anchored at (0, 0) and (1, 1)
+    u = 1.0 - t
+    return 3 * u * u * t * p1 + 3 * u * t * t * p2 + t * t * t
+
+
+def _bezier(n, x1, y1, x2, y2):
+    # bisect for t where x(t) == n; written without branches so it also runs over numpy arrays
+    lo, hi = n * 0.0, n * 0.0 + 1.0
+    for _ in range(32):
+        t = (lo + hi) * 0.5
+        below = _cubic(t, x1, x2) < n
+        lo = lo + (t - lo) * below
+        hi = t + (hi - t) * below
+    return _cubic((lo + hi) * 0.5, y1, y2)
+
+
+def _build_table(function, size: int) -> array:
+    if numpy:
+        table = array("d")
+        table.frombytes(numpy.asarray(function(numpy.arange(size, dtype=float)), dtype="d").tobytes())
+        return table
+    return array("d", (function(float(index)) for index in range(size)))
+
+
+class ResponseTables:
+    def __init__(self, options: dict):
+        size = int(options.get("curve-resolution", 4096))
+        inner = float(options.get("radial-deadzone", 0.0))
+        outer = options.get("outer-deadzone")
+        span = (outer or 1.0) - inner
+        if size < 2:
+            raise ConfigError(f"'curve-resolution' should be at least 2, not {size}")
+        if span <= 0:
+            raise ConfigError(f"'outer-deadzone' ({outer or 1.0}) should be larger than 'radial-deadzone' ({inner})")
+        acceleration = (options["acceleration"] - 1.0) * options["sensitivity"]
+        movement_curve = curve_function(options.get("response-curve", LINEAR_CURVE))
+        scroll_curve = curve_function(options.get("scroll-curve", LINEAR_CURVE))
+
+        # movement tables are indexed by squared stick magnitude (0..2) so lookups need no sqrt
+        self.size = size
+        self.movement_scale = (size - 1) / 2.0
+
+        def magnitude(index):
+            radius = (index / self.movement_scale) ** 0.5
+            return _minimum(radius, outer) if outer else radius, radius
+
+        def curved(index):
+            radius, raw = magnitude(index)
+            n = _maximum(radius - inner, 0.0) / span
+            return movement_curve(_minimum(n, 1.0)) * _maximum(n, 1.0), raw
+
+        def base(index):
+            value, raw = curved(index)
+            return value / _maximum(raw, 1e-9)
+
+        def accelerated(index):
+            value, raw = curved(index)
+            return value / _maximum(raw, 1e-9) * value * acceleration
+
+        # distance = stick * (movement_base[i] + movement_accel[i] * multiplier)
+        self.movement_base = _build_table(base, size)
+        self.movement_accel = _build_table(accelerated, size)
+
+        # scroll tables are indexed by the magnitude of a single axis (0..1)
+        self.scroll_scale = float(size - 1)
+        sensitivity = options["scroll-sensitivity"]
+        self.scroll = _build_table(lambda index: scroll_curve(index / self.scroll_scale) * sensitivity, size)
+
+    def movement_gain(self, x: float, y: float, multiplier: float) -> float:
+        index = int((x * x + y * y) * self.movement_scale + 0.5)
+        if index >= self.size:
+            index = self.size - 1
+        return self.movement_base[index] + self.movement_accel[index] * multiplier
+
+    def scroll_speed(self, value: float) -> float:
+        index = int(abs(value) * self.scroll_scale + 0.5)
+        if index >= self.size:
+            index = self.size - 1
+        return self.scroll[index] if value > 0 else -self.scroll[index]
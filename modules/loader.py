@@ -0,0 +1,98 @@
+from pathlib import Path
+import importlib
+import importlib.util
+import ast
+
+
+ENTRY_POINT_GROUP = "modular_controller_mapper.modules"
+PACKAGE_DIRECTORY = Path(__file__).resolve().parent
+
+
+class ModuleSpec:
+    def __init__(self, name: str, class_name: str, import_path: str = None, file_path: Path = None, module_class=None):
+        self.name = name
+        self.class_name = class_name
+        self.import_path = import_path
+        self.file_path = file_path
+        self.module_class = module_class
+        self.instance = None
+        self.error = None
+
+    @classmethod
+    def from_class(cls, module_class):
+        return cls(module_class.__name__.lower(), module_class.__name__, module_class=module_class)
+
+    def activate(self, output):
+        # imports the module's code on first use only; failures are kept so they are reported once
+        if self.instance is None and self.error is None:
+            try:
+                self.instance = self._load_class()(output)
+            except Exception as e:
+                self.error = e
+        return self.instance
+
+    def _load_class(self):
+        if self.module_class:
+            return self.module_class
+
+        if self.file_path:
+            spec = importlib.util.spec_from_file_location(f"mapper_plugins.{self.file_path.stem}", self.file_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        else:
+            module = importlib.import_module(self.import_path)
+
+        self.module_class = getattr(module, self.class_name)
+        return self.module_class
+
+    def __repr__(self):
+        return f"ModuleSpec({self.name!r}, {self.import_path or self.file_path or self.module_class})"
+
+
+def discover_modules(directory: str, order: list = (), entry_points: bool = False, log=print) -> list:
+    specs = {}
+    # importlib.metadata is comparatively slow to import, so entry points are opt-in
+    for spec in _scan_directory(Path(directory)) + (_scan_entry_points(log) if entry_points else []):
+        if spec.name in specs:
+            log(f"module: ignoring duplicate '{spec.name}' from {spec}")
+            continue
+        specs[spec.name] = spec
+
+    # explicitly ordered modules come first, the rest follow alphabetically
+    ranking = {name: index for index, name in enumerate(order)}
+    return sorted(specs.values(), key=lambda spec: (ranking.get(spec.name, len(ranking)), spec.name))
+
+
+def _scan_directory(directory: Path) -> list:
+    specs = []
+    in_package = directory.resolve() == PACKAGE_DIRECTORY
+    for file_path in sorted(directory.glob("module_*.py")):
+        # read class names from the source so discovery does not import any dependencies
+        try:
+            tree = ast.parse(file_path.read_text(), str(file_path))
+        except (OSError, SyntaxError):
+            continue
+
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and any(isinstance(base, ast.Name) and base.id == "Module" for base in node.bases):
+                if in_package:
+                    specs.append(ModuleSpec(node.name.lower(), node.name, import_path=f"{__package__}.{file_path.stem}"))
+                else:
+                    specs.append(ModuleSpec(node.name.lower(), node.name, file_path=file_path))
+    return specs
+
+
+def _scan_entry_points(log) -> list:
+    try:
+        from importlib.metadata import entry_points
+        found = entry_points()
+        group = found.select(group=ENTRY_POINT_GROUP) if hasattr(found, "select") else found.get(ENTRY_POINT_GROUP, [])
+    except Exception as e:
+        log(f"module: failed to read entry points: {repr(e)}")
+        return []
+
+    specs = []
+    for entry_point in group:
+        import_path, _, class_name = entry_point.value.partition(":")
+        specs.append(ModuleSpec(entry_point.name.lower(), class_name, import_path=import_path))
+    return specs
@@ -0,0 +1,256 @@
+from collections import deque
+from collections.abc import Mapping
+from config import ConfigError
+from dispatch import button_mask
+from events import BUTTON, HAT, InputEvent
+from modules.mappings import HAT_VALUES, parse_action
+from modules.repeat import shared_wheel
+from threading import Lock
+import time
+
+DEFAULT_WINDOW = 0.5
+DEFAULT_HOLD_TIME = 0.3
+
+
+class Macro:
+    __slots__ = ("name", "actions", "length", "window")
+
+    def __init__(self, name: str, actions: tuple, length: int = 1, window: float = DEFAULT_WINDOW):
+        self.name = name
+        self.actions = actions
+        self.length = length
+        self.window = window
+
+    def __repr__(self):
+        return f"Macro({self.name})"
+
+
+class TapHold:
+    __slots__ = ("time", "tap", "hold")
+
+    def __init__(self, hold_time: float = DEFAULT_HOLD_TIME, tap: Macro = None, hold: Macro = None):
+        self.time = hold_time
+        self.tap = tap
+        self.hold = hold
+
+
+class MacroSet:
+    # chords are an exact lookup on the pressed-button mask, sequences an Aho-Corasick automaton with a full
+    # transition table, so each event costs a couple of dict lookups however many macros are defined
+    def __init__(self):
+        self.chords = {}
+        self.taps = {}
+        self.transitions = [{}]
+        self.matches = [None]
+        self.windows = [0.0]
+        self.longest = 0
+
+    def add_chord(self, buttons, macro: Macro):
+        # keyed the same way as the dispatcher's pressed-button mask
+        self.chords[button_mask(buttons)] = macro
+
+    def add_sequence(self, tokens: list, macro: Macro):
+        state = 0
+        for token in tokens:
+            if (following := self.transitions[state].get(token)) is None:
+                following = self.transitions[state][token] = len(self.transitions)
+                self.transitions.append({})
+                self.matches.append(None)
+                self.windows.append(0.0)
+            state = following
+            self.windows[state] = max(self.windows[state], macro.window)
+        self.matches[state] = macro
+        self.longest = max(self.longest, len(tokens))
+
+    def add_tap_hold(self, button: int, hold_time: float = None, tap: Macro = None, hold: Macro = None):
+        entry = self.taps.setdefault(button, TapHold())
+        if hold_time is not None:
+            entry.time = hold_time
+        entry.tap = tap or entry.tap
+        entry.hold = hold or entry.hold
+
+    def build(self) -> "MacroSet":
+        # breadth-first failure links, folded into the transition table so matching never backtracks
+        goto = [dict(transitions) for transitions in self.transitions]
+        failure = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, following in goto[state].items():
+                queue.append(following)
+                fallback = failure[state]
+                while fallback and token not in goto[fallback]:
+                    fallback = failure[fallback]
+                failure[following] = goto[fallback].get(token, 0) if state else 0
+
+        order = []
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            queue.extend(goto[state].values())
+
+        for state in order:
+            if state:
+                # inherit the failure state's moves and the longest match ending here
+                self.transitions[state] = {**self.transitions[failure[state]], **goto[state]}
+                if self.matches[state] is None:
+                    self.matches[state] = self.matches[failure[state]]
+                self.windows[state] = max(self.windows[state], self.windows[failure[state]])
+        return self
+
+    def __bool__(self):
+        return bool(self.chords or self.taps or self.longest)
+
+
+class MacroMatcher:
+    # per-controller matching state for one MacroSet, consumes the events that complete or belong to a macro
+    def __init__(self, macros: MacroSet, run, handler, post):
+        self.macros = macros
+        self.run = run
+        self.handler = handler
+        self.post = post
+        self.state = 0
+        self.times = deque(maxlen=max(macros.longest, 1))
+        self.held = {}
+        self.fired = 0
+        self.wheel = shared_wheel() if macros.taps else None
+        # expired hold timers are posted back to the input thread, so they are ordered with releases and modules only see
+        # one thread; the lock covers reset() from the switch worker
+        self._lock = Lock()
+
+    def reset(self):
+        self.state = 0
+        self.times.clear()
+        with self._lock:
+            for timer, _ in self.held.values():
+                if timer:
+                    self.wheel.cancel(timer)
+            self.held.clear()
+
+    def feed(self, key: InputEvent, pressed: int) -> bool:
+        macros = self.macros
+        if key.keytype == BUTTON:
+            if key.value:
+                if (macro := macros.chords.get(pressed)) is not None:
+                    self._fire(macro)
+                    return True
+                if self._advance(key.number):
+                    return True
+                if key.number in macros.taps:
+                    self._hold(key, macros.taps[key.number])
+                    return True
+            elif key.number in self.held:
+                self._release(key)
+                return True
+        elif key.keytype == HAT and key.value:
+            return self._advance((HAT, key.value))
+        return False
+
+    def _advance(self, token) -> bool:
+        now = time.perf_counter()
+        state = self.state
+        if self.times and now - self.times[-1] > self.macros.windows[state]:
+            state = 0
+        state = self.state = self.macros.transitions[state].get(token, 0)
+        self.times.append(now)
+        if (macro := self.macros.matches[state]) is None:
+            return False
+
+        # every step of the sequence has to land within the macro's own window
+        times = self.times
+        for step in range(len(times) - macro.length, len(times) - 1):
+            if times[step + 1] - times[step] > macro.window:
+                return False
+        self.state = 0
+        self.times.clear()
+        self._fire(macro)
+        return True
+
+    def _hold(self, key: InputEvent, entry: TapHold):
+        def expired():
+            with self._lock:
+                # a release queued ahead of the expiry has already fired the tap
+                if self.held.get(key.number, (None,))[0] is not timer:
+                    return
+                self.held[key.number] = (None, True)
+            if entry.hold:
+                self._fire(entry.hold)
+            else:
+                self.handler(key)
+
+        with self._lock:
+            timer = self.wheel.schedule(time.perf_counter() + entry.time, lambda _: self.post(expired))
+            self.held[key.number] = (timer, False)
+
+    def _release(self, key: InputEvent):
+        with self._lock:
+            held = self.held.pop(key.number, None)
+        if held is not None:
+            self._released(key, *held)
+
+    def _released(self, key: InputEvent, timer, expired: bool):
+        entry = self.macros.taps[key.number]
+        if not expired:
+            self.wheel.cancel(timer)
+            if entry.tap:
+                self._fire(entry.tap)
+            else:
+                # a quick press without a tap macro behaves like the plain mapping
+                self.handler(InputEvent(BUTTON, key.number, 1, key.joystick))
+                self.handler(key)
+        elif not entry.hold:
+            self.handler(key)
+
+    def _fire(self, macro: Macro):
+        self.fired += 1
+        self.run(macro.actions)
+
+
+def compile_macros(definitions) -> MacroSet:
+    macros = MacroSet()
+    for index, definition in enumerate(definitions or ()):
+        if not isinstance(definition, Mapping):
+            raise ConfigError(f"macro {index} should be an object")
+        actions = _parse_actions(definition.get("action"), index)
+        window = float(definition.get("window", DEFAULT_WINDOW))
+
+        if "chord" in definition:
+            buttons = [_parse_button(button, index) for button in definition["chord"]]
+            if len(buttons) < 2:
+                raise ConfigError(f"macro {index}: a chord needs at least two buttons")
+            macros.add_chord(buttons, Macro(f"chord {buttons}", actions))
+        elif "sequence" in definition:
+            tokens = [_parse_token(token, index) for token in definition["sequence"]]
+            if not tokens:
+                raise ConfigError(f"macro {index}: empty sequence")
+            macros.add_sequence(tokens, Macro(f"sequence {list(definition['sequence'])}", actions, len(tokens), window))
+        elif "hold" in definition or "tap" in definition:
+            kind = "hold" if "hold" in definition else "tap"
+            button = _parse_button(definition[kind], index)
+            macro = Macro(f"{kind} {button}", actions)
+            macros.add_tap_hold(button, definition.get("time"), **{kind: macro})
+        else:
+            raise ConfigError(f"macro {index} needs a 'chord', 'sequence', 'hold' or 'tap'")
+    return macros.build()
+
+
+def _parse_actions(action, index: int) -> tuple:
+    actions = action if isinstance(action, (list, tuple)) else [action]
+    if not actions or any(item is None for item in actions):
+        raise ConfigError(f"macro {index} needs an 'action'")
+    return tuple(parse_action(item) for item in actions)
+
+
+def _parse_button(button, index: int) -> int:
+    if isinstance(button, bool) or not isinstance(button, int) or button < 0:
+        raise ConfigError(f"macro {index}: invalid button '{button}'")
+    return button
+
+
+def _parse_token(token, index: int):
+    if isinstance(token, str):
+        if token not in HAT_VALUES or token == "centered":
+            raise ConfigError(f"macro {index}: invalid hat direction '{token}'")
+        return HAT, HAT_VALUES[token]
+    return _parse_button(token, index)
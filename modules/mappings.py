@@ -0,0 +1,185 @@
+from collections.abc import Mapping
+from config import ConfigError
+from events import Key
+from modules.repeat import DEFAULT_REPEAT
+import importlib
+import json
+import sys
+
+
+MOUSE_X = 1
+MOUSE_Y = 2
+MOUSE_THROTTLE = 3
+MOUSE_BOOST = 4
+SCROLL_X = 5
+SCROLL_Y = 6
+
+AXIS_ACTIONS = {
+    "mouse-x": MOUSE_X,
+    "mouse-y": MOUSE_Y,
+    "mouse-throttle": MOUSE_THROTTLE,
+    "mouse-boost": MOUSE_BOOST,
+    "scroll-x": SCROLL_X,
+    "scroll-y": SCROLL_Y
+}
+
+HAT_VALUES = {
+    "centered": Key.HAT_CENTERED,
+    "up": Key.HAT_UP,
+    "right": Key.HAT_RIGHT,
+    "down": Key.HAT_DOWN,
+    "left": Key.HAT_LEFT,
+    "right-up": Key.HAT_RIGHTUP,
+    "right-down": Key.HAT_RIGHTDOWN,
+    "left-up": Key.HAT_LEFTUP,
+    "left-down": Key.HAT_LEFTDOWN
+}
+
+SECTIONS = {
+    "button": Key.KeyTypes.BUTTON,
+    "hat": Key.KeyTypes.HAT,
+    "axis": Key.KeyTypes.AXIS
+}
+
+HAT_SIZE = 16
+
+
+class MappingTable:
+    def __init__(self):
+        self.button = []
+        self.hat = [None] * HAT_SIZE
+        self.axis = []
+        # (delay, interval) auto-repeat settings, indexed the same way as the actions
+        self.button_repeat = []
+        self.hat_repeat = [None] * HAT_SIZE
+        self.axis_repeat = []
+
+    def section(self, keytype) -> list:
+        return getattr(self, _section_name(keytype))
+
+    def set(self, keytype, index: int, action, repeat: tuple = None):
+        name = _section_name(keytype)
+        if index < 0 or (keytype == Key.KeyTypes.HAT and index >= HAT_SIZE):
+            raise ConfigError(f"invalid {name} index {index}")
+        for table, value in ((getattr(self, name), action), (getattr(self, f"{name}_repeat"), repeat)):
+            if index >= len(table):
+                table.extend([None] * (index + 1 - len(table)))
+            table[index] = value
+
+    def items(self):
+        for name, keytype in SECTIONS.items():
+            repeats = getattr(self, f"{name}_repeat")
+            for index, action in enumerate(getattr(self, name)):
+                if action is not None:
+                    yield keytype, index, action, repeats[index]
+
+
+def compile_mappings(defaults: dict, overrides: dict = None, repeats: dict = None, repeat_options: dict = None) -> MappingTable:
+    # defaults use Key.KeyTypes and native actions, overrides use the JSON form from modules.json
+    default_repeat = _parse_repeat(True, repeat_options or DEFAULT_REPEAT)
+    table = MappingTable()
+    for keytype, mapping in defaults.items():
+        repeating = (repeats or {}).get(keytype, ())
+        for index, action in mapping.items():
+            table.set(keytype, index, action, default_repeat if index in repeating else None)
+
+    for section, mapping in (overrides or {}).items():
+        if (keytype := SECTIONS.get(section)) is None:
+            raise ConfigError(f"unknown mapping section '{section}'")
+        for index, token in mapping.items():
+            repeat = None
+            if isinstance(token, Mapping):
+                repeat = _parse_repeat(token.get("repeat", False), repeat_options or DEFAULT_REPEAT)
+                token = token.get("action")
+            table.set(keytype, _parse_index(keytype, index), parse_action(token), repeat)
+    return table
+
+
+def serialise_mappings(table: MappingTable) -> dict:
+    serialised = {}
+    for keytype, index, action, repeat in table.items():
+        if keytype == Key.KeyTypes.HAT:
+            index = next((name for name, value in HAT_VALUES.items() if value == index), index)
+        value = serialise_action(action)
+        if repeat:
+            value = {"action": value, "repeat": {"delay": repeat[0], "rate": 1.0 / repeat[1]}}
+        serialised.setdefault(_section_name(keytype), {})[str(index)] = value
+    return serialised
+
+
+def parse_action(token):
+    if token is None:
+        return None
+    if not isinstance(token, str) or ":" not in token:
+        raise ConfigError(f"invalid mapping '{token}' (expected 'type:value')")
+
+    kind, _, value = token.partition(":")
+    # pynput is only imported once a module's mappings are compiled, not when core starts
+    if kind == "key":
+        from pynput.keyboard import Key as KBKey, KeyCode
+        if len(value) == 1:
+            return KeyCode.from_char(value)
+        if value.startswith("<") and value.endswith(">"):
+            return KeyCode.from_vk(int(value[1:-1]))
+        if (key := getattr(KBKey, value, None)) is not None:
+            return key
+    elif kind == "mouse":
+        from pynput.mouse import Button
+        if (button := getattr(Button, value, None)) is not None:
+            return button
+    elif kind == "webos":
+        return value
+    elif kind == "axis":
+        if (action := AXIS_ACTIONS.get(value)) is not None:
+            return action
+    raise ConfigError(f"unknown mapping '{token}'")
+
+
+def serialise_action(action):
+    if action is None:
+        return None
+    if isinstance(action, str):
+        return f"webos:{action}"
+    if isinstance(action, int):
+        return f"axis:{next(name for name, value in AXIS_ACTIONS.items() if value == action)}"
+
+    from pynput.keyboard import Key as KBKey, KeyCode
+    if isinstance(action, KBKey):
+        return f"key:{action.name}"
+    if isinstance(action, KeyCode):
+        return f"key:{action.char}" if action.char else f"key:<{action.vk}>"
+
+    from pynput.mouse import Button
+    if isinstance(action, Button):
+        return f"mouse:{action.name}"
+    raise ValueError(f"cannot serialise mapping {action!r}")
+
+
+def _parse_repeat(repeat, defaults: dict) -> tuple:
+    if repeat is True:
+        repeat = defaults
+    if not repeat:
+        return None
+    if not isinstance(repeat, Mapping) or repeat.get("rate", defaults["rate"]) <= 0:
+        raise ConfigError(f"invalid repeat settings '{repeat}'")
+    return float(repeat.get("delay", defaults["delay"])), 1.0 / repeat.get("rate", defaults["rate"])
+
+
+def _section_name(keytype) -> str:
+    return keytype.lower()
+
+
+def _parse_index(keytype, index) -> int:
+    if keytype == Key.KeyTypes.HAT and index in HAT_VALUES:
+        return HAT_VALUES[index]
+    try:
+        return int(index)
+    except ValueError:
+        raise ConfigError(f"invalid {_section_name(keytype)} index '{index}'")
+
+
+if __name__ == "__main__":
+    # print a module's default mappings in the modules.json format, e.g. `python -m modules.mappings media`
+    name = sys.argv[1]
+    module = importlib.import_module(f"modules.module_{name}")
+    print(json.dumps(serialise_mappings(compile_mappings(module.DEFAULT_MAPPINGS, repeats=getattr(module, "DEFAULT_REPEATS", None))), indent=4))
@@ -1,15 +1,35 @@
 from abc import ABC, abstractmethod
-from pyjoystick.sdl2 import Key
-from pynput.keyboard import Controller
-import json
+from config import ConfigError, freeze
+from events import Key
+from logger import get_logger
+from modules.macros import compile_macros
+from modules.mappings import compile_mappings
+from modules.output import OutputBackend
+from modules.repeat import Repeater
+import logging
+
+
+BUTTON = Key.KeyTypes.BUTTON
+HAT = Key.KeyTypes.HAT
+AXIS = Key.KeyTypes.AXIS
 
 
 class Module(ABC):
-    def __init__(self, keyboard: Controller, name):
+    default_options = {}
+    default_mappings = {}
+    default_repeats = {}
+
+    def __init__(self, output: OutputBackend, name):
         self.name = name
-        self.keyboard = keyboard
-        self.options = {}
-        self.mappings = {}
+        self.logger = get_logger(f"module-{name}")
+        self.output = output
+        self.config_store = None
+        self.stats = None
+        self.options = freeze(self.default_options)
+        self.mappings = compile_mappings(self.default_mappings, None, self.default_repeats, self.options.get("repeat"))
+        self.macros = None
+        self.held = {}
+        self.repeater = None
 
     @abstractmethod
     def load(self) -> bool:
@@ -17,36 +37,110 @@ class Module(ABC):
         self._load_config()
         return True
 
+    def preload(self):
+        pass
+
     @abstractmethod
     def unload(self) -> bool:
         self._log("unloading")
+        if self.repeater:
+            self._log(f"repeat: {self.repeater.wheel.jitter.summary()}")
         return True
 
     @abstractmethod
     def on_key(self, _: Key):
         pass
 
+    def on_axes(self, keys: list):
+        for key in keys:
+            self.on_key(key)
+
+    def reconfigure(self):
+        self._load_config()
+
     def _get_mapped_key(self, key: Key, map_button_release: bool = False):
-        if not (mapping := self.mappings.get(key.keytype)):
+        keytype = key.keytype
+        if keytype == BUTTON:
+            if key.value == 0 and not map_button_release:
+                return None
+            table, index = self.mappings.button, key.number
+        elif keytype == HAT:
+            table, index = self.mappings.hat, key.value
+        elif keytype == AXIS:
+            table, index = self.mappings.axis, key.number
+        else:
             return None
 
-        if key.keytype == Key.KeyTypes.HAT:
-            return mapping.get(key.value)
+        return table[index] if 0 <= index < len(table) else None
 
-        if key.keytype == Key.KeyTypes.BUTTON and key.value == 0 and not map_button_release:
+    def _get_repeat(self, key: Key):
+        if key.keytype == BUTTON:
+            table, index = self.mappings.button_repeat, key.number
+        elif key.keytype == HAT:
+            table, index = self.mappings.hat_repeat, key.value
+        else:
             return None
 
-        return mapping.get(key.number)
+        return table[index] if 0 <= index < len(table) else None
+
+    def _on_held_key(self, key: Key, press, release=None):
+        # pairs every press with a release (a hat releases whichever direction it was held in) and drives auto-repeat,
+        # slots are per controller so several controllers can hold the same button in one module
+        slot = (getattr(key.joystick, "identifier", None), key.number if key.keytype == BUTTON else -1 - key.number)
+        if (held := self.held.pop(slot, None)) is not None:
+            if self.repeater:
+                self.repeater.cancel(slot)
+            if release:
+                release(held)
+
+        if not key.value or not (action := self._get_mapped_key(key)):
+            return
+
+        self.held[slot] = action
+        press(action)
+        if repeat := self._get_repeat(key):
+            if not self.repeater:
+                self.repeater = Repeater()
+            self.repeater.start(slot, *repeat, lambda: press(action))
+
+    def _release_held(self, release=None):
+        if self.repeater:
+            self.repeater.cancel_all()
+        for action in self.held.values():
+            if release:
+                release(action)
+        self.held.clear()
 
     def _load_config(self):
+        if not self.config_store:
+            self._log("no config store - using defaults")
+            return
+
         try:
-            with open("data/modules.json", "r") as modules_file:
-                config = json.load(modules_file)[self.name]
-                self.options.update(config.get("options", {}))
-                self.mappings.update(config.get("mappings", {}))
-                self._log("config loaded successfully")
-        except Exception:
-            self._log(f"failed to load config")
-
-    def _log(self, message: str):
-        print(f"module-{self.name}: {message}")
+            self.options = self.config_store.module_options(self.name, self.default_options)
+            self.mappings = compile_mappings(self.default_mappings, self.config_store.module(self.name)["mappings"], self.default_repeats, self.options.get("repeat"))
+            self.macros = compile_macros(self.config_store.module(self.name).get("macros")) or None
+            self._log("config loaded successfully")
+        except ConfigError as e:
+            self._log(f"failed to load config: {e}", level=logging.WARNING)
+
+    def run_macro(self, actions: tuple):
+        # actions are pressed in order and released in reverse, e.g. ctrl+shift+s
+        for action in actions:
+            self._press_action(action)
+        for action in reversed(actions):
+            self._release_action(action)
+
+    def _press_action(self, action):
+        self._output(self.output.press, action)
+
+    def _release_action(self, action):
+        self._output(self.output.release, action)
+
+    def _output(self, function, *args):
+        if self.stats:
+            return self.stats.output(self.name, function, *args)
+        return function(*args)
+
+    def _log(self, message: str, *args, level: int = logging.INFO, kind: str = None):
+        self.logger.log(level, message, *args, extra={"kind": kind})
@@ -1,10 +1,11 @@
+from events import Key
 from modules.module import Module
-from pyjoystick.sdl2 import Key
+from modules.output import OutputBackend
 
 
 class Dummy(Module):
-    def __init__(self):
-        super().__init__(None, "dummy")
+    def __init__(self, output: OutputBackend = None):
+        super().__init__(output, "dummy")
 
     def load(self) -> bool:
         super().load()
@@ -1,6 +1,7 @@
+from events import Key
 from modules.module import Module
-from pyjoystick.sdl2 import Key
-from pynput.keyboard import Controller, KeyCode
+from modules.output import OutputBackend
+from pynput.keyboard import KeyCode
 from pynput.keyboard import Key as KBKey
 
 
@@ -24,18 +25,39 @@ DEFAULT_MAPPINGS = {
     }
 }
 
+DEFAULT_REPEATS = {
+    Key.KeyTypes.HAT: (Key.HAT_UP, Key.HAT_DOWN, Key.HAT_LEFT, Key.HAT_RIGHT),
+    Key.KeyTypes.BUTTON: (4, 5)
+}
+
+DEFAULT_OPTIONS = {
+    "repeat": {
+        "delay": 0.4,
+        "rate": 10
+    }
+}
+
 class Media(Module):
-    def __init__(self, keyboard: Controller):
-        super().__init__(keyboard, "media")
-        self.mappings = DEFAULT_MAPPINGS
+    default_mappings = DEFAULT_MAPPINGS
+    default_repeats = DEFAULT_REPEATS
+    default_options = DEFAULT_OPTIONS
+
+    def __init__(self, output: OutputBackend):
+        super().__init__(output, "media")
 
     def load(self) -> bool:
         return super().load()
 
     def unload(self) -> bool:
+        self._release_held(self._release)
         return super().unload()
 
     def on_key(self, key: Key):
-        if mapped_key := self._get_mapped_key(key):
-            self._log(f"pressing {mapped_key}")
-            self.keyboard.press(mapped_key)
+        self._on_held_key(key, self._press, self._release)
+
+    def _press(self, mapped_key):
+        self._log("pressing %s", mapped_key, kind="key")
+        self._output(self.output.press, mapped_key)
+
+    def _release(self, mapped_key):
+        self._output(self.output.release, mapped_key)
@@ -1,20 +1,16 @@
+from config import ConfigError
+from events import Key
+from modules.curves import ResponseTables, LINEAR_CURVE
+from modules.mappings import MOUSE_X, MOUSE_Y, MOUSE_THROTTLE, MOUSE_BOOST, SCROLL_X, SCROLL_Y
 from modules.module import Module
-from pyjoystick.sdl2 import Key
-from pynput.keyboard import Controller, Key as KBKey
+from modules.output import OutputBackend
+from pynput.keyboard import Key as KBKey
 from pynput.mouse import Button
-from pynput import mouse
-from threading import Thread
+from threading import Thread, Event
+import logging
 import time
-import math
 
 
-MOUSE_X = 1
-MOUSE_Y = 2
-MOUSE_THROTTLE = 3
-MOUSE_BOOST = 4
-SCROLL_X = 5
-SCROLL_Y = 6
-
 DEFAULT_MAPPINGS = {
     Key.KeyTypes.HAT: {
         Key.HAT_UP:    KBKey.up,
@@ -44,43 +40,81 @@ DEFAULT_MAPPINGS = {
     }
 }
 
+DEFAULT_REPEATS = {
+    Key.KeyTypes.HAT: (Key.HAT_UP, Key.HAT_DOWN, Key.HAT_LEFT, Key.HAT_RIGHT)
+}
+
 DEFAULT_OPTIONS = {
+    "repeat": {
+        "delay": 0.4,
+        "rate": 10
+    },
     "sensitivity": 1.0,
     "acceleration": 5.0,
     "deadzone": 0.15,
+    "radial-deadzone": 0.0,
+    "outer-deadzone": None,
+    "response-curve": LINEAR_CURVE,
+    "scroll-curve": LINEAR_CURVE,
+    "curve-resolution": 4096,
     "invert-horizontal": False,
     "scroll-sensitivity": 1.0,
     "movement-update-rate": 120
 }
 
 class Mouse(Module):
-    def __init__(self, keyboard: Controller):
-        super().__init__(keyboard, "mouse")
-        self.mappings = DEFAULT_MAPPINGS
-        self.options = DEFAULT_OPTIONS.copy()
-        self.mouse = mouse.Controller()
+    default_mappings = DEFAULT_MAPPINGS
+    default_repeats = DEFAULT_REPEATS
+    default_options = DEFAULT_OPTIONS
+
+    def __init__(self, output: OutputBackend):
+        super().__init__(output, "mouse")
         self.mouse_multiplier = 1.0
         self.mouse_speed = [0.0, 0.0]
         self.scroll_speed = [0.0, 0.0]
         self.movement_thread = None
         self.movement_active = False
+        self.movement_stats = {"ticks": 0, "parks": 0, "idle-wakeups": 0}
         self.pressed_buttons = set()
+        self._movement_wake = Event()
+        self._move_remainder = [0.0, 0.0]
+        self._scroll_remainder = [0.0, 0.0]
+        self.response = ResponseTables(self.options)
 
         self._reset_mouse()
 
     def load(self) -> bool:
         super().load()
+        self._build_response()
         self._reset_mouse()
         self._start_movement_thread()
         return True
 
     def unload(self) -> bool:
+        self._release_held(self._release_key)
         super().unload()
         self._reset_mouse()
         self._stop_movement_thread()
+        stats = self.movement_stats
+        self._log(f"movement: {stats['ticks']} ticks, {stats['parks']} parks, {stats['idle-wakeups']} idle wakeups")
         return True
 
+    def reconfigure(self):
+        super().reconfigure()
+        self._build_response()
+
+    def _build_response(self):
+        # invalid curve settings keep the previous tables, like any other config error
+        try:
+            self.response = ResponseTables(self.options)
+        except (ConfigError, ValueError) as e:
+            self._log(f"invalid response curve, keeping the previous one: {e}", level=logging.WARNING)
+
     def on_key(self, key: Key):
+        if key.keytype == Key.KeyTypes.HAT:
+            self._on_held_key(key, self._press_key, self._release_key)
+            return
+
         if not (action := self._get_mapped_key(key, map_button_release=True)):
             return
 
@@ -89,20 +123,26 @@ class Mouse(Module):
         elif key.keytype == Key.KeyTypes.AXIS:
             self._handle_axis(action, key.value)
         else:
-            self._log(f"pressing {action}")
-            self.keyboard.press(action)
+            self._on_held_key(key, self._press_key, self._release_key)
+
+    def _press_key(self, action):
+        self._log("pressing %s", action, kind="key")
+        self._output(self.output.press, action)
+
+    def _release_key(self, action):
+        self._output(self.output.release, action)
 
     def _handle_mouse_button(self, key: Key, button: Button):
         now_pressed = key.value >= self.options["deadzone"]
         currently_pressed = key.number in self.pressed_buttons
 
         if now_pressed and not currently_pressed:
-            self._log(f"pressing {button}")
-            self.mouse.press(button)
+            self._log("pressing %s", button, kind="key")
+            self._output(self.output.press, button)
             self.pressed_buttons.add(key.number)
         elif not now_pressed and currently_pressed:
-            self._log(f"releasing {button}")
-            self.mouse.release(button)
+            self._log("releasing %s", button, kind="key")
+            self._output(self.output.release, button)
             self.pressed_buttons.remove(key.number)
 
     def _handle_axis(self, action, value):
@@ -115,13 +155,21 @@ class Mouse(Module):
         elif action == MOUSE_Y:
             self.mouse_speed[1] = -value if self.options["invert-horizontal"] else value
         elif action == SCROLL_X:
-            self.scroll_speed[0] = value * self.options["scroll-sensitivity"]
+            self.scroll_speed[0] = self.response.scroll_speed(value)
         elif action == SCROLL_Y:
-            self.scroll_speed[1] = -value * self.options["scroll-sensitivity"]
+            self.scroll_speed[1] = -self.response.scroll_speed(value)
         elif action in (MOUSE_THROTTLE, MOUSE_BOOST):
             self.mouse_multiplier = 1 + (value * (1 if action == MOUSE_BOOST else -1))
 
+        if value:
+            self._movement_wake.set()
+
     def _start_movement_thread(self):
+        # a thread that outlived the stop timeout would keep ticking beside the new one once movement_active is set again
+        if self.movement_thread and self.movement_thread.is_alive():
+            self.movement_active = False
+            self._movement_wake.set()
+            self.movement_thread.join()
         self.movement_active = True
         self.movement_thread = Thread(target=self._movement_loop, daemon=True)
         self.movement_thread.start()
@@ -129,31 +177,71 @@ class Mouse(Module):
 
     def _stop_movement_thread(self):
         self.movement_active = False
+        self._movement_wake.set()
         if self.movement_thread and self.movement_thread.is_alive():
             self.movement_thread.join(timeout=0.1)
         self._log("stopped mouse movement thread")
 
     def _movement_loop(self):
-        update_rate = 1.0 / self.options["movement-update-rate"]
+        interval = 1.0 / self.options["movement-update-rate"]
+        deadline = time.perf_counter()
         while self.movement_active:
-            self._update_mouse_position()
-            time.sleep(update_rate)
+            if not self._is_moving():
+                # park until the next axis event instead of ticking inside the deadzone
+                self._movement_wake.clear()
+                # a stop that set the wake flag just before the clear would otherwise leave the thread parked for good
+                if self.movement_active and not self._is_moving():
+                    self.movement_stats["parks"] += 1
+                    self._move_remainder = [0.0, 0.0]
+                    self._scroll_remainder = [0.0, 0.0]
+                    self._movement_wake.wait()
+                    if self.movement_active and not self._is_moving():
+                        self.movement_stats["idle-wakeups"] += 1
+                    deadline = time.perf_counter()
+                    continue
+
+            self._output(self._update_mouse_position)
+            self.movement_stats["ticks"] += 1
+
+            # absolute deadlines so the tick rate does not drift with the time spent moving
+            deadline += interval
+            if (delay := deadline - time.perf_counter()) > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.perf_counter()
+
+    def _is_moving(self) -> bool:
+        return any(self.mouse_speed) or any(self.scroll_speed)
 
     def _update_mouse_position(self):
-        if (speed := math.hypot(*self.mouse_speed)) > 0:
-            acceleration = 1.0 + (speed * (self.options["acceleration"] - 1.0)) * self.options["sensitivity"] * self.mouse_multiplier
-            distance = [self.mouse_speed[0] * acceleration, self.mouse_speed[1] * acceleration]
-            self.mouse.move(*distance)
-
-        if any(self.scroll_speed):
-            self.mouse.scroll(*self.scroll_speed)
+        # movement, scroll and any button changes queued during the tick are written as one batch
+        with self.output.batch():
+            x, y = self.mouse_speed
+            if gain := self.response.movement_gain(x, y, self.mouse_multiplier):
+                if distance := self._accumulate(self._move_remainder, x * gain, y * gain):
+                    self.output.move(*distance)
+
+            if any(self.scroll_speed):
+                if notches := self._accumulate(self._scroll_remainder, *self.scroll_speed):
+                    self.output.scroll(*notches)
+
+    @staticmethod
+    def _accumulate(remainder: list, x: float, y: float):
+        # carry sub-pixel/sub-notch fractions into the next tick rather than losing them
+        x += remainder[0]
+        y += remainder[1]
+        whole_x, whole_y = int(x), int(y)
+        remainder[0], remainder[1] = x - whole_x, y - whole_y
+        return (whole_x, whole_y) if whole_x or whole_y else None
 
     def _reset_mouse(self):
         for button in (Button.left, Button.middle, Button.right):
             if button in self.pressed_buttons:
-                self.mouse.release(button)
+                self.output.release(button)
 
         self.pressed_buttons.clear()
-        self.mouse_velocity = [0.0, 0.0]
-        self.scroll_velocity = [0.0, 0.0]
+        self.mouse_speed = [0.0, 0.0]
+        self.scroll_speed = [0.0, 0.0]
+        self._move_remainder = [0.0, 0.0]
+        self._scroll_remainder = [0.0, 0.0]
         self.mouse_multiplier = 1.0
@@ -1,23 +1,54 @@
+from events import Key
+from modules.mappings import MOUSE_X, MOUSE_Y, SCROLL_X, SCROLL_Y
 from modules.module import Module
-from pyjoystick.sdl2 import Key
-from pynput.keyboard import Controller
-from aiowebostv import WebOsClient
-from threading import Thread, Event
+from modules.output import OutputBackend
+from modules.webos import CommandQueue, PointerStream, WebOsConnection, probe_port
 from getmac import get_mac_address
 from wakeonlan import send_magic_packet
-from time import sleep
+from threading import Thread, Lock
 import asyncio
 import json
+import os
+import time
 
 
 DEFAULT_OPTIONS = {
-    "disconnect-on-unload": True,
+    "disconnect-on-unload": False,
     "host": "192.168.1.1",
+    "repeat": {
+        "delay": 0.4,
+        "rate": 8
+    },
     "secrets-file": "data/remote-secrets.json",
+    "connection": {
+        "connect-timeout": 15,
+        "keepalive-interval": 10,
+        "system-info-max-age": 86400,
+        "reconnect-backoff": {
+            "initial": 1,
+            "maximum": 60
+        }
+    },
+    "command-queue": {
+        "max-depth": 16,
+        "stale-navigation-depth": 4,
+        "timeout": 5
+    },
+    "pointer": {
+        "rate": 30,
+        "speed": 600,
+        "scroll-speed": 10,
+        "deadzone": 0.15,
+        "timeout": 1
+    },
     "wake-on-lan": {
         "enabled": True,
-        "sleep-after-wake": 25,
-        "broadcast-address": "192.168.1.255"
+        "broadcast-address": "192.168.1.255",
+        "timeout": 60,
+        "resend-interval": 5,
+        "probe-port": 3001,
+        "probe-interval": 1,
+        "probe-timeout": 0.5
     }
 }
 
@@ -39,74 +70,135 @@ DEFAULT_MAPPINGS = {
         7: "MENU",         # MENU / START
         8: "INPUT_HUB",    # L-STICK
         9: "POWER"         # R-STICK
+    },
+    Key.KeyTypes.AXIS: {
+        0: MOUSE_X,        # L-STICK [X]
+        1: MOUSE_Y,        # L-STICK [Y]
+        3: SCROLL_X,       # R-STICK [X]
+        4: SCROLL_Y        # R-STICK [Y]
     }
 }
 
+DEFAULT_REPEATS = {
+    Key.KeyTypes.HAT: (Key.HAT_UP, Key.HAT_DOWN, Key.HAT_LEFT, Key.HAT_RIGHT),
+    Key.KeyTypes.BUTTON: (4, 5)
+}
+
 DEFAULT_SECRETS = {
     "key": None,
-    "mac-address": None
+    "mac-address": None,
+    "system-info": None,
+    "system-info-updated": None
 }
 
 class Remote(Module):
-    def __init__(self, keyboard: Controller):
-        super().__init__(keyboard, "remote")
-        self.mappings = DEFAULT_MAPPINGS
-        self.options = DEFAULT_OPTIONS
-        self.secrets = DEFAULT_SECRETS
-        self.connected = False
-        self.client = None
-        self.loop = None
-        self.loop_thread = None
-        self._shutdown_event = Event()
+    default_mappings = DEFAULT_MAPPINGS
+    default_repeats = DEFAULT_REPEATS
+    default_options = DEFAULT_OPTIONS
+    # replaces the 'secrets-file' option when set, so a replay against the fake TV never touches the real key
+    secrets_file = None
+
+    def __init__(self, output: OutputBackend):
+        super().__init__(output, "remote")
+        self.secrets = DEFAULT_SECRETS.copy()
+        self.connection = None
+        self.commands = None
+        self.pointer = None
+        self.active = False
+        self.waking = False
+        self._secrets_lock = Lock()
+        self._saved_secrets = None
+        self._mac_lookup = None
+
+    @property
+    def connected(self) -> bool:
+        return bool(self.connection and self.connection.connected)
 
     def load(self) -> bool:
         super().load()
 
-        if self.client and self.connected:
-            self._log("already connected")
-            return True
-
-        try:
-            self._load_secrets()
-            self._start_event_loop()
-            sleep(0.25) 
-            self.connected = asyncio.run_coroutine_threadsafe(self._connect(), self.loop).result(timeout=15)
+        # the connection outlives module switches, so after the first load this only re-routes input
+        if not self.connection:
+            self._connect()
+        elif not self.connected:
+            self.connection.reconnect_now()
 
-            if self.connected and not self.secrets["mac-address"]:
-                self._find_mac_address()
-        except Exception as e:
-            self._log(f"remote connection failed: {repr(e)}")
-            self.connected = False
+        self.active = True
+        if not self.connected:
+            self._log("waiting for connection in the background")
+        return True
 
-        return self.connected
+    def preload(self):
+        # start connecting while another module is active so the remote is ready when switched to
+        if not self.connection:
+            self._load_config()
+            self._connect()
 
     def unload(self) -> bool:
+        self._release_held()
+        if self.pointer:
+            self.pointer.release()
         super().unload()
+        self.active = False
 
-        if self.options["disconnect-on-unload"] and self.client and self.connected:
-            try:
-                asyncio.run_coroutine_threadsafe(self.client.disconnect(), self.loop).result(timeout=5)
-                self._log("disconnected successfully")
-            except Exception as e:
-                self._log(f"error during disconnect: {repr(e)}")
-                return False
+        if self.commands:
+            self._log(f"commands: {self.commands.summary()}, {self.pointer.summary()}")
 
-        self._stop_event_loop()
-        self.client = None
-        self.connected = False
+        if self.options["disconnect-on-unload"] and self.connection:
+            self.commands.stop()
+            self.pointer.stop()
+            self.connection.stop()
+            self.commands = None
+            self.pointer = None
+            self.connection = None
         return True
 
     def on_key(self, key: Key):
-        mapped_key = self._get_mapped_key(key)
-        if not self.connected and mapped_key == "POWER" and self.options["wake-on-lan"]["enabled"]:
-            self._wake_on_lan()
-        elif self.connected and self.client and mapped_key:
-            self._send_command(mapped_key)
+        if key.keytype == Key.KeyTypes.AXIS:
+            if self.active and self.connected and (action := self._get_mapped_key(key)):
+                self._on_axis(action, key.value)
+            return
+        if not self.connected:
+            if self._get_mapped_key(key) == "POWER" and self.options["wake-on-lan"]["enabled"]:
+                self._wake_on_lan()
+        elif self.active:
+            self._on_held_key(key, self._send_command)
+
+    def _on_axis(self, action, value: float):
+        # only speeds are recorded here, the pointer stream sends the accumulated movement on its own clock
+        if action == MOUSE_X:
+            self.pointer.set_movement(0, value)
+        elif action == MOUSE_Y:
+            self.pointer.set_movement(1, value)
+        elif action == SCROLL_X:
+            self.pointer.set_scroll(0, value)
+        elif action == SCROLL_Y:
+            self.pointer.set_scroll(1, value)
+
+    def run_macro(self, actions: tuple):
+        for command in actions:
+            self._send_command(command)
+
+    def _connect(self):
+        self._load_secrets()
+        options = self.options["connection"]
+        system_info = self.secrets["system-info"]
+        if system_info and time.time() - (self.secrets["system-info-updated"] or 0) > options["system-info-max-age"]:
+            system_info = None
+        self.connection = WebOsConnection(self.options["host"], self.secrets["key"], self._log, options, self._on_connected, system_info, self._on_system_info)
+        self.connection.start()
+        self._lookup_mac_address()
+        self.commands = CommandQueue(self.connection.loop, self._button, self._log, self.options["command-queue"])
+        self.commands.stats = self.stats
+        self.commands.start()
+        self.pointer = PointerStream(self.connection.loop, self._move, self._scroll, self._log, self.options["pointer"])
+        self.pointer.start()
 
     def _load_secrets(self):
         try:
-            with open(self.options["secrets-file"], "r") as secrets_file:
+            with open(self.secrets_file or self.options["secrets-file"], "r") as secrets_file:
                 self.secrets.update(json.load(secrets_file))
+                self._saved_secrets = json.dumps(self.secrets, indent=4)
                 if key := self.secrets["key"]:
                     self._log(f"found stored key: {key[:8]}...")
                 if mac_address := self.secrets["mac-address"]:
@@ -115,61 +207,68 @@ class Remote(Module):
             self._log(f"failed to load existing secrets file: {repr(e)}")
 
     def _save_secrets(self):
-        try:
-            with open(self.options["secrets-file"], "w") as secrets_file:
-                json.dump(self.secrets, secrets_file, indent=4)
+        # only rewritten when something changed, and renamed into place so an interrupted write never loses the key
+        path = self.secrets_file or self.options["secrets-file"]
+        with self._secrets_lock:
+            if (text := json.dumps(self.secrets, indent=4)) == self._saved_secrets:
+                return
+            try:
+                with open(f"{path}.tmp", "w") as secrets_file:
+                    secrets_file.write(text)
+                    secrets_file.flush()
+                    os.fsync(secrets_file.fileno())
+                os.replace(f"{path}.tmp", path)
+                self._saved_secrets = text
                 self._log("saved secrets")
-        except Exception as e:
-            self._log(f"failed to save secrets to file '{self.options['secrets-file']}': {repr(e)}")
-
-    def _start_event_loop(self):
-        def run_loop():
-            self.loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self.loop)
-            self.loop.run_forever()
-
-        self.loop_thread = Thread(target=run_loop, daemon=True)
-        self.loop_thread.start()
-
-    def _stop_event_loop(self):
-        if self.loop and self.loop.is_running():
-            self.loop.call_soon_threadsafe(self.loop.stop)
-        if self.loop_thread and self.loop_thread.is_alive():
-            self.loop_thread.join(timeout=2)
+            except Exception as e:
+                self._log(f"failed to save secrets to file '{path}': {repr(e)}")
 
     def _send_command(self, command: str):
-        if not self.client or not self.connected:
+        if not self.connected or not self.commands:
             self._log("no client connection available")
             return
 
-        try:
-            asyncio.run_coroutine_threadsafe(self.client.button(command), self.loop).result(timeout=5)
-            self._log(f"sent command: {command}")
-        except asyncio.TimeoutError:
-            self._log(f"timeout sending command: {command}")
-        except Exception as e:
-            self._log(f"failed to send command {command}: {repr(e)}")
+        self.commands.put(command)
 
-    async def _connect(self) -> bool:
-        try:
-            self.client = WebOsClient(self.options["host"], client_key=self.secrets["key"])
+    async def _button(self, command: str):
+        if not (client := self.connection.client):
+            raise ConnectionError("not connected")
+        started = time.perf_counter_ns()
+        await client.button(command)
+        if self.stats:
+            self.stats.record(f"{self.name}.output", time.perf_counter_ns() - started)
 
-            self._log(f"connecting to {self.options['host']}")
-            await self.client.connect()
-            self._log("connected successfully")
+    async def _move(self, dx: int, dy: int):
+        if not (client := self.connection.client):
+            raise ConnectionError("not connected")
+        await client.move(dx, dy)
 
-            system_info = await self.client.get_system_info()
-            self._log(f"confirmed connection to TV: {system_info.get('modelName', 'unnkown')}")
+    async def _scroll(self, dx: int, dy: int):
+        if not (client := self.connection.client):
+            raise ConnectionError("not connected")
+        await client.scroll(dx, dy)
 
-            if self.client.client_key != self.secrets["key"]:
-                self.secrets["key"] = self.client.client_key
-                self._save_secrets()
+    def _on_connected(self, client):
+        if client.client_key != self.secrets["key"]:
+            self.secrets["key"] = client.client_key
+            self._save_secrets_in_background()
+        self._lookup_mac_address()
 
-            return True
-        except Exception as e:
-            self._log(f"connection error: {repr(e)}")
-            self.client = None
-            return False
+    def _on_system_info(self, system_info: dict):
+        self.secrets["system-info"] = system_info
+        self.secrets["system-info-updated"] = int(time.time())
+        self._save_secrets_in_background()
+
+    def _save_secrets_in_background(self):
+        # called on the connection's loop, which must not wait on the write and fsync while commands are queued
+        self.connection.loop.run_in_executor(None, self._save_secrets)
+
+    def _lookup_mac_address(self):
+        # the ARP lookup runs alongside the handshake instead of after it, and not at all once an address is stored
+        if self.secrets["mac-address"] or (self._mac_lookup and self._mac_lookup.is_alive()):
+            return
+        self._mac_lookup = Thread(target=self._find_mac_address, name="remote-mac", daemon=True)
+        self._mac_lookup.start()
 
     def _find_mac_address(self):
         try:
@@ -186,16 +285,39 @@ class Remote(Module):
         if not (mac_address := self.secrets["mac-address"]):
             self._log("no MAC address found to send WoL packet to")
             return
+        if self.waking:
+            self._log("already waiting for the TV to power on")
+            return
+
+        self.waking = True
+        self.connection.submit(self._wake_sequence(mac_address))
+
+    async def _wake_sequence(self, mac_address: str):
+        options = self.options["wake-on-lan"]
+        broadcast_address = options["broadcast-address"]
+        started = time.perf_counter()
+        deadline = started + options["timeout"]
+        next_packet = started
+
         try:
-            broadcast_address = self.options["wake-on-lan"]["broadcast-address"]
-            self._log(f"broadcasting WoL packet via {broadcast_address}")
-            send_magic_packet(mac_address, ip_address=broadcast_address)
+            while (now := time.perf_counter()) < deadline:
+                if now >= next_packet:
+                    self._log(f"broadcasting WoL packet via {broadcast_address}")
+                    send_magic_packet(mac_address, ip_address=broadcast_address)
+                    next_packet = now + options["resend-interval"]
+
+                if await probe_port(self.options["host"], options["probe-port"], options["probe-timeout"]):
+                    self._log(f"TV answered on port {options['probe-port']} after {now - started:.1f} seconds")
+                    self.connection.reconnect_now()
+                    if await self.connection.wait_connected_async(max(deadline - time.perf_counter(), 0)):
+                        self._log(f"connected {time.perf_counter() - started:.1f} seconds after waking")
+                        return
+                    break
 
-            wait_to_power_on = self.options["wake-on-lan"]["sleep-after-wake"]
-            self._log(f"waiting {wait_to_power_on} seconds for the TV to power on")
-            sleep(wait_to_power_on)
+                await asyncio.sleep(options["probe-interval"])
 
-            self.unload()
-            self.load()
+            self._log(f"gave up waiting for the TV after {time.perf_counter() - started:.1f} seconds")
         except Exception as e:
-            self._log(f"failed to send WoL packet: {repr(e)}")
+            self._log(f"failed to wake TV: {repr(e)}")
+        finally:
+            self.waking = False
@@ -0,0 +1,254 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from threading import Lock
+import os
+import struct
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class OutputBackend(ABC):
+    # modules queue key, button, movement and scroll events here, they are written immediately unless inside batch()
+    name = None
+
+    def __init__(self):
+        self.written = 0
+        self.batches = 0
+        self._pending = []
+        self._batching = 0
+        self._lock = Lock()
+
+    def press(self, action):
+        self._queue(("press", action))
+
+    def release(self, action):
+        self._queue(("release", action))
+
+    def move(self, dx: int, dy: int):
+        self._queue(("move", dx, dy))
+
+    def scroll(self, dx: int, dy: int):
+        self._queue(("scroll", dx, dy))
+
+    @contextmanager
+    def batch(self):
+        # events queued from any thread while a batch is open join it, the last batch to close writes them all at once
+        with self._lock:
+            self._batching += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batching -= 1
+                if not self._batching:
+                    self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+
+    def _queue(self, event: tuple):
+        with self._lock:
+            self._pending.append(event)
+            if not self._batching:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+        self.written += len(events)
+        self.batches += 1
+        self._write(events)
+
+    @abstractmethod
+    def _write(self, events: list):
+        pass
+
+
+class PynputBackend(OutputBackend):
+    # one library call per event, pynput has no way of grouping them
+    name = "pynput"
+
+    def __init__(self):
+        super().__init__()
+        from pynput import keyboard, mouse
+        self.keyboard = keyboard.Controller()
+        self.mouse = mouse.Controller()
+        self.buttons = mouse.Button
+
+    def _write(self, events: list):
+        for operation, *args in events:
+            if operation == "move":
+                self.mouse.move(*args)
+            elif operation == "scroll":
+                self.mouse.scroll(*args)
+            elif isinstance(args[0], self.buttons):
+                getattr(self.mouse, operation)(args[0])
+            else:
+                getattr(self.keyboard, operation)(args[0])
+
+
+class RecorderBackend(OutputBackend):
+    # keeps every flushed batch in memory instead of injecting anything
+    name = "recorder"
+
+    def __init__(self):
+        super().__init__()
+        self.recorded = []
+
+    def events(self) -> list:
+        return [event for batch in self.recorded for event in batch]
+
+    def clear(self):
+        with self._lock:
+            self.recorded.clear()
+
+    def _write(self, events: list):
+        self.recorded.append(events)
+
+
+EV_SYN, EV_KEY, EV_REL = 0x00, 0x01, 0x02
+SYN_REPORT = 0
+REL_X, REL_Y, REL_HWHEEL, REL_WHEEL = 0x00, 0x01, 0x06, 0x08
+BTN_LEFT, BTN_RIGHT, BTN_MIDDLE = 0x110, 0x111, 0x112
+KEY_LEFTSHIFT = 42
+
+UI_SET_EVBIT = 0x40045564
+UI_SET_KEYBIT = 0x40045565
+UI_SET_RELBIT = 0x40045566
+UI_DEV_CREATE = 0x5501
+UI_DEV_DESTROY = 0x5502
+
+INPUT_EVENT = struct.Struct("llHHi")
+USER_DEV = struct.Struct("80sHHHHi" + "i" * 256)
+BUS_VIRTUAL = 0x06
+
+BUTTON_CODES = {"left": BTN_LEFT, "right": BTN_RIGHT, "middle": BTN_MIDDLE}
+KEY_CODES = {
+    "esc": 1, "backspace": 14, "tab": 15, "enter": 28, "ctrl": 29, "ctrl_l": 29, "shift": 42, "shift_l": 42, "shift_r": 54,
+    "alt": 56, "alt_l": 56, "space": 57, "caps_lock": 58, "num_lock": 69, "scroll_lock": 70, "ctrl_r": 97, "print_screen": 99,
+    "alt_r": 100, "alt_gr": 100, "home": 102, "up": 103, "page_up": 104, "left": 105, "right": 106, "end": 107, "down": 108,
+    "page_down": 109, "insert": 110, "delete": 111, "media_volume_mute": 113, "media_volume_down": 114,
+    "media_volume_up": 115, "pause": 119, "cmd": 125, "cmd_l": 125, "cmd_r": 126, "menu": 127, "media_next": 163,
+    "media_play_pause": 164, "media_previous": 165, "media_stop": 166,
+    **{f"f{number}": 58 + number for number in range(1, 11)}, "f11": 87, "f12": 88,
+    **{f"f{number}": 170 + number for number in range(13, 21)}
+}
+CHAR_CODES = {
+    **{char: code for code, char in enumerate("1234567890-=", start=2)},
+    **{char: code for code, char in enumerate("qwertyuiop[]", start=16)},
+    **{char: code for code, char in enumerate("asdfghjkl;'`", start=30)},
+    **{char: code for code, char in enumerate("\\zxcvbnm,./", start=43)},
+    " ": 57, "\t": 15, "\n": 28
+}
+SHIFTED_CHARS = dict(zip('!@#$%^&*()_+{}:"~|<>?', "1234567890-=[];'`\\,./"))
+
+
+def _key_code(action):
+    # (code, needs shift) in the kernel's keycode set, None for keys with no fixed code (e.g. X keysyms from vk)
+    from pynput.keyboard import Key as KBKey, KeyCode
+    from pynput.mouse import Button
+    if isinstance(action, Button):
+        return BUTTON_CODES.get(action.name), False
+    if isinstance(action, KBKey):
+        return KEY_CODES.get(action.name), False
+    if isinstance(action, KeyCode) and action.char:
+        char = action.char
+        if char in CHAR_CODES:
+            return CHAR_CODES[char], False
+        if char.lower() in CHAR_CODES:
+            return CHAR_CODES[char.lower()], True
+        if char in SHIFTED_CHARS:
+            return CHAR_CODES[SHIFTED_CHARS[char]], True
+    return None, False
+
+
+class UinputBackend(OutputBackend):
+    # a virtual keyboard and mouse on /dev/uinput, each batch is a single write() ending in one SYN_REPORT
+    name = "uinput"
+
+    def __init__(self, path: str = "/dev/uinput", device_name: str = "modular-controller-mapper", log=None):
+        super().__init__()
+        self.log = log
+        self.unsupported = set()
+        self.codes = {}
+        self.created = False
+        self.fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        try:
+            self._create_device(device_name)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _create_device(self, device_name: str):
+        if not fcntl:
+            raise OSError("uinput is only available on linux")
+        for event_type in (EV_SYN, EV_KEY, EV_REL):
+            fcntl.ioctl(self.fd, UI_SET_EVBIT, event_type)
+        for code in {*KEY_CODES.values(), *CHAR_CODES.values(), *BUTTON_CODES.values()}:
+            fcntl.ioctl(self.fd, UI_SET_KEYBIT, code)
+        for code in (REL_X, REL_Y, REL_HWHEEL, REL_WHEEL):
+            fcntl.ioctl(self.fd, UI_SET_RELBIT, code)
+        os.write(self.fd, USER_DEV.pack(device_name.encode()[:79], BUS_VIRTUAL, 0x1, 0x1, 1, 0, *([0] * 256)))
+        fcntl.ioctl(self.fd, UI_DEV_CREATE)
+        self.created = True
+
+    def close(self):
+        super().close()
+        if self.fd is not None:
+            if self.created:
+                fcntl.ioctl(self.fd, UI_DEV_DESTROY)
+            os.close(self.fd)
+            self.fd = None
+
+    def _write(self, events: list):
+        if self.fd is None:
+            return
+        now = time.time()
+        seconds, microseconds = int(now), int(now % 1 * 1_000_000)
+        data = bytearray()
+        for operation, *args in events:
+            for event_type, code, value in self._encode(operation, args):
+                data += INPUT_EVENT.pack(seconds, microseconds, event_type, code, value)
+        if data:
+            data += INPUT_EVENT.pack(seconds, microseconds, EV_SYN, SYN_REPORT, 0)
+            os.write(self.fd, data)
+
+    def _encode(self, operation: str, args: list):
+        if operation == "move":
+            dx, dy = args
+            return [(EV_REL, axis, int(value)) for axis, value in ((REL_X, dx), (REL_Y, dy)) if value]
+        if operation == "scroll":
+            dx, dy = args
+            return [(EV_REL, axis, int(value)) for axis, value in ((REL_HWHEEL, dx), (REL_WHEEL, dy)) if value]
+
+        # resolved once per action, the same few keys and buttons are pressed over and over
+        if (resolved := self.codes.get(args[0])) is None:
+            resolved = self.codes[args[0]] = _key_code(args[0])
+        code, shift = resolved
+        if code is None:
+            if args[0] not in self.unsupported:
+                self.unsupported.add(args[0])
+                if self.log:
+                    self.log(f"output: no uinput key code for {args[0]}, ignoring it")
+            return []
+        if operation == "press":
+            return [(EV_KEY, KEY_LEFTSHIFT, 1), (EV_KEY, code, 1)] if shift else [(EV_KEY, code, 1)]
+        return [(EV_KEY, code, 0), (EV_KEY, KEY_LEFTSHIFT, 0)] if shift else [(EV_KEY, code, 0)]
+
+
+BACKENDS = {backend.name: backend for backend in (PynputBackend, UinputBackend, RecorderBackend)}
+
+
+def create_backend(name: str, log=None) -> OutputBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"unknown output backend '{name}' (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[name](log=log) if name == "uinput" else BACKENDS[name]()
@@ -0,0 +1,399 @@
+from config import ConfigStore, ConfigError
+from events import InputEvent, Device, AXIS, BUTTON, HAT
+from logger import LogWriter
+from modules.loader import ModuleSpec
+from modules.module import Module
+from modules.output import create_backend
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from threading import Thread, Event, Lock
+from time import monotonic
+import logging
+import pickle
+import struct
+
+
+# a macro's place in the input, its actions follow on the doorbell pipe
+MACRO = "macro"
+KEYTYPES = (AXIS, BUTTON, HAT, MACRO)
+KEYTYPE_CODES = {keytype: code for code, keytype in enumerate(KEYTYPES)}
+
+# head and tail counters on their own cache lines, then the consumer's waiting flag and the capacity
+HEAD, TAIL, WAITING, CAPACITY, RECORDS = 0, 64, 128, 136, 192
+# native format so each counter is copied with a single aligned store rather than byte by byte
+COUNTER = struct.Struct("Q")
+FLAG = struct.Struct("I")
+# key type, number, device instance id, value
+RECORD = struct.Struct("<BxHid")
+# the only doorbell message that is not a pickled macro
+WAKE = b"\0"
+
+RING_CAPACITY = 4096
+HEALTH_INTERVAL = 1.0
+REQUEST_TIMEOUT = 10.0
+PING_TIMEOUT = 2.0
+WAIT_TIMEOUT = 0.05
+RESTART_BACKOFF = (1.0, 30.0)
+
+
+class EventRing:
+    # ring in shared memory with a single consumer: each side only ever writes its own counter, and a record is written
+    # before the head that publishes it (in order on x86's store ordering). Core has more than one thread producing
+    # (input and the axis coalescer), so producers serialise on a lock the consumer never takes
+    def __init__(self, capacity: int = RING_CAPACITY, name: str = None):
+        if name is None:
+            self.memory = SharedMemory(create=True, size=RECORDS + capacity * RECORD.size)
+            FLAG.pack_into(self.memory.buf, CAPACITY, capacity)
+        else:
+            self.memory = SharedMemory(name=name)
+        self.name = self.memory.name
+        self.buffer = self.memory.buf
+        self.capacity = FLAG.unpack_from(self.buffer, CAPACITY)[0]
+        self.dropped = 0
+        self._lock = Lock()
+        self._head = COUNTER.unpack_from(self.buffer, HEAD)[0]
+        self._tail = COUNTER.unpack_from(self.buffer, TAIL)[0]
+
+    def push(self, key) -> bool:
+        with self._lock:
+            head = self._head
+            if head - COUNTER.unpack_from(self.buffer, TAIL)[0] >= self.capacity:
+                # a stalled consumer loses new input rather than blocking the input thread
+                self.dropped += 1
+                return False
+            RECORD.pack_into(self.buffer, RECORDS + head % self.capacity * RECORD.size,
+                             KEYTYPE_CODES[key.keytype], key.number, getattr(key.joystick, "identifier", -1), key.value)
+            self._head = head + 1
+            COUNTER.pack_into(self.buffer, HEAD, head + 1)
+            return True
+
+    def pop_all(self) -> list:
+        tail, head = self._tail, COUNTER.unpack_from(self.buffer, HEAD)[0]
+        if head <= tail:
+            return []
+        records = [RECORD.unpack_from(self.buffer, RECORDS + index % self.capacity * RECORD.size) for index in range(tail, head)]
+        self._tail = head
+        COUNTER.pack_into(self.buffer, TAIL, head)
+        return records
+
+    def pending(self) -> int:
+        return COUNTER.unpack_from(self.buffer, HEAD)[0] - COUNTER.unpack_from(self.buffer, TAIL)[0]
+
+    def consumed(self) -> int:
+        return COUNTER.unpack_from(self.buffer, TAIL)[0]
+
+    def skip(self):
+        # only while no consumer is attached, e.g. between a crash and the restart
+        with self._lock:
+            self._tail = COUNTER.unpack_from(self.buffer, HEAD)[0]
+        COUNTER.pack_into(self.buffer, TAIL, self._tail)
+
+    @property
+    def waiting(self) -> bool:
+        return bool(FLAG.unpack_from(self.buffer, WAITING)[0])
+
+    @waiting.setter
+    def waiting(self, value: bool):
+        FLAG.pack_into(self.buffer, WAITING, int(value))
+
+    def close(self, unlink: bool = False):
+        self.buffer.release()
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class ModuleProcess(Module):
+    # stands in for a module running in its own process: input is pushed onto the ring, load/unload/health
+    # go over a pipe, and a crashed or hung worker is restarted without touching the rest of Core
+    def __init__(self, spec: ModuleSpec, config_file: str, defaults: dict, output: str):
+        super().__init__(None, spec.name)
+        self.spec = spec
+        self.config_file = config_file
+        self.defaults = defaults
+        self.output_name = output
+        self.ring = EventRing()
+        self.process = None
+        self.control = None
+        self.doorbell = None
+        self.loaded = False
+        self.restarts = 0
+        self._request_id = 0
+        self._macro_id = 0
+        self._control_lock = Lock()
+        self._doorbell_lock = Lock()
+        self._start_lock = Lock()
+        self._stopped = Event()
+        self._monitor = Thread(target=self._monitor_loop, name=f"process-{spec.name}", daemon=True)
+        self._monitor.start()
+
+    def load(self) -> bool:
+        super().load()
+        if not self._start():
+            return False
+        self.loaded = self._request("load", timeout=REQUEST_TIMEOUT) is True
+        return self.loaded
+
+    def preload(self):
+        self._load_config()
+        if self._start():
+            self._request("preload", timeout=REQUEST_TIMEOUT)
+
+    def unload(self) -> bool:
+        super().unload()
+        self.loaded = False
+        if self._alive():
+            self._request("unload", timeout=REQUEST_TIMEOUT)
+        return True
+
+    def reconfigure(self):
+        super().reconfigure()
+        if self._alive():
+            self._request("reconfigure", timeout=REQUEST_TIMEOUT)
+
+    def on_key(self, key):
+        self.ring.push(key)
+        self._ring_doorbell()
+
+    def on_axes(self, keys: list):
+        for key in keys:
+            self.ring.push(key)
+        self._ring_doorbell()
+
+    def run_macro(self, actions: tuple):
+        # the actions go down the doorbell pipe rather than the control pipe, so a macro never waits behind a slow request,
+        # and a marker on the ring keeps them in order with the input around them
+        self._macro_id += 1
+        if self._send_doorbell(pickle.dumps((self._macro_id, actions))):
+            self.ring.push(InputEvent(MACRO, 0, self._macro_id, None))
+            self._ring_doorbell()
+
+    def stop(self):
+        self._stopped.set()
+        self._terminate()
+        self.ring.close(unlink=True)
+
+    def _ring_doorbell(self):
+        if self.ring.waiting:
+            # the consumer only sleeps after finding the ring empty, so most events never cost a syscall
+            self.ring.waiting = False
+            self._send_doorbell(WAKE)
+
+    def _send_doorbell(self, message: bytes) -> bool:
+        # its own lock rather than the control lock, the input thread never waits behind a slow request
+        with self._doorbell_lock:
+            if doorbell := self.doorbell:
+                try:
+                    doorbell.send_bytes(message)
+                    return True
+                except OSError:
+                    pass
+        return False
+
+    def _alive(self) -> bool:
+        process = self.process
+        return bool(process and process.is_alive())
+
+    def _start(self) -> bool:
+        with self._start_lock:
+            if self._alive():
+                return True
+            context = get_context("spawn")
+            control, child_control = context.Pipe()
+            doorbell_reader, doorbell = context.Pipe(duplex=False)
+            self.ring.skip()
+            spec = self.spec
+            self.process = context.Process(target=run_worker, name=f"module-{spec.name}", daemon=True,
+                                           args=((spec.name, spec.class_name, spec.import_path, spec.file_path), self.config_file,
+                                                 self.defaults, self.output_name, self.ring.name, child_control, doorbell_reader))
+            self.process.start()
+            with self._control_lock:
+                self.control = control
+            with self._doorbell_lock:
+                self.doorbell = doorbell
+            child_control.close()
+            doorbell_reader.close()
+            if (reply := self._request("ready", timeout=REQUEST_TIMEOUT)) is not True:
+                self._log(f"worker process failed to start: {reply}", level=logging.ERROR)
+                self._terminate()
+                return False
+            self._log(f"worker process {self.process.pid} started")
+            return True
+
+    def _request(self, command: str, *args, timeout: float = REQUEST_TIMEOUT):
+        with self._control_lock:
+            if not (control := self.control):
+                return "worker process is not running"
+            # replies carry the request's id, so a late reply to a request that timed out is never taken for this one
+            self._request_id += 1
+            request_id, deadline = self._request_id, monotonic() + timeout
+            try:
+                control.send((request_id, command, *args))
+                while True:
+                    if (remaining := deadline - monotonic()) <= 0 or not control.poll(remaining):
+                        return f"no reply to '{command}' within {timeout}s"
+                    reply_id, status, result = control.recv()
+                    if reply_id == request_id:
+                        break
+            except (OSError, EOFError) as e:
+                return repr(e)
+        if status == "error":
+            self._log(f"worker process: '{command}' failed: {result}", level=logging.ERROR)
+        return result
+
+    def _terminate(self):
+        # under both locks, so no other thread is sending on a connection while it is closed
+        with self._control_lock, self._doorbell_lock:
+            if self.process:
+                self.process.kill()
+                self.process.join(1)
+                self.process = None
+            for connection in (self.control, self.doorbell):
+                if connection:
+                    connection.close()
+            self.control = self.doorbell = None
+
+    def _monitor_loop(self):
+        backoff = RESTART_BACKOFF[0]
+        consumed = None
+        while not self._stopped.wait(HEALTH_INTERVAL):
+            if not (process := self.process):
+                if not self.loaded:
+                    continue
+                # a restart that failed leaves no process, keep trying while the module is meant to be loaded
+                problem = "worker process is not running"
+            elif not process.is_alive():
+                problem = f"worker process exited with code {process.exitcode}"
+            elif self._request("ping", timeout=PING_TIMEOUT) != "pong":
+                problem = "worker process stopped answering"
+            elif self.ring.pending() and self.ring.consumed() == consumed:
+                problem = "worker process stopped reading input"
+            else:
+                consumed = self.ring.consumed() if self.ring.pending() else None
+                backoff = RESTART_BACKOFF[0]
+                continue
+
+            self._log(f"{problem}, restarting in {backoff:.0f}s", level=logging.ERROR)
+            self._terminate()
+            if self._stopped.wait(backoff):
+                return
+            backoff = min(backoff * 2, RESTART_BACKOFF[1])
+            consumed = None
+            self.restarts += 1
+            if self.loaded and self._start() and self._request("load", timeout=REQUEST_TIMEOUT) is not True:
+                self._terminate()
+
+
+def run_worker(spec_fields: tuple, config_file: str, defaults: dict, output: str, ring_name: str, control, doorbell):
+    # entry point of the worker process: the module gets its own config store, output backend and log writer
+    logs = LogWriter()
+    logs.start()
+    store = ConfigStore(config_file, defaults, logs.logger.info)
+    try:
+        store.load()
+    except (ConfigError, ValueError):
+        pass
+    logs.configure(store.config["logging"], store.config["quiet"])
+
+    spec = ModuleSpec(*spec_fields)
+    try:
+        module = spec.activate(create_backend(output))
+    except (ValueError, OSError) as e:
+        spec.error = e
+        module = None
+    if not module:
+        # answers the "ready" request that is already waiting
+        request_id = control.recv()[0]
+        control.send((request_id, "error", repr(spec.error)))
+        return
+    module.config_store = store
+    ring = EventRing(name=ring_name)
+    Thread(target=_consume, args=(module, ring, doorbell), name="ring", daemon=True).start()
+
+    def reconfigure():
+        store.load()
+        module.reconfigure()
+
+    handlers = {
+        "ready": lambda: True,
+        "ping": lambda: "pong",
+        "load": module.load,
+        "preload": module.preload,
+        "unload": module.unload,
+        "reconfigure": reconfigure
+    }
+    while True:
+        try:
+            request_id, command, *args = control.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            control.send((request_id, "ok", handlers[command]()))
+        except Exception as e:
+            control.send((request_id, "error", repr(e)))
+    try:
+        module.unload()
+    finally:
+        module.output.close()
+
+
+def _consume(module: Module, ring: EventRing, doorbell):
+    devices, macros = {}, {}
+    while True:
+        if records := ring.pop_all():
+            _deliver(module, records, devices, doorbell, macros)
+            continue
+        ring.waiting = True
+        # the timeout bounds the delay if a doorbell is ever missed between setting the flag and the producer's check
+        if not ring.pending() and doorbell.poll(WAIT_TIMEOUT):
+            _read_doorbell(doorbell, macros)
+        ring.waiting = False
+
+
+def _read_doorbell(doorbell, macros: dict):
+    # wake-ups are dropped, macros are kept until their marker comes off the ring
+    while doorbell.poll(0):
+        if (message := doorbell.recv_bytes()) != WAKE:
+            macro_id, actions = pickle.loads(message)
+            macros[macro_id] = actions
+
+
+def _deliver(module: Module, records: list, devices: dict, doorbell, macros: dict):
+    # consecutive axis records are handed over in one on_axes call, like the coalescer does in Core
+    axes = []
+    for keytype, number, device_id, value in records:
+        keytype = KEYTYPES[keytype]
+        try:
+            if keytype == AXIS:
+                if (device := devices.get(device_id)) is None:
+                    device = devices[device_id] = Device(device_id)
+                axes.append(InputEvent(AXIS, number, value, device))
+                continue
+            if axes:
+                module.on_axes(axes)
+                axes = []
+            if keytype == MACRO:
+                _run_macro(module, int(value), doorbell, macros)
+                continue
+            if (device := devices.get(device_id)) is None:
+                device = devices[device_id] = Device(device_id)
+            module.on_key(InputEvent(keytype, number, int(value), device))
+        except Exception as e:
+            module._log(f"error handling input: {repr(e)}", level=logging.ERROR)
+    if axes:
+        try:
+            module.on_axes(axes)
+        except Exception as e:
+            module._log(f"error handling input: {repr(e)}", level=logging.ERROR)
+
+
+def _run_macro(module: Module, macro_id: int, doorbell, macros: dict):
+    # the actions were sent before the marker was pushed, so they are already waiting on the pipe
+    if macro_id not in macros:
+        _read_doorbell(doorbell, macros)
+    actions = macros.pop(macro_id, None)
+    # actions whose marker was dropped from a full ring never come up
+    for stale in [stale for stale in macros if stale < macro_id]:
+        del macros[stale]
+    if actions is not None:
+        module.run_macro(actions)
@@ -0,0 +1,154 @@
+from logger import get_logger
+from threading import Thread, Condition, RLock
+import math
+import time
+
+
+DEFAULT_REPEAT = {
+    "delay": 0.4,
+    "rate": 10
+}
+
+
+class Timer:
+    __slots__ = ("due", "callback", "rounds", "cancelled")
+
+    def __init__(self, due: float, callback, rounds: int):
+        self.due = due
+        self.callback = callback
+        self.rounds = rounds
+        self.cancelled = False
+
+
+class JitterStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.peak = 0.0
+
+    def record(self, jitter: float):
+        self.count += 1
+        self.total += jitter
+        self.squares += jitter * jitter
+        self.peak = max(self.peak, jitter)
+
+    def summary(self) -> str:
+        if not self.count:
+            return "no timers fired"
+        mean = self.total / self.count
+        deviation = math.sqrt(max(self.squares / self.count - mean * mean, 0.0))
+        return f"{self.count} timers, jitter mean={mean * 1000:.2f}ms stdev={deviation * 1000:.2f}ms max={self.peak * 1000:.2f}ms"
+
+
+class TimerWheel:
+    def __init__(self, resolution: float = 0.002, size: int = 512):
+        self.resolution = resolution
+        self.size = size
+        self.slots = [[] for _ in range(size)]
+        self.pending = 0
+        self.tick = 0
+        self.origin = 0.0
+        self.jitter = JitterStats()
+        self.thread = None
+        self.logger = get_logger("timers")
+        self._condition = Condition()
+
+    def schedule(self, due: float, callback) -> Timer:
+        with self._condition:
+            if not self.pending:
+                # re-anchor the wheel on the current tick after it has been parked
+                self.origin = time.perf_counter() - self.tick * self.resolution
+                self._condition.notify()
+            target = max(math.ceil((due - self.origin) / self.resolution), self.tick)
+            timer = Timer(due, callback, (target - self.tick) // self.size)
+            self.slots[target % self.size].append(timer)
+            self.pending += 1
+            if not self.thread:
+                self.thread = Thread(target=self._run, daemon=True)
+                self.thread.start()
+            return timer
+
+    def cancel(self, timer: Timer):
+        with self._condition:
+            if not timer.cancelled:
+                timer.cancelled = True
+                self.pending -= 1
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # a single thread for every timer, parked while nothing is scheduled
+                while not self.pending:
+                    self._condition.wait()
+                if (delay := self.origin + self.tick * self.resolution - time.perf_counter()) > 0:
+                    self._condition.wait(delay)
+                    continue
+                expired = self._advance()
+
+            for timer in expired:
+                self.jitter.record(time.perf_counter() - timer.due)
+                # the thread is shared by every module's timers, one failing callback must not stop the rest
+                try:
+                    timer.callback(timer)
+                except Exception as e:
+                    self.logger.error(f"error in timer callback: {repr(e)}")
+
+    def _advance(self) -> list:
+        slot = self.slots[self.tick % self.size]
+        expired, remaining = [], []
+        for timer in slot:
+            if timer.cancelled:
+                continue
+            if timer.rounds:
+                timer.rounds -= 1
+                remaining.append(timer)
+                continue
+            timer.cancelled = True
+            self.pending -= 1
+            expired.append(timer)
+        self.slots[self.tick % self.size] = remaining
+        self.tick += 1
+        return expired
+
+
+_shared_wheel = None
+
+
+def shared_wheel() -> TimerWheel:
+    global _shared_wheel
+    if not _shared_wheel:
+        _shared_wheel = TimerWheel()
+    return _shared_wheel
+
+
+class Repeater:
+    def __init__(self, wheel: TimerWheel = None):
+        self.wheel = wheel or shared_wheel()
+        self.timers = {}
+        # fire runs on the wheel thread and cancel on the input thread, a press never lands after its release
+        self._lock = RLock()
+
+    def start(self, slot, delay: float, interval: float, callback):
+        with self._lock:
+            self.cancel(slot)
+
+            def fire(timer: Timer):
+                with self._lock:
+                    if self.timers.get(slot) is not timer:
+                        return
+                    # the next repeat is due relative to this one's deadline so the rate does not drift
+                    self.timers[slot] = self.wheel.schedule(timer.due + interval, fire)
+                    callback()
+
+            self.timers[slot] = self.wheel.schedule(time.perf_counter() + delay, fire)
+
+    def cancel(self, slot):
+        with self._lock:
+            if timer := self.timers.pop(slot, None):
+                self.wheel.cancel(timer)
+
+    def cancel_all(self):
+        with self._lock:
+            for slot in list(self.timers):
+                self.cancel(slot)
@@ -0,0 +1,408 @@
+from aiowebostv import WebOsClient
+from collections import deque
+from threading import Thread, Event
+import asyncio
+import time
+
+
+VOLUME_COMMANDS = ("VOLUMEUP", "VOLUMEDOWN")
+# only directions go stale, a confirm or back press always reaches the TV
+NAVIGATION_COMMANDS = ("UP", "DOWN", "LEFT", "RIGHT")
+
+DEFAULT_CONNECTION_OPTIONS = {
+    "connect-timeout": 15,
+    "keepalive-interval": 10,
+    "system-info-max-age": 86400,
+    "reconnect-backoff": {
+        "initial": 1,
+        "maximum": 60
+    }
+}
+
+DEFAULT_QUEUE_OPTIONS = {
+    "max-depth": 16,
+    "stale-navigation-depth": 4,
+    "timeout": 5
+}
+
+DEFAULT_POINTER_OPTIONS = {
+    "rate": 30,
+    "speed": 600,
+    "scroll-speed": 10,
+    "deadzone": 0.15,
+    "timeout": 1
+}
+
+
+class CommandQueue:
+    def __init__(self, loop: asyncio.AbstractEventLoop, send, log, options: dict = None):
+        options = {**DEFAULT_QUEUE_OPTIONS, **(options or {})}
+        self.loop = loop
+        self.send = send
+        self.max_depth = options["max-depth"]
+        self.stale_navigation_depth = options["stale-navigation-depth"]
+        self.timeout = options["timeout"]
+        self.pending = deque()
+        self.latency = {}
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.stats = None
+        self._log = log
+        self._ready = None
+        self._task = None
+
+    def start(self):
+        self.loop.call_soon_threadsafe(self._start)
+
+    def stop(self):
+        if self._task and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._task.cancel)
+
+    def put(self, command: str):
+        # safe to call from any thread and never waits on the network
+        self.loop.call_soon_threadsafe(self._put, command, time.perf_counter())
+
+    def summary(self) -> str:
+        stats = ", ".join(f"{command} n={count} avg={total / count * 1000:.1f}ms max={peak * 1000:.1f}ms" for command, (count, total, peak) in self.latency.items())
+        return f"sent {self.sent}, coalesced {self.coalesced}, dropped {self.dropped}" + (f" ({stats})" if stats else "")
+
+    def _start(self):
+        self._ready = asyncio.Event()
+        self._task = self.loop.create_task(self._run())
+
+    def _put(self, command: str, queued_at: float):
+        if self.pending and command in VOLUME_COMMANDS and self.pending[-1][0] == command:
+            self.pending[-1][1] += 1
+            self.coalesced += 1
+            return
+
+        if len(self.pending) >= self.max_depth:
+            self.dropped += 1
+            self._log(f"command queue full, dropping {command}")
+            return
+
+        if len(self.pending) >= self.stale_navigation_depth:
+            # the newest direction survives (the one just pressed, if it is one) and only older ones are dropped
+            newest = None if command in NAVIGATION_COMMANDS else next((entry for entry in reversed(self.pending) if entry[0] in NAVIGATION_COMMANDS), None)
+            kept = deque(entry for entry in self.pending if entry[0] not in NAVIGATION_COMMANDS or entry is newest)
+            if dropped := len(self.pending) - len(kept):
+                self.dropped += dropped
+                self._log(f"dropping {dropped} stale navigation commands")
+                self.pending = kept
+
+        self.pending.append([command, 1, queued_at])
+        self._ready.set()
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self.pending:
+                command, count, queued_at = self.pending.popleft()
+                try:
+                    # coalesced volume presses go out back to back as a single burst
+                    for _ in range(count):
+                        await asyncio.wait_for(self.send(command), self.timeout)
+                    self.sent += count
+                    self._record(command, time.perf_counter() - queued_at)
+                    self._log(f"sent command: {command}" + (f" x{count}" if count > 1 else ""))
+                except asyncio.TimeoutError:
+                    self._log(f"timeout sending command: {command}")
+                except Exception as e:
+                    self._log(f"failed to send command {command}: {repr(e)}")
+
+    def _record(self, command: str, latency: float):
+        if self.stats:
+            self.stats.record("remote.queue", int(latency * 1e9))
+        if not (stats := self.latency.get(command)):
+            stats = self.latency[command] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += latency
+        stats[2] = max(stats[2], latency)
+
+
+class PointerStream:
+    # turns stick deflection into pointer movement: speeds are set from the input thread and the distance travelled is
+    # sent at most `rate` times a second over the input socket, so the TV never sees one message per axis event
+    def __init__(self, loop: asyncio.AbstractEventLoop, move, scroll, log, options: dict = None):
+        options = {**DEFAULT_POINTER_OPTIONS, **(options or {})}
+        self.loop = loop
+        self.move = move
+        self.scroll = scroll
+        self.interval = 1.0 / options["rate"]
+        self.speed = options["speed"]
+        self.scroll_speed = options["scroll-speed"]
+        self.deadzone = options["deadzone"]
+        self.timeout = options["timeout"]
+        self.movement = [0.0, 0.0]
+        self.wheel = [0.0, 0.0]
+        self.messages = 0
+        self.failed = 0
+        self._move_remainder = [0.0, 0.0]
+        self._scroll_remainder = [0.0, 0.0]
+        self._awake = False
+        self._ready = None
+        self._task = None
+        self._log = log
+
+    def start(self):
+        self.loop.call_soon_threadsafe(self._start)
+
+    def stop(self):
+        self.release()
+        if self._task and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._task.cancel)
+
+    def set_movement(self, index: int, value: float):
+        self._set(self.movement, index, value)
+
+    def set_scroll(self, index: int, value: float):
+        self._set(self.wheel, index, value)
+
+    def release(self):
+        self.movement[0] = self.movement[1] = 0.0
+        self.wheel[0] = self.wheel[1] = 0.0
+
+    def summary(self) -> str:
+        return f"pointer messages {self.messages}, failed {self.failed}"
+
+    def _start(self):
+        self._ready = asyncio.Event()
+        self._task = self.loop.create_task(self._run())
+
+    def _set(self, speeds: list, index: int, value: float):
+        # safe to call from any thread, only the first deflection after the stream parks costs a loop wakeup
+        speeds[index] = value if abs(value) >= self.deadzone else 0.0
+        if not self._awake and speeds[index] and self._ready:
+            self._awake = True
+            self.loop.call_soon_threadsafe(self._ready.set)
+
+    def _moving(self) -> bool:
+        return any(self.movement) or any(self.wheel)
+
+    async def _run(self):
+        deadline = time.perf_counter()
+        while True:
+            if not self._moving():
+                self._awake = False
+                self._ready.clear()
+                if not self._moving():
+                    self._move_remainder = [0.0, 0.0]
+                    self._scroll_remainder = [0.0, 0.0]
+                    await self._ready.wait()
+                self._awake = True
+                deadline = time.perf_counter()
+
+            if distance := self._accumulate(self._move_remainder, self.movement, self.speed * self.interval):
+                await self._send(self.move, *distance)
+            if notches := self._accumulate(self._scroll_remainder, self.wheel, self.scroll_speed * self.interval):
+                await self._send(self.scroll, *notches)
+
+            # absolute deadlines like the mouse's movement loop, a slow send delays the next tick rather than queueing more
+            deadline += self.interval
+            if (delay := deadline - time.perf_counter()) > 0:
+                await asyncio.sleep(delay)
+            else:
+                deadline = time.perf_counter()
+
+    async def _send(self, send, x: int, y: int):
+        try:
+            await asyncio.wait_for(send(x, y), self.timeout)
+            self.messages += 1
+        except Exception as e:
+            self.failed += 1
+            if self.failed == 1 or self.failed % 100 == 0:
+                self._log(f"failed to send pointer input ({self.failed} so far): {repr(e)}")
+
+    @staticmethod
+    def _accumulate(remainder: list, speeds: list, scale: float):
+        # sub-pixel movement is carried into the next tick rather than lost
+        x = speeds[0] * scale + remainder[0]
+        y = speeds[1] * scale + remainder[1]
+        whole_x, whole_y = int(x), int(y)
+        remainder[0], remainder[1] = x - whole_x, y - whole_y
+        return (whole_x, whole_y) if whole_x or whole_y else None
+
+
+async def probe_port(host: str, port: int, timeout: float) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+class RecordingWebOsClient:
+    # stands in for WebOsClient (e.g. when replaying traces), connects instantly and keeps the buttons it was sent
+    def __init__(self, host: str, client_key: str = None):
+        self.host = host
+        self.client_key = client_key
+        self.sent = []
+        self.pointer = []
+        self._connected = False
+
+    async def connect(self):
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def get_system_info(self) -> dict:
+        return {"modelName": "recording"}
+
+    async def button(self, name: str):
+        self.sent.append(name)
+
+    async def move(self, dx: int, dy: int, down: int = 0):
+        self.pointer.append(("move", dx, dy))
+
+    async def scroll(self, dx: int, dy: int):
+        self.pointer.append(("scroll", dx, dy))
+
+
+class WebOsConnection:
+    client_class = WebOsClient
+
+    def __init__(self, host: str, client_key: str, log, options: dict = None, on_connected=None, system_info: dict = None, on_system_info=None):
+        options = {**DEFAULT_CONNECTION_OPTIONS, **(options or {})}
+        self.host = host
+        self.client_key = client_key
+        self.connect_timeout = options["connect-timeout"]
+        self.keepalive_interval = options["keepalive-interval"]
+        self.backoff_initial = options["reconnect-backoff"]["initial"]
+        self.backoff_maximum = options["reconnect-backoff"]["maximum"]
+        self.on_connected = on_connected
+        self.on_system_info = on_system_info
+        # a cached copy still within its maximum age, fetched after connecting when there is none
+        self.system_info = system_info
+        self.client = None
+        self.loop = None
+        self.thread = None
+        self.reconnects = 0
+        self._connected = Event()
+        self._retry = None
+        self._task = None
+        self._log = log
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        # the loop is created here rather than in the thread so it can be used as soon as start() returns
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+        self._task = asyncio.run_coroutine_threadsafe(self._maintain(), self.loop)
+
+    def stop(self):
+        if not self.loop:
+            return
+        if self._task:
+            self._task.cancel()
+        if self.client:
+            try:
+                asyncio.run_coroutine_threadsafe(self.client.disconnect(), self.loop).result(timeout=5)
+                self._log("disconnected successfully")
+            except Exception as e:
+                self._log(f"error during disconnect: {repr(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread.is_alive():
+            self.thread.join(timeout=2)
+        self._connected.clear()
+        self.client = None
+        self.loop = None
+        self.thread = None
+
+    def wait_connected(self, timeout: float = None) -> bool:
+        return self._connected.wait(timeout)
+
+    async def wait_connected_async(self, timeout: float = None) -> bool:
+        return await self.loop.run_in_executor(None, self._connected.wait, timeout)
+
+    def reconnect_now(self):
+        # skip the remaining backoff delay, e.g. once the TV is known to be reachable again
+        if self.loop:
+            self.loop.call_soon_threadsafe(lambda: self._retry and self._retry.set())
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _maintain(self):
+        self._retry = asyncio.Event()
+        delay = self.backoff_initial
+        while True:
+            # cleared before connecting rather than before waiting, so a reconnect_now() that arrives while
+            # the attempt is in flight (e.g. the TV answering after wake-on-lan) skips the backoff
+            self._retry.clear()
+            try:
+                await asyncio.wait_for(self._open(), self.connect_timeout)
+                delay = self.backoff_initial
+                await self._keepalive()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._log(f"connection error: {repr(e)}")
+
+            self._connected.clear()
+            await self._close()
+            self._log(f"reconnecting in {delay} seconds")
+            try:
+                await asyncio.wait_for(self._retry.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, self.backoff_maximum)
+            self.reconnects += 1
+
+    async def _open(self):
+        self.client = self.client_class(self.host, client_key=self.client_key)
+        self._log(f"connecting to {self.host}")
+        await self.client.connect()
+        self._log("connected successfully")
+
+        self.client_key = self.client.client_key
+        self._connected.set()
+        if self.system_info is None:
+            # fetched alongside the first commands rather than holding them back for another round trip
+            self.loop.create_task(self._fetch_system_info(self.client))
+        else:
+            self._log(f"connected to TV: {self.system_info.get('modelName', 'unknown')} (cached)")
+        if self.on_connected:
+            self.on_connected(self.client)
+
+    async def _fetch_system_info(self, client):
+        try:
+            system_info = await asyncio.wait_for(client.get_system_info(), self.connect_timeout)
+        except Exception as e:
+            self._log(f"failed to fetch system info: {repr(e)}")
+            return
+        self._log(f"confirmed connection to TV: {system_info.get('modelName', 'unknown')}")
+        self.system_info = system_info
+        if self.on_system_info:
+            self.on_system_info(system_info)
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            if not self.client.is_connected():
+                raise ConnectionError("connection closed by TV")
+            await asyncio.wait_for(self.client.get_system_info(), self.connect_timeout)
+
+    async def _close(self):
+        if client := self.client:
+            self.client = None
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
@@ -0,0 +1,116 @@
+from events import InputEvent, Device, AXIS, BUTTON, HAT
+from time import perf_counter_ns, time_ns, sleep
+import mmap
+import os
+import struct
+
+
+MAGIC = b"MCMTRACE"
+VERSION = 1
+# magic, version, record size, reserved, wall-clock time the file was created (ns)
+HEADER = struct.Struct("<8sHHIq")
+# timestamp (monotonic ns), device instance id, key type, number, value
+RECORD = struct.Struct("<qiBxHd")
+
+KEYTYPES = (AXIS, BUTTON, HAT)
+KEYTYPE_CODES = {keytype: code for code, keytype in enumerate(KEYTYPES)}
+
+
+class TraceError(Exception):
+    pass
+
+
+class TraceRecorder:
+    # appends one fixed-size record per controller event, so a trace can be cut or concatenated at any record
+    def __init__(self, path: str):
+        self.path = path
+        self.recorded = 0
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0, time_ns()))
+        else:
+            with open(path, "rb") as existing:
+                _check_header(existing.read(HEADER.size), path)
+        self._pack = RECORD.pack
+
+    def record(self, key, timestamp: int = None):
+        self._file.write(self._pack(timestamp or perf_counter_ns(), getattr(key.joystick, "identifier", -1), KEYTYPE_CODES[key.keytype], key.number, key.value))
+        self.recorded += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class TraceReplayer:
+    # reads a trace through mmap and feeds it back as InputEvent tuples, either paced like the original or flat out
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as trace_file:
+            if os.fstat(trace_file.fileno()).st_size < HEADER.size:
+                raise TraceError(f"'{path}' is not a trace")
+            self._map = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+        _check_header(self._map[:HEADER.size], path)
+        self.created = HEADER.unpack_from(self._map)[4]
+        # a record cut short by a crash while recording is dropped
+        self.count = (len(self._map) - HEADER.size) // RECORD.size
+
+    def records(self):
+        view = memoryview(self._map)[HEADER.size:HEADER.size + self.count * RECORD.size]
+        try:
+            yield from RECORD.iter_unpack(view)
+        finally:
+            view.release()
+
+    def duration(self) -> float:
+        if not self.count:
+            return 0.0
+        first = RECORD.unpack_from(self._map, HEADER.size)[0]
+        last = RECORD.unpack_from(self._map, HEADER.size + (self.count - 1) * RECORD.size)[0]
+        return (last - first) / 1e9
+
+    def replay(self, deliver, realtime: bool = True, speed: float = 1.0, settle=None) -> int:
+        # settle (fast replays only) is called after new devices and button events so switches finish in the same place every run
+        devices = {}
+        started = previous = None
+        clock = 0
+        delivered = 0
+        for timestamp, device_id, keytype, number, value in self.records():
+            if realtime:
+                # gaps are taken from consecutive records, a recording appended after a reboot just starts where the last ended
+                if previous is None:
+                    started = perf_counter_ns()
+                elif timestamp > previous:
+                    clock += timestamp - previous
+                previous = timestamp
+                if (delay := clock / speed - (perf_counter_ns() - started)) > 0:
+                    sleep(delay / 1e9)
+
+            new_device = device_id not in devices
+            if new_device:
+                devices[device_id] = Device(device_id)
+            keytype = KEYTYPES[keytype]
+            deliver(InputEvent(keytype, number, value if keytype == AXIS else int(value), devices[device_id]))
+            delivered += 1
+            if settle and not realtime and (new_device or keytype == BUTTON):
+                settle()
+        return delivered
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _check_header(data: bytes, path: str):
+    if len(data) < HEADER.size:
+        raise TraceError(f"'{path}' is not a trace")
+    magic, version, record_size, _, _ = HEADER.unpack(data[:HEADER.size])
+    if magic != MAGIC:
+        raise TraceError(f"'{path}' is not a trace")
+    if version != VERSION or record_size != RECORD.size:
+        raise TraceError(f"'{path}' is trace version {version} with {record_size} byte records, expected version {VERSION}")
@@ -0,0 +1,88 @@
+# replays a trace recorded with `core.py --record` through Core and the real modules, nothing is sent to the desktop or TV
+# usage: python replay.py <trace> [--fast] [--speed N] [--module NAME] [--stats]
+from core import Core, CONFIG_FILE
+from modules.module_remote import Remote
+from modules.output import RecorderBackend
+from modules.webos import WebOsConnection, RecordingWebOsClient
+from recording import TraceReplayer, TraceError
+from stats import Stats
+from tempfile import mkdtemp
+from time import perf_counter, sleep
+import argparse
+import atexit
+import shutil
+import sys
+
+
+def use_fake_backends(core: Core):
+    core.output.close()
+    core.output = RecorderBackend()
+    WebOsConnection.client_class = RecordingWebOsClient
+    # the fake TV's key and system info go to a scratch secrets file instead of the configured one
+    directory = mkdtemp(prefix="mapper-replay-")
+    atexit.register(shutil.rmtree, directory, True)
+    Remote.secrets_file = f"{directory}/remote-secrets.json"
+
+
+def settle(core: Core):
+    # wait for pending module switches, and connections they start, so a fast replay dispatches the same events every run
+    core.switcher.submit(lambda: None).result()
+    for session in list(core.sessions.values()):
+        if connection := getattr(session.current_module, "connection", None):
+            connection.wait_connected(1)
+
+
+def replay(core: Core, path: str, realtime: bool = True, speed: float = 1.0):
+    with TraceReplayer(path) as replayer:
+        if not realtime:
+            # axis events are dispatched inline rather than on the coalescer's clock
+            if core.coalescer:
+                core.coalescer.stop()
+            core.coalescer = None
+        started = perf_counter()
+        delivered = replayer.replay(core.callback, realtime, speed, lambda: settle(core))
+        elapsed = perf_counter() - started
+    settle(core)
+    return delivered, elapsed
+
+
+def remote_commands(core: Core) -> list:
+    return [command for spec in core.modules if (connection := getattr(spec.instance, "connection", None)) and connection.client
+            for command in getattr(connection.client, "sent", ())]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("trace", help="trace file written by core.py --record")
+    parser.add_argument("--fast", action="store_true", help="replay as fast as possible instead of in real time")
+    parser.add_argument("--speed", type=float, default=1.0, help="real time playback speed")
+    parser.add_argument("--module", help="module every controller starts in (default: the configured initial module)")
+    parser.add_argument("--config", default=CONFIG_FILE, help="config file to use")
+    parser.add_argument("--stats", action="store_true", help="print latency statistics after replaying")
+    arguments = parser.parse_args()
+
+    stats = Stats() if arguments.stats else None
+    core = Core(stats)
+    core.configure(arguments.config)
+    use_fake_backends(core)
+    core.add_modules_from_list()
+    if arguments.module:
+        if arguments.module not in core.positions:
+            sys.exit(f"error: unknown module '{arguments.module}'")
+        core.initial_spec = core.modules[core.positions[arguments.module]]
+
+    try:
+        delivered, elapsed = replay(core, arguments.trace, not arguments.fast, arguments.speed)
+    except (OSError, TraceError) as e:
+        sys.exit(f"error: {e}")
+    # queued remote commands and the last mouse ticks are still on their own threads
+    sleep(0.2)
+
+    print(f"replayed {delivered} events in {elapsed:.3f}s ({delivered / max(elapsed, 1e-9):,.0f} events/s)")
+    print(f"output: {core.output.written} events in {core.output.batches} batches, remote: {len(remote_commands(core))} commands")
+    if stats:
+        print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
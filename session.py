@@ -0,0 +1,49 @@
+from haptics import HapticWorker
+import sdl2
+
+
+class Session:
+    # per-controller state: chord tracking, haptics and the module this controller is driving
+    def __init__(self, instance_id: int, name: str, joystick=None, haptic=None):
+        self.instance_id = instance_id
+        self.name = name
+        self.joystick = joystick
+        self.haptic = haptic
+        self.haptics = HapticWorker(haptic, name) if haptic else None
+        self.dispatcher = None
+        self.current_spec = None
+        self.current_module = None
+        self.loaded_spec = None
+        self.target_index = 0
+
+    @classmethod
+    def open(cls, device_index: int):
+        # SDL_JOYDEVICEADDED reports a device index, every later event reports the instance id
+        if not (joystick := sdl2.SDL_JoystickOpen(device_index)):
+            return None
+        instance_id = sdl2.SDL_JoystickInstanceID(joystick)
+        name = sdl2.SDL_JoystickName(joystick)
+        session = cls(instance_id, name.decode() if name else f"joystick {instance_id}", joystick)
+
+        if haptic := sdl2.SDL_HapticOpenFromJoystick(joystick):
+            if sdl2.SDL_HapticRumbleInit(haptic) == 0:
+                session.haptic = haptic
+                session.haptics = HapticWorker(haptic, session.name)
+            else:
+                sdl2.SDL_HapticClose(haptic)
+        return session
+
+    def close(self):
+        # the worker stops the rumble and exits before the handle it uses is closed
+        if self.haptics:
+            self.haptics.stop()
+            self.haptics = None
+        if self.haptic:
+            sdl2.SDL_HapticClose(self.haptic)
+            self.haptic = None
+        if self.joystick:
+            sdl2.SDL_JoystickClose(self.joystick)
+            self.joystick = None
+
+    def __repr__(self):
+        return f"Session({self.instance_id}, {self.name!r})"
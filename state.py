@@ -0,0 +1,261 @@
+from collections import namedtuple
+from events import AXIS, BUTTON, HAT
+from threading import Lock
+from time import monotonic, sleep
+import mmap
+import os
+import struct
+
+
+MAGIC = b"MCMSTATE"
+VERSION = 1
+# magic, version, slot count, slot size, buttons, hats and axes per slot
+HEADER = struct.Struct("<8sHHHHHH")
+SEQUENCE = 64
+SLOTS = 128
+
+BUTTONS = 32
+HATS = 4
+AXES = 8
+MODULE_NAME = 32
+
+# offsets within a slot, every field is in native byte order since readers share the machine
+INSTANCE, NAME, BUTTON_STATES, HAT_STATES, AXIS_VALUES, SPEEDS = 0, 8, 40, 72, 80, 144
+SLOT_SIZE = 192
+SLOT_COUNT = 8
+EMPTY = -1
+
+READ_SPINS = 100
+READ_TIMEOUT = 0.5
+
+ControllerState = namedtuple("ControllerState", ("instance_id", "module", "buttons", "hats", "axes", "mouse_speed", "scroll_speed"))
+
+
+class StateError(Exception):
+    pass
+
+
+class _Slot:
+    # typed views straight onto the slot's bytes, so an update is an indexed store with nothing packed or copied
+    __slots__ = ("instance", "name", "buttons", "hats", "axes", "speeds")
+
+    def __init__(self, view: memoryview):
+        self.instance = view[INSTANCE:INSTANCE + 8].cast("q")
+        self.name = view[NAME:NAME + MODULE_NAME]
+        self.buttons = view[BUTTON_STATES:BUTTON_STATES + BUTTONS]
+        self.hats = view[HAT_STATES:HAT_STATES + HATS]
+        self.axes = view[AXIS_VALUES:AXIS_VALUES + AXES * 8].cast("d")
+        self.speeds = view[SPEEDS:SPEEDS + 32].cast("d")
+
+    def clear(self, instance_id: int = EMPTY):
+        self.instance[0] = instance_id
+        self.name[:] = bytes(MODULE_NAME)
+        self.buttons[:] = bytes(BUTTONS)
+        self.hats[:] = bytes(HATS)
+        for index in range(AXES):
+            self.axes[index] = 0.0
+        for index in range(4):
+            self.speeds[index] = 0.0
+
+    def release(self):
+        for view in (self.instance, self.name, self.buttons, self.hats, self.axes, self.speeds):
+            view.release()
+
+
+class StateExport:
+    # publishes each controller's live state into a memory-mapped file that other processes read without asking Core,
+    # writers bump the sequence to odd before changing anything and back to even after (a seqlock)
+    def __init__(self, path: str, slots: int = SLOT_COUNT):
+        self.path = path
+        self.size = SLOTS + slots * SLOT_SIZE
+        descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(descriptor, self.size)
+            self._map = mmap.mmap(descriptor, self.size)
+        finally:
+            os.close(descriptor)
+        self._view = memoryview(self._map)
+        self._sequence = self._view[SEQUENCE:SEQUENCE + 8].cast("Q")
+        self._slots = [_Slot(self._view[SLOTS + index * SLOT_SIZE:SLOTS + (index + 1) * SLOT_SIZE]) for index in range(slots)]
+        self._lock = Lock()
+        self.assigned = {}
+        self.updates = 0
+
+        with self._lock:
+            # an export left behind mid-write by a crashed Core carries on from the next even sequence
+            self._written = self._sequence[0] + (self._sequence[0] & 1)
+            self._begin()
+            try:
+                HEADER.pack_into(self._map, 0, MAGIC, VERSION, slots, SLOT_SIZE, BUTTONS, HATS, AXES)
+                for slot in self._slots:
+                    slot.clear()
+            finally:
+                self._end()
+
+    def attach(self, instance_id: int) -> bool:
+        with self._lock:
+            if instance_id in self.assigned:
+                return True
+            taken = set(self.assigned.values())
+            if (index := next((index for index in range(len(self._slots)) if index not in taken), None)) is None:
+                return False
+            self.assigned[instance_id] = index
+            self._begin()
+            try:
+                self._slots[index].clear(instance_id)
+            finally:
+                self._end()
+            return True
+
+    def detach(self, instance_id: int):
+        with self._lock:
+            if (index := self.assigned.pop(instance_id, None)) is not None:
+                self._begin()
+                try:
+                    self._slots[index].clear()
+                finally:
+                    self._end()
+
+    def set_module(self, instance_id: int, name: str, speeds: bool = False):
+        encoded = name.encode()[:MODULE_NAME].ljust(MODULE_NAME, b"\0")
+        with self._lock:
+            if (index := self.assigned.get(instance_id)) is None:
+                return
+            slot = self._slots[index]
+            self._begin()
+            try:
+                slot.name[:] = encoded
+                if not speeds:
+                    # only modules with speeds of their own (the mouse) publish them
+                    for speed in range(4):
+                        slot.speeds[speed] = 0.0
+            finally:
+                self._end()
+
+    def update(self, key):
+        # called on the input thread for every event, so it only ever stores into the existing views
+        number, keytype, value = key.number, key.keytype, key.value
+        with self._lock:
+            if (index := self.assigned.get(getattr(key.joystick, "identifier", None))) is None:
+                return
+            slot = self._slots[index]
+            self._begin()
+            try:
+                if keytype == AXIS:
+                    if number < AXES:
+                        slot.axes[number] = value
+                elif keytype == BUTTON:
+                    if number < BUTTONS:
+                        slot.buttons[number] = 1 if value else 0
+                elif keytype == HAT and number < HATS:
+                    slot.hats[number] = value
+            finally:
+                self._end()
+            self.updates += 1
+
+    def set_speeds(self, instance_id: int, mouse_speed: list, scroll_speed: list):
+        with self._lock:
+            if (index := self.assigned.get(instance_id)) is None:
+                return
+            speeds = self._slots[index].speeds
+            self._begin()
+            try:
+                speeds[0], speeds[1] = mouse_speed
+                speeds[2], speeds[3] = scroll_speed
+            finally:
+                self._end()
+
+    def close(self):
+        with self._lock:
+            if self._map.closed:
+                return
+            # writers look their slot up under the lock, so nothing touches the views once they are released
+            self.assigned = {}
+            self._begin()
+            try:
+                for slot in self._slots:
+                    slot.clear()
+            finally:
+                self._end()
+            for slot in self._slots:
+                slot.release()
+            self._sequence.release()
+            self._view.release()
+            self._map.close()
+
+    def _begin(self):
+        # only writers (under the lock) change the sequence, so it is never read back from the map
+        self._written += 1
+        self._sequence[0] = self._written
+
+    def _end(self):
+        self._written += 1
+        self._sequence[0] = self._written
+
+
+class StateReader:
+    # the reader side, for tools that want the controller state: no socket or request, just a copy taken between
+    # two reads of the same even sequence number
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as state_file:
+            if os.fstat(state_file.fileno()).st_size < SLOTS:
+                raise StateError(f"'{path}' is not a state export")
+            self._map = mmap.mmap(state_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slots, slot_size, buttons, hats, axes = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise StateError(f"'{path}' is not a state export")
+        if (version, slot_size, buttons, hats, axes) != (VERSION, SLOT_SIZE, BUTTONS, HATS, AXES):
+            raise StateError(f"'{path}' is state export version {version} with {slot_size} byte slots, expected version {VERSION}")
+        self._view = memoryview(self._map)
+        self._sequence = self._view[SEQUENCE:SEQUENCE + 8].cast("Q")
+        self._end = SLOTS + self.slots * SLOT_SIZE
+        self.retries = 0
+
+    @property
+    def version(self) -> int:
+        # changes whenever anything is written, so a poller can skip decoding when nothing happened
+        return self._sequence[0]
+
+    def read(self, timeout: float = READ_TIMEOUT) -> bytes:
+        spins = 0
+        deadline = None
+        while True:
+            before = self._sequence[0]
+            if not before & 1:
+                data = self._map[SLOTS:self._end]
+                if self._sequence[0] == before:
+                    return data
+            self.retries += 1
+            spins += 1
+            if spins % READ_SPINS == 0:
+                # a writer that died mid-update leaves the sequence odd for good
+                if deadline is None:
+                    deadline = monotonic() + timeout
+                elif monotonic() > deadline:
+                    raise StateError(f"'{self.path}' has been mid-update for over {timeout}s, the writer may have stopped")
+                sleep(0)
+
+    def snapshot(self) -> list:
+        data = memoryview(self.read())
+        controllers = []
+        for index in range(self.slots):
+            slot = data[index * SLOT_SIZE:(index + 1) * SLOT_SIZE]
+            if (instance_id := slot[INSTANCE:INSTANCE + 8].cast("q")[0]) == EMPTY:
+                continue
+            speeds = slot[SPEEDS:SPEEDS + 32].cast("d")
+            controllers.append(ControllerState(instance_id, bytes(slot[NAME:NAME + MODULE_NAME]).rstrip(b"\0").decode(),
+                                               tuple(slot[BUTTON_STATES:BUTTON_STATES + BUTTONS]), tuple(slot[HAT_STATES:HAT_STATES + HATS]),
+                                               tuple(slot[AXIS_VALUES:AXIS_VALUES + AXES * 8].cast("d")), (speeds[0], speeds[1]), (speeds[2], speeds[3])))
+        return controllers
+
+    def close(self):
+        self._sequence.release()
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,173 @@
+from threading import Thread, local
+from time import perf_counter_ns, monotonic
+import json
+import os
+import socket
+
+
+PRECISION_BITS = 7
+HALF_BUCKETS = 1 << (PRECISION_BITS - 1)
+
+
+class Histogram:
+    # log-linear buckets in the style of HdrHistogram: ~1% precision from nanoseconds to minutes in a few KB
+    def __init__(self):
+        self.counts = [0] * (HALF_BUCKETS * 40)
+        self.count = 0
+        self.total = 0
+        self.peak = 0
+
+    def record(self, value: int):
+        shift = value.bit_length() - PRECISION_BITS
+        index = value if shift <= 0 else shift * HALF_BUCKETS + (value >> shift)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.peak:
+            self.peak = value
+
+    def percentile(self, percentile: float) -> int:
+        if not self.count:
+            return 0
+        target = max(1, round(self.count * percentile / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(_highest_equivalent(index), self.peak)
+        return self.peak
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count / 1000 if self.count else 0.0,
+            "p50": self.percentile(50) / 1000,
+            "p99": self.percentile(99) / 1000,
+            "max": self.peak / 1000
+        }
+
+
+def _highest_equivalent(index: int) -> int:
+    if index < 2 * HALF_BUCKETS:
+        return index
+    shift = index // HALF_BUCKETS - 1
+    return ((index - shift * HALF_BUCKETS + 1) << shift) - 1
+
+
+class Stats:
+    def __init__(self):
+        self.started = monotonic()
+        self.histograms = {}
+        self.counters = {}
+        self.sources = []
+        self._last = (self.started, {})
+        self._local = local()
+
+    def record(self, name: str, elapsed: int):
+        if not (histogram := self.histograms.get(name)):
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(elapsed)
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_source(self, source):
+        # callables returning extra counters (e.g. drops tracked by the coalescer) when a snapshot is taken
+        self.sources.append(source)
+
+    def begin_event(self) -> int:
+        started = self._local.event = perf_counter_ns()
+        return started
+
+    def end_event(self, started: int):
+        self._local.event = None
+        self.record("core.callback", perf_counter_ns() - started)
+        self.count("events")
+
+    def timed(self, name: str, function):
+        def wrapper(*args):
+            started = perf_counter_ns()
+            try:
+                return function(*args)
+            finally:
+                self.record(name, perf_counter_ns() - started)
+        return wrapper
+
+    def output(self, name: str, function, *args):
+        # times the output call itself and, on the input thread, how long after the SDL callback it started
+        started = perf_counter_ns()
+        try:
+            return function(*args)
+        finally:
+            finished = perf_counter_ns()
+            self.record(f"{name}.output", finished - started)
+            if event := getattr(self._local, "event", None):
+                self.record(f"{name}.end-to-end", finished - event)
+
+    def snapshot(self) -> dict:
+        now = monotonic()
+        counters = dict(self.counters)
+        for source in self.sources:
+            counters.update(source())
+
+        # rates are per second since the previous snapshot
+        last_time, last_counters = self._last
+        elapsed = max(now - last_time, 1e-9)
+        rates = {name: (value - last_counters.get(name, 0)) / elapsed for name, value in counters.items()}
+        self._last = (now, counters)
+        return {
+            "uptime": now - self.started,
+            "counters": counters,
+            "rates": rates,
+            "latency-us": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+        }
+
+    def report(self) -> str:
+        snapshot = self.snapshot()
+        lines = [f"stats: uptime {snapshot['uptime']:.1f}s"]
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"  {name:<28} {value:>10} ({snapshot['rates'][name]:.1f}/s)")
+        for name, summary in snapshot["latency-us"].items():
+            lines.append(f"  {name:<28} n={summary['count']} p50={summary['p50']:.1f}us p99={summary['p99']:.1f}us max={summary['max']:.1f}us")
+        return "\n".join(lines)
+
+
+class StatsServer:
+    # answers every connection on a unix socket with a JSON snapshot, e.g. `socat - UNIX-CONNECT:<path>`
+    def __init__(self, stats: Stats, path: str, log=print):
+        self.stats = stats
+        self.path = path
+        self.thread = None
+        self._socket = None
+        self._log = log
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.path)
+        self._socket.listen()
+        self.thread = Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        self._log(f"stats: serving on {self.path}")
+
+    def stop(self):
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _serve(self):
+        while self._socket:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return
+            with connection:
+                try:
+                    connection.sendall(json.dumps(self.stats.snapshot(), indent=4).encode() + b"\n")
+                except OSError as e:
+                    self._log(f"stats: failed to send snapshot: {repr(e)}")